@@ -6,26 +6,38 @@ Restaurant Inventory Management System - Advanced Version
 
 import streamlit as st
 import pandas as pd
-from pathlib import Path
-from datetime import datetime, date
-
-# تحديد مسار ملفات البيانات
-BASE_DIR = Path(__file__).parent
-INVENTORY_FILE = BASE_DIR / "inventory.csv"
-RECIPES_FILE = BASE_DIR / "recipes.csv"
-INVENTORY_LOG_FILE = BASE_DIR / "inventory_log.csv"
-SALES_LOG_FILE = BASE_DIR / "sales_log.csv"
-
-# إعدادات الصفحة
-st.set_page_config(
-    page_title="الوحش برجر - نظام إدارة المخزون",
-    page_icon="🍔",
-    layout="wide",
-    initial_sidebar_state="expanded"
+from datetime import date, timedelta
+import functools
+
+import profiler
+from storage import (
+    load_inventory, load_recipes, save_recipes, add_ingredients,
+    load_sales_rollup, load_inventory_log_rollup, commit_sale, commit_receipt,
+    load_consumption_rollup, load_stock_counts, commit_stock_count,
+    load_stock_thresholds, save_stock_thresholds,
+    list_branches, branch_dir, use_branch, flush_branches, get_storage, DEFAULT_BRANCH,
+)
+from engine import (
+    build_sales_log_rows, build_inventory_log_rows,
+    get_dish_names, load_recipe_matrix, calculate_cart_ingredients, check_stock_availability,
+    load_dish_capacity, resolve_feasible_cart, load_demand_profile, calculate_reorder_plan,
+    FORECAST_WEEKS, COVER_HORIZON_DAYS,
+    rebuild_consumption_log, prepare_stock_count, calculate_stock_variance,
+    load_recipe_versions, recipe_versions_table,
+    load_stock_levels, STOCK_OUT, STOCK_CRITICAL, STOCK_LOW, STOCK_OK,
+    summarize_receipts_by_ingredient, summarize_sales_by_dish, summarize_sales_by_day,
+    load_log_range_with_index, date_range_positions, filter_rollup_by_date, newest_first_page, matching_rows,
+    consolidated_report,
 )
+from import_receipts import (
+    DEFAULT_COLUMNS as RECEIPT_COLUMNS, DEFAULT_NOTES as RECEIPT_NOTES, import_receipts, receipt_file_columns,
+)
+
+
+# ========== إعدادات الصفحة ==========
 
 # تنسيق CSS مخصص للواجهة العربية
-st.markdown("""
+PAGE_CSS = """
 <style>
     @import url('https://fonts.googleapis.com/css2?family=Cairo:wght@400;600;700&display=swap');
     
@@ -141,180 +153,141 @@ st.markdown("""
         color: white;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
 
 
-# ========== دوال تحميل وحفظ البيانات ==========
+def apply_page_style():
+    """إعدادات الصفحة وتنسيق CSS (تُستدعى من main وليس عند الاستيراد)"""
+    st.set_page_config(
+        page_title="الوحش برجر - نظام إدارة المخزون",
+        page_icon="🍔",
+        layout="wide",
+        initial_sidebar_state="expanded"
+    )
+    st.markdown(PAGE_CSS, unsafe_allow_html=True)
 
-def load_inventory():
-    """تحميل بيانات المخزون"""
-    if INVENTORY_FILE.exists():
-        return pd.read_csv(INVENTORY_FILE, encoding='utf-8-sig')
-    else:
-        df = pd.DataFrame({
-            'Ingredient': ['طماطم', 'بصل', 'ثوم'],
-            'Current_Stock': [50, 30, 10],
-            'Unit': ['كيلو', 'كيلو', 'كيلو']
-        })
-        df.to_csv(INVENTORY_FILE, index=False, encoding='utf-8-sig')
-        return df
 
+# ========== دوال المساعدة ==========
 
-def load_recipes():
-    """تحميل بيانات الوصفات"""
-    if RECIPES_FILE.exists():
-        return pd.read_csv(RECIPES_FILE, encoding='utf-8-sig')
-    else:
-        df = pd.DataFrame({
-            'Dish_Name': ['شاورما دجاج', 'شاورما دجاج'],
-            'Ingredient': ['دجاج', 'طماطم'],
-            'Quantity_Needed': [0.3, 0.1]
-        })
-        df.to_csv(RECIPES_FILE, index=False, encoding='utf-8-sig')
-        return df
+# تنسيق صفوف جدول المخزون لكل درجة
+STOCK_LEVEL_STYLES = {
+    STOCK_OUT: 'background-color: #ff9999; color: #990000; font-weight: bold',
+    STOCK_CRITICAL: 'background-color: #ffcccc; color: #cc0000; font-weight: bold',
+    STOCK_LOW: 'background-color: #fff3cd; color: #8a6d00',
+    STOCK_OK: '',
+}
 
+# تنبيهات المخزون: (الدرجة، نوع الرسالة، العنوان)، وأقصى عدد مكونات يُذكر في كل رسالة
+STOCK_ALERTS = [
+    (STOCK_OUT, 'error', "⛔ نفد من المخزون"),
+    (STOCK_CRITICAL, 'error', "🔴 مخزون حرج"),
+    (STOCK_LOW, 'warning', "🟠 مخزون منخفض"),
+]
+ALERT_LIMIT = 10
 
-def load_inventory_log():
-    """تحميل سجل الوارد"""
-    if INVENTORY_LOG_FILE.exists():
-        return pd.read_csv(INVENTORY_LOG_FILE, encoding='utf-8-sig')
-    else:
-        df = pd.DataFrame(columns=['Date', 'Ingredient', 'Quantity_Added', 'Unit', 'Notes'])
-        df.to_csv(INVENTORY_LOG_FILE, index=False, encoding='utf-8-sig')
-        return df
 
+def stock_level_styles(levels_df, columns):
+    """أنماط خلايا جدول المخزون كله دفعة واحدة حسب درجة كل مكون"""
+    row_styles = levels_df['Severity'].map(STOCK_LEVEL_STYLES).to_numpy()
+    return pd.DataFrame({column: row_styles for column in columns})
 
-def save_inventory(df):
-    """حفظ بيانات المخزون"""
-    df.to_csv(INVENTORY_FILE, index=False, encoding='utf-8-sig')
 
+def render_stock_alerts(levels_df):
+    """تنبيه واحد لكل درجة بأخطر المكونات فيها (بحد أقصى ALERT_LIMIT)"""
+    for severity, kind, title in STOCK_ALERTS:
+        band = levels_df[levels_df['Severity'] == severity]
+        if band.empty:
+            continue
+        band = band.nsmallest(ALERT_LIMIT, 'Ratio')
+        items = '، '.join(
+            f"**{name}** ({stock:.2f} {unit})"
+            for name, stock, unit in zip(band['Ingredient'], band['Current_Stock'], band['Unit'])
+        )
+        count = int((levels_df['Severity'] == severity).sum())
+        more = f" و{count - ALERT_LIMIT} أخرى" if count > ALERT_LIMIT else ""
+        getattr(st, kind)(f"{title} ({count}): {items}{more}")
 
-def save_recipes(df):
-    """حفظ بيانات الوصفات"""
-    df.to_csv(RECIPES_FILE, index=False, encoding='utf-8-sig')
 
+def branch_fragment(render):
+    """جزء من الصفحة يُعاد رسمه وحده (st.fragment) في فرع الجلسة
 
-def save_inventory_log(df):
-    """حفظ سجل الوارد"""
-    df.to_csv(INVENTORY_LOG_FILE, index=False, encoding='utf-8-sig')
+    إعادة رسم الجزء وحده لا تمر بـ main، فيُختار فيها الفرع من الجلسة مرة أخرى
+    حتى لا تُسجل العمليات في الفرع الافتراضي.
+    """
+    @functools.wraps(render)
+    def render_in_branch(*args, **kwargs):
+        with use_branch(st.session_state.get('branch', DEFAULT_BRANCH)):
+            return render(*args, **kwargs)
+    return st.fragment(render_in_branch)
 
 
-def load_sales_log():
-    """تحميل سجل المبيعات"""
-    if SALES_LOG_FILE.exists():
-        return pd.read_csv(SALES_LOG_FILE, encoding='utf-8-sig')
-    else:
-        df = pd.DataFrame(columns=['Date', 'Time', 'Dish_Name', 'Quantity', 'Notes'])
-        df.to_csv(SALES_LOG_FILE, index=False, encoding='utf-8-sig')
-        return df
-
-
-def save_sales_log(df):
-    """حفظ سجل المبيعات"""
-    df.to_csv(SALES_LOG_FILE, index=False, encoding='utf-8-sig')
-
-
-def add_to_sales_log(sales_cart, notes=""):
-    """إضافة مبيعات للسجل"""
-    log_df = load_sales_log()
-    today = datetime.now().strftime('%Y-%m-%d')
-    now_time = datetime.now().strftime('%H:%M:%S')
-    
-    new_rows = []
-    for item in sales_cart:
-        new_rows.append({
-            'Date': today,
-            'Time': now_time,
-            'Dish_Name': item['dish'],
-            'Quantity': item['quantity'],
-            'Notes': notes
-        })
-    
-    new_df = pd.DataFrame(new_rows)
-    log_df = pd.concat([log_df, new_df], ignore_index=True)
-    save_sales_log(log_df)
-    return log_df
+# ========== عرض السجلات على صفحات ==========
 
+LOG_PAGE_SIZES = [50, 100, 250, 500]
 
-# ========== دوال المساعدة ==========
-
-def get_dish_names(recipes_df):
-    """الحصول على قائمة أسماء الأطباق"""
-    return recipes_df['Dish_Name'].unique().tolist()
+DATE_RANGE_OPTIONS = ["الكل", "آخر عدد من الأيام", "هذا الشهر", "من تاريخ إلى تاريخ"]
 
 
-def calculate_ingredients_needed(recipes_df, dish_name, quantity_sold):
-    """حساب المكونات المطلوبة لطبق معين"""
-    dish_recipe = recipes_df[recipes_df['Dish_Name'] == dish_name]
-    ingredients_needed = {}
-    
-    for _, row in dish_recipe.iterrows():
-        ingredient = row['Ingredient']
-        qty_per_dish = row['Quantity_Needed']
-        total_needed = qty_per_dish * quantity_sold
-        ingredients_needed[ingredient] = total_needed
-    
-    return ingredients_needed
+def select_date_range(key):
+    """اختيار فترة زمنية وإرجاع (من، إلى) أو (None, None) لكل السجل"""
+    mode = st.selectbox("الفترة", DATE_RANGE_OPTIONS, key=f"{key}_range_mode")
+    today = date.today()
+    
+    if mode == "آخر عدد من الأيام":
+        days = st.number_input("عدد الأيام", min_value=1, value=7, step=1, key=f"{key}_range_days")
+        return today - timedelta(days=int(days) - 1), today
+    
+    if mode == "هذا الشهر":
+        month_start = today.replace(day=1)
+        next_month = (month_start + timedelta(days=32)).replace(day=1)
+        return month_start, next_month - timedelta(days=1)
+    
+    if mode == "من تاريخ إلى تاريخ":
+        selected = st.date_input(
+            "من - إلى", value=(today - timedelta(days=6), today), key=f"{key}_range_dates"
+        )
+        if len(selected) == 2:
+            return selected[0], selected[1]
+        if not selected:
+            return None, None
+        # أثناء اختيار النطاق في التقويم يكون هناك تاريخ واحد فقط
+        return selected[0], selected[0]
+    
+    return None, None
 
 
-def check_stock_availability(inventory_df, ingredients_needed):
-    """التحقق من توفر المخزون"""
-    warnings = []
+def render_log_table(log_df, positions, display_columns, key):
+    """عرض صفحة واحدة من السجل بدلاً من إرسال كل الصفوف للمتصفح"""
+    total_rows = len(positions)
     
-    for ingredient, needed in ingredients_needed.items():
-        stock_row = inventory_df[inventory_df['Ingredient'] == ingredient]
-        
-        if stock_row.empty:
-            warnings.append(f"⚠️ المكون '{ingredient}' غير موجود في المخزون!")
-        else:
-            current_stock = stock_row['Current_Stock'].values[0]
-            unit = stock_row['Unit'].values[0]
-            
-            if current_stock < needed:
-                warnings.append(
-                    f"⚠️ المخزون غير كافٍ: '{ingredient}' - "
-                    f"المتوفر: {current_stock:.2f} {unit} | "
-                    f"المطلوب: {needed:.2f} {unit}"
-                )
+    col_size, col_page, col_info = st.columns([1, 1, 2])
     
-    return warnings
-
-
-def update_stock(inventory_df, ingredients_needed):
-    """تحديث المخزون بعد البيع"""
-    updated_df = inventory_df.copy()
+    with col_size:
+        page_size = st.selectbox("عدد الصفوف في الصفحة", LOG_PAGE_SIZES, index=1, key=f"{key}_page_size")
     
-    for ingredient, needed in ingredients_needed.items():
-        mask = updated_df['Ingredient'] == ingredient
-        if mask.any():
-            updated_df.loc[mask, 'Current_Stock'] -= needed
+    page_count = max(1, -(-total_rows // page_size))
+    page_key = f"{key}_page"
+    if st.session_state.get(page_key, 1) > page_count:
+        st.session_state[page_key] = page_count
+    st.session_state.setdefault(page_key, 1)
     
-    return updated_df
-
-
-def highlight_low_stock(row, threshold):
-    """تمييز المخزون المنخفض"""
-    if row['المخزون الحالي'] < threshold:
-        return ['background-color: #ffcccc; color: #cc0000; font-weight: bold'] * len(row)
-    return [''] * len(row)
-
-
-def add_to_inventory_log(log_df, items_list, notes=""):
-    """إضافة سجلات للوارد"""
-    today = datetime.now().strftime('%Y-%m-%d')
-    new_rows = []
+    with col_page:
+        page = st.number_input(f"الصفحة (من {page_count})", min_value=1, max_value=page_count, step=1, key=page_key)
     
-    for item in items_list:
-        new_rows.append({
-            'Date': today,
-            'Ingredient': item['ingredient'],
-            'Quantity_Added': item['quantity'],
-            'Unit': item['unit'],
-            'Notes': notes
-        })
+    page_df = newest_first_page(log_df, positions, page, page_size).copy()
+    page_df.columns = display_columns
     
-    new_df = pd.DataFrame(new_rows)
-    return pd.concat([log_df, new_df], ignore_index=True)
+    with col_info:
+        first_row = (page - 1) * page_size + 1 if total_rows else 0
+        st.markdown("<br>", unsafe_allow_html=True)
+        st.caption(f"عرض {first_row} - {first_row + len(page_df) - 1 if total_rows else 0} من {total_rows} (الأحدث أولاً)")
+    
+    st.dataframe(
+        page_df,
+        use_container_width=True,
+        hide_index=True,
+        height=400
+    )
 
 
 # ========== صفحة المبيعات ولوحة المعلومات ==========
@@ -322,7 +295,6 @@ def add_to_inventory_log(log_df, items_list, notes=""):
 def render_sales_dashboard():
     """عرض صفحة المبيعات"""
     
-    inventory_df = load_inventory()
     recipes_df = load_recipes()
     
     # قسم إدخال المبيعات اليومية
@@ -334,101 +306,198 @@ def render_sales_dashboard():
         st.warning("⚠️ لا توجد وصفات! أضف وصفات من تبويب 'إدارة الوصفات'")
     else:
         st.info("💡 أضف الأطباق المباعة واحداً تلو الآخر، ثم راجع القائمة قبل التأكيد")
+        render_sales_cart(dish_names)
+        render_dish_capacity()
+
+
+def render_dish_capacity():
+    """عرض عدد الحصص المتاحة من كل طبق والمكون الذي يحدّه"""
+    
+    st.markdown('<div class="section-header">🍽️ الحصص المتاحة من المخزون الحالي</div>', unsafe_allow_html=True)
+    
+    capacity_df = load_dish_capacity().sort_values('Portions', na_position='last')
+    display_df = capacity_df.rename(columns={
+        'Dish_Name': 'الطبق',
+        'Portions': 'الحصص المتاحة',
+        'Bottleneck': 'المكون الأقل',
+        'Bottleneck_Stock': 'المتوفر منه'
+    })
+    
+    out_of_stock = int((capacity_df['Portions'] == 0).sum())
+    if out_of_stock:
+        st.warning(f"⚠️ {out_of_stock} طبق لا يمكن تحضيره بالمخزون الحالي")
+    
+    st.dataframe(display_df, use_container_width=True, hide_index=True)
+
+
+def update_sales_cart(change):
+    """تعديل السلة وإخفاء الكمية المتاحة المحسوبة للسلة السابقة"""
+    change()
+    st.session_state.sales_feasible = False
+
+
+@branch_fragment
+def render_sales_cart(dish_names):
+    """عرض سلة المبيعات (تُعاد رسمها وحدها عند التفاعل معها)"""
+    
+    # تهيئة سلة المبيعات في الجلسة
+    if 'sales_cart' not in st.session_state:
+        st.session_state.sales_cart = []
+    
+    col_dish, col_qty, col_add = st.columns([3, 1, 1])
+    
+    with col_dish:
+        selected_dish = st.selectbox(
+            "🍴 اختر الطبق",
+            options=dish_names,
+            key="dish_selector"
+        )
+        capacity = load_dish_capacity().set_index('Dish_Name').loc[selected_dish]
+        if pd.notna(capacity['Portions']):
+            st.caption(
+                f"المتاح: {int(capacity['Portions'])} حصة "
+                f"(يحدّه {capacity['Bottleneck']})"
+            )
+    
+    with col_qty:
+        quantity_sold = st.number_input(
+            "📦 الكمية",
+            min_value=1,
+            max_value=1000,
+            value=1,
+            step=1,
+            key="quantity_input"
+        )
+    
+    with col_add:
+        st.markdown("<br>", unsafe_allow_html=True)
+        if st.button("➕ أضف", key="add_to_cart"):
+            update_sales_cart(lambda: st.session_state.sales_cart.append({
+                'dish': selected_dish,
+                'quantity': quantity_sold
+            }))
+    
+    # عرض سلة المبيعات
+    if st.session_state.sales_cart:
+        st.markdown("---")
+        st.markdown("### 🛒 قائمة المبيعات للمراجعة")
         
-        # تهيئة سلة المبيعات في الجلسة
-        if 'sales_cart' not in st.session_state:
-            st.session_state.sales_cart = []
+        # تحويل القائمة لجدول
+        cart_df = pd.DataFrame(st.session_state.sales_cart)
+        cart_df.columns = ['الطبق', 'الكمية']
+        
+        st.dataframe(cart_df, use_container_width=True, hide_index=True)
         
-        col_dish, col_qty, col_add = st.columns([3, 1, 1])
+        st.markdown(f"**إجمالي الأطباق:** {len(st.session_state.sales_cart)}")
         
-        with col_dish:
-            selected_dish = st.selectbox(
-                "🍴 اختر الطبق",
-                options=dish_names,
-                key="dish_selector"
+        col_confirm, col_clear, col_remove = st.columns(3)
+        
+        with col_confirm:
+            if st.button("✅ تأكيد المبيعات", use_container_width=True, type="primary"):
+                # حساب جميع المكونات المطلوبة
+                all_ingredients_needed = calculate_cart_ingredients(
+                    load_recipe_matrix(),
+                    [item['dish'] for item in st.session_state.sales_cart],
+                    [item['quantity'] for item in st.session_state.sales_cart]
+                )
+                
+                # التحقق من توفر المخزون ثم تحديثه وتسجيل المبيعات كعملية واحدة
+                # (التحقق يتم داخل القفل حتى لا يتداخل مع جهاز كاشير آخر)
+                warnings = commit_sale(
+                    all_ingredients_needed,
+                    build_sales_log_rows(st.session_state.sales_cart),
+                    validate=lambda current_inventory: check_stock_availability(
+                        current_inventory, all_ingredients_needed
+                    )
+                )
+                
+                if warnings:
+                    st.error("❌ لا يمكن إتمام العملية!")
+                    for warning in warnings:
+                        st.warning(warning)
+                    st.session_state.sales_feasible = True
+                else:
+                    items_count = len(st.session_state.sales_cart)
+                    st.session_state.sales_cart = []
+                    st.session_state.sales_feasible = False
+                    
+                    st.success(f"✅ تم تسجيل {items_count} مبيعات وتحديث المخزون!")
+                    st.rerun()
+        
+        # التعديل يتم قبل إعادة رسم السلة فلا حاجة لإعادة تشغيل إضافية
+        with col_clear:
+            st.button(
+                "🗑️ إلغاء الكل", use_container_width=True, key="sales_clear_all",
+                on_click=update_sales_cart, args=(st.session_state.sales_cart.clear,)
             )
         
-        with col_qty:
-            quantity_sold = st.number_input(
-                "📦 الكمية",
-                min_value=1,
-                max_value=1000,
-                value=1,
-                step=1,
-                key="quantity_input"
+        with col_remove:
+            st.button(
+                "↩️ حذف آخر طبق", use_container_width=True, key="sales_remove_last",
+                on_click=update_sales_cart, args=(st.session_state.sales_cart.pop,)
             )
         
-        with col_add:
-            st.markdown("<br>", unsafe_allow_html=True)
-            if st.button("➕ أضف", key="add_to_cart"):
-                st.session_state.sales_cart.append({
-                    'dish': selected_dish,
-                    'quantity': quantity_sold
-                })
-                st.rerun()
+        if st.session_state.get('sales_feasible') and st.session_state.sales_cart:
+            render_feasible_cart()
+
+
+def render_feasible_cart():
+    """عرض الجزء الذي يمكن تنفيذه من السلة عند نقص المخزون وتأكيده"""
+    
+    cart = st.session_state.sales_cart
+    dishes = [item['dish'] for item in cart]
+    recipe_matrix = load_recipe_matrix()
+    feasible = resolve_feasible_cart(
+        recipe_matrix, load_inventory(), dishes, [item['quantity'] for item in cart]
+    )
+    
+    st.markdown("### ✂️ الكمية المتاحة من القائمة")
+    st.dataframe(
+        pd.DataFrame({
+            'الطبق': dishes,
+            'المطلوب': [item['quantity'] for item in cart],
+            'المتاح': feasible.astype(int)
+        }),
+        use_container_width=True,
+        hide_index=True
+    )
+    
+    if feasible.sum() <= 0:
+        st.warning("⚠️ لا يمكن تنفيذ أي طبق من القائمة بالمخزون الحالي")
+        return
+    
+    if st.button("✅ تأكيد المتاح فقط", use_container_width=True, key="sales_confirm_feasible"):
+        available_cart = [
+            {'dish': item['dish'], 'quantity': int(quantity)}
+            for item, quantity in zip(cart, feasible) if quantity > 0
+        ]
+        ingredients_needed = calculate_cart_ingredients(
+            recipe_matrix,
+            [item['dish'] for item in available_cart],
+            [item['quantity'] for item in available_cart]
+        )
+        warnings = commit_sale(
+            ingredients_needed,
+            build_sales_log_rows(available_cart),
+            validate=lambda current_inventory: check_stock_availability(
+                current_inventory, ingredients_needed
+            )
+        )
         
-        # عرض سلة المبيعات
-        if st.session_state.sales_cart:
-            st.markdown("---")
-            st.markdown("### 🛒 قائمة المبيعات للمراجعة")
-            
-            # تحويل القائمة لجدول
-            cart_df = pd.DataFrame(st.session_state.sales_cart)
-            cart_df.columns = ['الطبق', 'الكمية']
-            
-            st.dataframe(cart_df, use_container_width=True, hide_index=True)
-            
-            st.markdown(f"**إجمالي الأطباق:** {len(st.session_state.sales_cart)}")
-            
-            col_confirm, col_clear, col_remove = st.columns(3)
-            
-            with col_confirm:
-                if st.button("✅ تأكيد المبيعات", use_container_width=True, type="primary"):
-                    # حساب جميع المكونات المطلوبة
-                    all_ingredients_needed = {}
-                    
-                    for item in st.session_state.sales_cart:
-                        dish_ingredients = calculate_ingredients_needed(
-                            recipes_df, 
-                            item['dish'], 
-                            item['quantity']
-                        )
-                        for ing, qty in dish_ingredients.items():
-                            if ing in all_ingredients_needed:
-                                all_ingredients_needed[ing] += qty
-                            else:
-                                all_ingredients_needed[ing] = qty
-                    
-                    # التحقق من توفر المخزون
-                    warnings = check_stock_availability(inventory_df, all_ingredients_needed)
-                    
-                    if warnings:
-                        st.error("❌ لا يمكن إتمام العملية!")
-                        for warning in warnings:
-                            st.warning(warning)
-                    else:
-                        # تحديث المخزون
-                        updated_inventory = update_stock(inventory_df, all_ingredients_needed)
-                        save_inventory(updated_inventory)
-                        
-                        # تسجيل المبيعات
-                        add_to_sales_log(st.session_state.sales_cart)
-                        
-                        items_count = len(st.session_state.sales_cart)
-                        st.session_state.sales_cart = []
-                        
-                        st.success(f"✅ تم تسجيل {items_count} مبيعات وتحديث المخزون!")
-                        st.rerun()
-            
-            with col_clear:
-                if st.button("🗑️ إلغاء الكل", use_container_width=True, key="sales_clear_all"):
-                    st.session_state.sales_cart = []
-                    st.rerun()
+        if warnings:
+            # تغير المخزون من جهاز آخر: يُعاد حساب المتاح في الرسم التالي
+            for warning in warnings:
+                st.warning(warning)
+        else:
+            # ما لم يتوفر يبقى في القائمة
+            st.session_state.sales_cart = [
+                {'dish': item['dish'], 'quantity': item['quantity'] - int(quantity)}
+                for item, quantity in zip(cart, feasible) if item['quantity'] > quantity
+            ]
+            st.session_state.sales_feasible = False
             
-            with col_remove:
-                if st.button("↩️ حذف آخر طبق", use_container_width=True, key="sales_remove_last"):
-                    st.session_state.sales_cart.pop()
-                    st.rerun()
+            st.success(f"✅ تم تسجيل {len(available_cart)} مبيعات وتحديث المخزون!")
+            st.rerun()
 
 
 # ========== صفحة إدارة الوصفات ==========
@@ -455,6 +524,12 @@ def render_recipes_management():
                 display_df.columns = ['المكون', 'الكمية المطلوبة']
                 st.dataframe(display_df, use_container_width=True, hide_index=True)
                 
+                # تقارير الاستهلاك السابقة تستخدم النسخة التي كانت سارية وقت البيع
+                with st.expander("🕓 نسخ الوصفة السابقة"):
+                    versions_df = recipe_versions_table(load_recipe_versions(), selected_dish)
+                    versions_df.columns = ['من', 'إلى', 'المكونات']
+                    st.dataframe(versions_df, use_container_width=True, hide_index=True)
+                
                 col_edit, col_delete = st.columns(2)
                 
                 with col_delete:
@@ -642,7 +717,6 @@ def render_inventory_management():
     """عرض صفحة إدارة المخزون"""
     
     inventory_df = load_inventory()
-    log_df = load_inventory_log()
     
     # الشريط الجانبي للإعدادات
     with st.sidebar:
@@ -654,14 +728,29 @@ def render_inventory_management():
             value=5,
             help="سيتم تمييز المكونات التي يقل مخزونها عن هذا الحد"
         )
+        lead_days = st.number_input(
+            "مدة التوريد (أيام)",
+            min_value=0,
+            max_value=30,
+            value=2,
+            help="عدد الأيام بين طلب المكون ووصوله"
+        )
+        cover_days = st.number_input(
+            "مدة تغطية الطلب (أيام)",
+            min_value=1,
+            max_value=60,
+            value=7,
+            help="عدد الأيام التي يجب أن تكفيها كل كمية يتم طلبها"
+        )
     
     # قسم حالة المخزون
     st.markdown('<div class="section-header">📊 حالة المخزون الحالية</div>', unsafe_allow_html=True)
     
     col_stats1, col_stats2, col_stats3 = st.columns(3)
     
-    total_items = len(inventory_df)
-    low_stock_items = len(inventory_df[inventory_df['Current_Stock'] < low_stock_threshold])
+    levels_df = load_stock_levels(low_stock_threshold)
+    total_items = len(levels_df)
+    low_stock_items = int((levels_df['Severity'] != STOCK_OK).sum())
     
     with col_stats1:
         st.metric("إجمالي المكونات", total_items)
@@ -670,13 +759,14 @@ def render_inventory_management():
     with col_stats3:
         st.metric("مخزون كافٍ", total_items - low_stock_items)
     
-    # عرض جدول المخزون
-    styled_inventory = inventory_df.copy()
+    # عرض جدول المخزون: الصفوف وأنماطها من نفس جدول الدرجات حتى لا تختلف صفوفهما
+    styled_inventory = levels_df[['Ingredient', 'Current_Stock', 'Unit']].reset_index(drop=True)
     styled_inventory.columns = ['المكون', 'المخزون الحالي', 'الوحدة']
     
+    styles = stock_level_styles(levels_df, styled_inventory.columns)
     styled_df = styled_inventory.style.apply(
-        lambda row: highlight_low_stock(row, low_stock_threshold),
-        axis=1
+        lambda table: styles.set_axis(table.index),
+        axis=None
     )
     
     st.dataframe(
@@ -686,15 +776,39 @@ def render_inventory_management():
         height=300
     )
     
-    # تنبيهات المخزون المنخفض
-    low_stock_df = inventory_df[inventory_df['Current_Stock'] < low_stock_threshold]
+    with st.expander("🎚️ حدود التنبيه لكل مكون"):
+        st.caption("💡 اترك الحد فارغاً لاستخدام الحد العام من الشريط الجانبي")
+        thresholds_df = load_stock_thresholds()
+        limits_df = pd.DataFrame({
+            'المكون': inventory_df['Ingredient'],
+            'الحد الأدنى': inventory_df['Ingredient'].map(
+                thresholds_df.drop_duplicates('Ingredient', keep='last').set_index('Ingredient')['Min_Stock']
+            ).astype(float)
+        })
+        edited_limits = st.data_editor(
+            limits_df,
+            disabled=['المكون'],
+            use_container_width=True,
+            hide_index=True,
+            key="stock_thresholds_editor"
+        )
+        if st.button("💾 حفظ الحدود", key="save_stock_thresholds"):
+            edited_limits = edited_limits.dropna(subset=['الحد الأدنى'])
+            save_stock_thresholds(pd.DataFrame({
+                'Ingredient': edited_limits['المكون'],
+                'Min_Stock': edited_limits['الحد الأدنى']
+            }))
+            st.success(f"✅ تم حفظ حدود {len(edited_limits)} مكون")
+            st.rerun()
     
-    if not low_stock_df.empty:
+    # تنبيهات المخزون المنخفض (مجمعة حسب الدرجة)
+    if low_stock_items:
         st.markdown("### ⚠️ تنبيهات المخزون المنخفض")
-        for _, row in low_stock_df.iterrows():
-            st.warning(
-                f"🔴 **{row['Ingredient']}**: المتبقي {row['Current_Stock']:.2f} {row['Unit']} فقط!"
-            )
+        render_stock_alerts(levels_df)
+    
+    render_reorder_plan(inventory_df, lead_days, cover_days)
+    
+    render_stock_variance(inventory_df)
     
     st.markdown("---")
     
@@ -703,6 +817,11 @@ def render_inventory_management():
     
     st.info("💡 أضف المنتجات واحداً تلو الآخر، ثم راجع القائمة قبل التأكيد النهائي")
     
+    with st.expander("📄 استيراد الوارد من ملف المورد (CSV / Excel)"):
+        receipt_file = st.file_uploader("ملف التوريد", type=['csv', 'xlsx'], key="receipt_file")
+        if receipt_file is not None:
+            render_receipt_import(receipt_file)
+    
     # تهيئة سلة الإضافة في الجلسة
     if 'bulk_add_items' not in st.session_state:
         st.session_state.bulk_add_items = []
@@ -751,17 +870,12 @@ def render_inventory_management():
         
         with col_confirm:
             if st.button("✅ تأكيد وإضافة للمخزون", use_container_width=True, type="primary"):
-                # تحديث المخزون
-                for item in st.session_state.bulk_add_items:
-                    mask = inventory_df['Ingredient'] == item['ingredient']
-                    if mask.any():
-                        inventory_df.loc[mask, 'Current_Stock'] += item['quantity']
-                
-                save_inventory(inventory_df)
-                
-                # تسجيل في السجل
-                log_df = add_to_inventory_log(log_df, st.session_state.bulk_add_items, bulk_notes)
-                save_inventory_log(log_df)
+                # تحديث المخزون وتسجيل الوارد كعملية واحدة
+                bulk_df = pd.DataFrame(st.session_state.bulk_add_items)
+                commit_receipt(
+                    bulk_df.groupby('ingredient')['quantity'].sum(),
+                    build_inventory_log_rows(st.session_state.bulk_add_items, bulk_notes)
+                )
                 
                 items_count = len(st.session_state.bulk_add_items)
                 st.session_state.bulk_add_items = []
@@ -799,23 +913,19 @@ def render_inventory_management():
         st.markdown("<br>", unsafe_allow_html=True)
         if st.button("🆕 إضافة مكون جديد", key="add_new_ingredient_btn"):
             if brand_new_ingredient:
-                if brand_new_ingredient not in inventory_df['Ingredient'].values:
-                    new_row = pd.DataFrame({
-                        'Ingredient': [brand_new_ingredient],
-                        'Current_Stock': [new_stock],
-                        'Unit': [new_unit]
-                    })
-                    inventory_df = pd.concat([inventory_df, new_row], ignore_index=True)
-                    save_inventory(inventory_df)
-                    
-                    # تسجيل في السجل
-                    log_df = add_to_inventory_log(log_df, [{
-                        'ingredient': brand_new_ingredient,
-                        'quantity': new_stock,
-                        'unit': new_unit
-                    }], "إضافة مكون جديد")
-                    save_inventory_log(log_df)
-                    
+                new_row = pd.DataFrame({
+                    'Ingredient': [brand_new_ingredient],
+                    'Current_Stock': [new_stock],
+                    'Unit': [new_unit]
+                })
+                log_rows = build_inventory_log_rows([{
+                    'ingredient': brand_new_ingredient,
+                    'quantity': new_stock,
+                    'unit': new_unit
+                }], "إضافة مكون جديد")
+                
+                # الإضافة تتم على المخزون الحالي وقت الحفظ فلا تُلغى خصومات الأجهزة الأخرى
+                if not add_ingredients(new_row, log_rows):
                     st.success(f"✅ تمت إضافة المكون '{brand_new_ingredient}' بنجاح!")
                     st.rerun()
                 else:
@@ -824,49 +934,210 @@ def render_inventory_management():
                 st.error("❌ الرجاء إدخال اسم المكون!")
 
 
+def render_receipt_import(receipt_file):
+    """مراجعة ملف المورد (الصفوف الصالحة والمرفوضة) ثم استيراده كعملية واحدة"""
+    
+    try:
+        header = receipt_file_columns(receipt_file)
+    except (ValueError, ImportError) as error:
+        st.error(f"❌ لا يمكن قراءة الملف: {error}")
+        return
+    
+    def default_index(name, fallback):
+        return header.index(name) if name in header else min(fallback, len(header) - 1)
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        ingredient_column = st.selectbox(
+            "عمود المكون", header, index=default_index(RECEIPT_COLUMNS['Ingredient'], 0), key="receipt_ingredient_column"
+        )
+    with col2:
+        quantity_column = st.selectbox(
+            "عمود الكمية", header, index=default_index(RECEIPT_COLUMNS['Quantity'], 1), key="receipt_quantity_column"
+        )
+    with col3:
+        unit_options = ["—"] + header
+        unit_column = st.selectbox(
+            "عمود الوحدة", unit_options,
+            index=unit_options.index(RECEIPT_COLUMNS['Unit']) if RECEIPT_COLUMNS['Unit'] in header else 0,
+            key="receipt_unit_column"
+        )
+    receipt_notes = st.text_input("ملاحظات (اختياري)", placeholder="مثال: فاتورة رقم 1234", key="receipt_file_notes")
+    
+    columns = dict(RECEIPT_COLUMNS, Ingredient=ingredient_column, Quantity=quantity_column, Unit=unit_column)
+    options = {'columns': columns, 'notes': receipt_notes or RECEIPT_NOTES}
+    
+    # المراجعة تتحقق من الملف كاملاً دون تعديل أي بيانات
+    try:
+        preview = import_receipts(receipt_file, get_storage(), dry_run=True, **options)
+    except (ValueError, ImportError) as error:
+        st.error(f"❌ لا يمكن قراءة الملف: {error}")
+        return
+    
+    col_valid, col_rejected = st.columns(2)
+    with col_valid:
+        st.metric("صفوف صالحة", preview['valid'])
+    with col_rejected:
+        st.metric("صفوف مرفوضة", preview['rejected'])
+    if preview['rejected_rows'] is not None:
+        st.dataframe(preview['rejected_rows'], use_container_width=True, hide_index=True)
+    
+    if st.session_state.get('receipt_imported') == receipt_file.file_id:
+        st.success("✅ تم استيراد هذا الملف")
+        return
+    
+    if preview['valid'] and st.button("✅ استيراد الوارد", type="primary", key="import_receipt_file"):
+        summary = import_receipts(receipt_file, get_storage(), **options)
+        st.session_state.receipt_imported = receipt_file.file_id
+        st.success(f"✅ تم إضافة {summary['imported']} صف للمخزون وتسجيلها في {summary['elapsed']:.2f} ثانية")
+        st.rerun()
+
+
+def render_reorder_plan(inventory_df, lead_days, cover_days):
+    """عرض أيام التغطية وكميات إعادة الطلب المقترحة حسب استهلاك الأسابيع الماضية"""
+    
+    st.markdown('<div class="section-header">📈 توقع الاستهلاك وإعادة الطلب</div>', unsafe_allow_html=True)
+    
+    plan_df = calculate_reorder_plan(
+        load_demand_profile(), inventory_df, lead_days=lead_days, cover_days=cover_days
+    ).sort_values(['Days_Of_Cover', 'Ingredient'])
+    
+    to_order = plan_df[plan_df['Reorder_Quantity'] > 0]
+    col_order, col_week = st.columns(2)
+    with col_order:
+        st.metric("مكونات تحتاج طلب", len(to_order))
+    with col_week:
+        st.metric("تنفد خلال أسبوع", int((plan_df['Days_Of_Cover'] < 7).sum()))
+    
+    display_df = plan_df.rename(columns={
+        'Ingredient': 'المكون',
+        'Current_Stock': 'المخزون الحالي',
+        'Unit': 'الوحدة',
+        'Avg_Daily_Use': 'متوسط الاستهلاك اليومي',
+        'Days_Of_Cover': 'يكفي (أيام)',
+        'Reorder_Point': 'نقطة إعادة الطلب',
+        'Reorder_Quantity': 'الكمية المقترحة'
+    })
+    
+    st.caption(
+        f"💡 حسب استهلاك آخر {FORECAST_WEEKS} أسابيع لكل يوم من أيام الأسبوع؛ "
+        f"∞ = يكفي أكثر من {COVER_HORIZON_DAYS} يوماً"
+    )
+    st.dataframe(
+        display_df.round(2),
+        use_container_width=True,
+        hide_index=True,
+        height=300
+    )
+
+
+def render_stock_variance(inventory_df):
+    """عرض الجرد والفرق بين المخزون الفعلي والمتوقع من الوارد والاستهلاك النظري"""
+    
+    st.markdown('<div class="section-header">🔍 الجرد: الاستهلاك الفعلي مقابل النظري</div>', unsafe_allow_html=True)
+    
+    with st.expander("📝 تسجيل جرد جديد"):
+        st.caption("💡 سجّل الجرد في نهاية اليوم بعد إغلاق المبيعات؛ سيتم تعديل المخزون إلى الكميات المعدودة")
+        count_df = st.data_editor(
+            inventory_df.rename(columns={
+                'Ingredient': 'المكون',
+                'Current_Stock': 'الكمية المعدودة',
+                'Unit': 'الوحدة'
+            }),
+            disabled=['المكون', 'الوحدة'],
+            use_container_width=True,
+            hide_index=True,
+            key="stock_count_editor"
+        )
+        if st.button("💾 حفظ الجرد", key="save_stock_count"):
+            count_rows = prepare_stock_count(count_df.set_index('المكون')['الكمية المعدودة'])
+            stock_changes = commit_stock_count(count_rows)
+            st.success(f"✅ تم حفظ الجرد وتعديل {len(stock_changes)} مكون")
+            st.rerun()
+    
+    counts_df = load_stock_counts()
+    if counts_df.empty:
+        st.info("💡 سجّل جرداً أولاً ليكون رصيداً افتتاحياً للمقارنة")
+        return
+    
+    consumption_rollup = load_consumption_rollup()
+    if consumption_rollup.empty:
+        st.info("💡 سجل الاستهلاك فارغ؛ يمكن بناؤه من سجل المبيعات السابق")
+        if st.button("🔄 بناء سجل الاستهلاك من المبيعات", key="rebuild_consumption"):
+            rows_count = rebuild_consumption_log()
+            st.success(f"✅ تم بناء {rows_count} صف في سجل الاستهلاك")
+            st.rerun()
+    
+    count_dates = sorted(counts_df['Date'].astype(str).unique(), reverse=True)
+    count_date = st.selectbox("الجرد الافتتاحي", options=count_dates, key="variance_count_date")
+    
+    variance_df = calculate_stock_variance(
+        counts_df, load_inventory_log_rollup(), consumption_rollup, inventory_df, count_date
+    )
+    
+    shortage = variance_df[variance_df['Variance'] < -1e-6]
+    col_short, col_items = st.columns(2)
+    with col_short:
+        st.metric("مكونات بها فاقد", len(shortage))
+    with col_items:
+        st.metric("مكونات في الجرد", int(variance_df['Opening_Stock'].notna().sum()))
+    
+    display_df = variance_df.sort_values('Variance').rename(columns={
+        'Ingredient': 'المكون',
+        'Unit': 'الوحدة',
+        'Opening_Stock': 'رصيد الجرد',
+        'Received': 'الوارد',
+        'Theoretical_Usage': 'الاستهلاك النظري',
+        'Expected_Stock': 'المتوقع',
+        'Actual_Stock': 'الفعلي',
+        'Variance': 'الفرق',
+        'Variance_Pct': 'الفرق %'
+    })
+    
+    st.dataframe(
+        display_df.round(2),
+        use_container_width=True,
+        hide_index=True,
+        height=300
+    )
+
+
 # ========== صفحة سجل الوارد ==========
 
 def render_inventory_log():
     """عرض صفحة سجل الوارد"""
     
-    log_df = load_inventory_log()
+    # الفلاتر والإحصائيات تُحسب من ملخص (يوم × مكون) بدلاً من السجل الكامل
+    rollup_df = load_inventory_log_rollup()
     
     st.markdown('<div class="section-header">📜 سجل الوارد للمخزن</div>', unsafe_allow_html=True)
     
-    if log_df.empty:
+    if rollup_df.empty:
         st.info("لا توجد سجلات حالياً")
     else:
-        # فلترة حسب التاريخ
+        # فلترة حسب الفترة الزمنية
         col_filter1, col_filter2 = st.columns(2)
         
         with col_filter1:
-            unique_dates = log_df['Date'].unique().tolist()
-            unique_dates.insert(0, "الكل")
-            selected_date = st.selectbox("فلترة حسب التاريخ", unique_dates, key="log_date_filter")
+            start_date, end_date = select_date_range("log")
         
         with col_filter2:
-            unique_ingredients = log_df['Ingredient'].unique().tolist()
+            unique_ingredients = rollup_df['Ingredient'].unique().tolist()
             unique_ingredients.insert(0, "الكل")
             selected_ingredient_filter = st.selectbox("فلترة حسب المكون", unique_ingredients, key="log_ingredient_filter")
         
-        # تطبيق الفلترة
-        filtered_df = log_df.copy()
-        
-        if selected_date != "الكل":
-            filtered_df = filtered_df[filtered_df['Date'] == selected_date]
+        # تُقرأ أشهر الفترة فقط، وتُطبق بالبحث الثنائي في الفهرس الزمني، ثم باقي الفلاتر على صفوفها فقط
+        log_df, log_index = load_log_range_with_index('inventory_log', ['Date'], start_date, end_date)
+        positions = date_range_positions(log_index, start_date, end_date)
+        filtered_rollup = filter_rollup_by_date(rollup_df, start_date, end_date)
         
         if selected_ingredient_filter != "الكل":
-            filtered_df = filtered_df[filtered_df['Ingredient'] == selected_ingredient_filter]
+            positions = positions[matching_rows(log_df, positions, 'Ingredient', selected_ingredient_filter)]
+            filtered_rollup = filtered_rollup[filtered_rollup['Ingredient'] == selected_ingredient_filter]
         
         # عرض السجل
-        display_log = filtered_df.copy()
-        display_log.columns = ['التاريخ', 'المكون', 'الكمية', 'الوحدة', 'ملاحظات']
-        
-        st.dataframe(
-            display_log.sort_values('التاريخ', ascending=False),
-            use_container_width=True,
-            hide_index=True,
-            height=400
+        render_log_table(
+            log_df, positions, ['التاريخ', 'المكون', 'الكمية', 'الوحدة', 'ملاحظات'], key="inventory_log"
         )
         
         # إحصائيات
@@ -876,23 +1147,23 @@ def render_inventory_log():
         col_stat1, col_stat2, col_stat3 = st.columns(3)
         
         with col_stat1:
-            st.metric("إجمالي التوريدات", len(filtered_df))
+            st.metric("إجمالي التوريدات", int(filtered_rollup['Rows'].sum()))
         
         with col_stat2:
-            total_qty = filtered_df['Quantity_Added'].sum()
+            total_qty = filtered_rollup['Quantity_Added'].sum()
             st.metric("إجمالي الكميات", f"{total_qty:.2f}")
         
         with col_stat3:
-            unique_items = filtered_df['Ingredient'].nunique()
+            unique_items = filtered_rollup['Ingredient'].nunique()
             st.metric("عدد المكونات", unique_items)
         
         # ملخص حسب المكون
-        if selected_date != "الكل":
-            st.markdown(f"### 📦 ملخص توريدات يوم {selected_date}")
-            summary = filtered_df.groupby('Ingredient').agg({
-                'Quantity_Added': 'sum'
-            }).reset_index()
-            summary.columns = ['المكون', 'إجمالي الكمية']
+        if start_date is not None:
+            if start_date == end_date:
+                st.markdown(f"### 📦 ملخص توريدات يوم {start_date}")
+            else:
+                st.markdown(f"### 📦 ملخص التوريدات من {start_date} إلى {end_date}")
+            summary = summarize_receipts_by_ingredient(filtered_rollup)
             st.dataframe(summary, use_container_width=True, hide_index=True)
 
 
@@ -901,44 +1172,37 @@ def render_inventory_log():
 def render_sales_log():
     """عرض صفحة سجل المبيعات"""
     
-    sales_df = load_sales_log()
+    # الفلاتر والإحصائيات والملخصات تُحسب من ملخص (يوم × طبق) بدلاً من السجل الكامل
+    rollup_df = load_sales_rollup()
     
     st.markdown('<div class="section-header-purple">💰 سجل المبيعات</div>', unsafe_allow_html=True)
     
-    if sales_df.empty:
+    if rollup_df.empty:
         st.info("لا توجد مبيعات مسجلة حالياً")
     else:
-        # فلترة حسب التاريخ
+        # فلترة حسب الفترة الزمنية
         col_filter1, col_filter2 = st.columns(2)
         
         with col_filter1:
-            unique_dates = sales_df['Date'].unique().tolist()
-            unique_dates.insert(0, "الكل")
-            selected_date = st.selectbox("فلترة حسب التاريخ", unique_dates, key="sales_date_filter")
+            start_date, end_date = select_date_range("sales")
         
         with col_filter2:
-            unique_dishes = sales_df['Dish_Name'].unique().tolist()
+            unique_dishes = rollup_df['Dish_Name'].unique().tolist()
             unique_dishes.insert(0, "الكل")
             selected_dish_filter = st.selectbox("فلترة حسب الطبق", unique_dishes, key="sales_dish_filter")
         
-        # تطبيق الفلترة
-        filtered_df = sales_df.copy()
-        
-        if selected_date != "الكل":
-            filtered_df = filtered_df[filtered_df['Date'] == selected_date]
+        # تُقرأ أشهر الفترة فقط، وتُطبق بالبحث الثنائي في الفهرس الزمني، ثم باقي الفلاتر على صفوفها فقط
+        sales_df, log_index = load_log_range_with_index('sales_log', ['Date', 'Time'], start_date, end_date)
+        positions = date_range_positions(log_index, start_date, end_date)
+        filtered_rollup = filter_rollup_by_date(rollup_df, start_date, end_date)
         
         if selected_dish_filter != "الكل":
-            filtered_df = filtered_df[filtered_df['Dish_Name'] == selected_dish_filter]
+            positions = positions[matching_rows(sales_df, positions, 'Dish_Name', selected_dish_filter)]
+            filtered_rollup = filtered_rollup[filtered_rollup['Dish_Name'] == selected_dish_filter]
         
         # عرض السجل
-        display_sales = filtered_df.copy()
-        display_sales.columns = ['التاريخ', 'الوقت', 'الطبق', 'الكمية', 'ملاحظات']
-        
-        st.dataframe(
-            display_sales.sort_values(['التاريخ', 'الوقت'], ascending=[False, False]),
-            use_container_width=True,
-            hide_index=True,
-            height=400
+        render_log_table(
+            sales_df, positions, ['التاريخ', 'الوقت', 'الطبق', 'الكمية', 'ملاحظات'], key="sales_log"
         )
         
         # إحصائيات
@@ -948,71 +1212,175 @@ def render_sales_log():
         col_stat1, col_stat2, col_stat3 = st.columns(3)
         
         with col_stat1:
-            st.metric("إجمالي الطلبات", len(filtered_df))
+            st.metric("إجمالي الطلبات", int(filtered_rollup['Rows'].sum()))
         
         with col_stat2:
-            total_qty = filtered_df['Quantity'].sum()
+            total_qty = filtered_rollup['Quantity'].sum()
             st.metric("إجمالي الأطباق المباعة", int(total_qty))
         
         with col_stat3:
-            unique_dishes_count = filtered_df['Dish_Name'].nunique()
+            unique_dishes_count = filtered_rollup['Dish_Name'].nunique()
             st.metric("أنواع الأطباق", unique_dishes_count)
         
         # ملخص حسب الطبق
         st.markdown("---")
         st.markdown("### 🍔 ملخص المبيعات حسب الطبق")
         
-        summary = filtered_df.groupby('Dish_Name').agg({
-            'Quantity': 'sum'
-        }).reset_index()
-        summary.columns = ['الطبق', 'إجمالي الكمية']
-        summary = summary.sort_values('إجمالي الكمية', ascending=False)
+        summary = summarize_sales_by_dish(filtered_rollup)
         st.dataframe(summary, use_container_width=True, hide_index=True)
         
-        # ملخص حسب التاريخ (إذا تم اختيار "الكل")
-        if selected_date == "الكل":
+        # ملخص حسب التاريخ (إذا كانت الفترة أكثر من يوم)
+        if start_date is None or start_date != end_date:
             st.markdown("---")
             st.markdown("### 📅 ملخص المبيعات حسب اليوم")
             
-            daily_summary = filtered_df.groupby('Date').agg({
-                'Quantity': 'sum'
-            }).reset_index()
-            daily_summary.columns = ['التاريخ', 'إجمالي الأطباق']
-            daily_summary = daily_summary.sort_values('التاريخ', ascending=False)
+            daily_summary = summarize_sales_by_day(filtered_rollup)
             st.dataframe(daily_summary, use_container_width=True, hide_index=True)
 
 
-# ========== الدالة الرئيسية ==========
+# ========== صفحة تقرير الفروع ==========
 
-def main():
-    """الدالة الرئيسية للتطبيق"""
+MAIN_BRANCH_LABEL = "الفرع الرئيسي"
+
+# بيانات الجلسة الخاصة بالفرع الحالي وتُحذف عند تغيير الفرع
+BRANCH_SESSION_KEYS = ['sales_cart', 'sales_feasible', 'bulk_add_items', 'branches_report']
+
+
+def reset_branch_session():
+    """حذف السلة والوارد المؤقت عند تغيير الفرع حتى لا تُسجل في فرع آخر"""
+    for key in BRANCH_SESSION_KEYS:
+        st.session_state.pop(key, None)
+
+
+def select_branch(branches):
+    """اختيار فرع الجلسة من الشريط الجانبي"""
+    options = [None] + branches
+    with st.sidebar:
+        return st.selectbox(
+            "🏪 الفرع",
+            options,
+            index=options.index(DEFAULT_BRANCH) if DEFAULT_BRANCH in options else 0,
+            format_func=lambda branch: branch or MAIN_BRANCH_LABEL,
+            on_change=reset_branch_session,
+            key="branch"
+        )
+
+
+def render_branches_report():
+    """عرض صفحة التقرير المجمع لكل الفروع"""
     
-    # العنوان الرئيسي
-    st.markdown('<h1 class="header-title">🍔 الوحش برجر - نظام إدارة المخزون</h1>', unsafe_allow_html=True)
+    st.markdown('<div class="section-header-purple">🏪 تقرير الفروع المجمع</div>', unsafe_allow_html=True)
+    
+    start_date, end_date = select_date_range("branches")
+    
+    if st.button("📊 إنشاء التقرير", type="primary", key="build_branches_report"):
+        data_dirs = {branch or MAIN_BRANCH_LABEL: branch_dir(branch) for branch in [None] + list_branches()}
+        # التغييرات المعلقة في هذه العملية يجب أن تُكتب قبل أن تقرأها عمليات التقرير
+        flush_branches()
+        with st.spinner("جاري حساب ملخصات الفروع..."):
+            st.session_state.branches_report = (
+                (start_date, end_date), consolidated_report(data_dirs, start_date, end_date)
+            )
+    
+    saved = st.session_state.get('branches_report')
+    if saved is None or saved[0] != (start_date, end_date):
+        st.info("اختر الفترة ثم اضغط إنشاء التقرير")
+        return
+    report = saved[1]
     
-    # التبويبات الرئيسية
-    tab1, tab2, tab3, tab4, tab5 = st.tabs([
-        "📊 المبيعات ولوحة المعلومات",
-        "📖 إدارة الوصفات",
-        "📦 إدارة المخزون",
-        "📜 سجل الوارد",
-        "💰 سجل المبيعات"
-    ])
+    st.markdown("### 🏪 إجمالي كل فرع")
+    st.dataframe(report['branches'], use_container_width=True, hide_index=True)
     
-    with tab1:
-        render_sales_dashboard()
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("### 🍔 المبيعات حسب الطبق")
+        st.dataframe(report['sales_by_dish'], use_container_width=True, hide_index=True)
+    with col2:
+        st.markdown("### 📦 الوارد حسب المكون")
+        st.dataframe(report['receipts'], use_container_width=True, hide_index=True)
+    
+    st.markdown("### 📅 المبيعات حسب اليوم")
+    st.dataframe(report['sales_by_day'], use_container_width=True, hide_index=True)
+
+
+# ========== قياس الأداء ==========
+
+PROFILE_DISPLAY_COLUMNS = ['Category', 'Name', 'Calls', 'P50_ms', 'P95_ms', 'Max_ms', 'Rows', 'Bytes_Read', 'Bytes_Written']
+
+
+def render_profiler_panel():
+    """عرض أزمنة الصفحات والتحميل والحفظ ودوال المحرك في الشريط الجانبي"""
     
-    with tab2:
-        render_recipes_management()
+    with st.sidebar:
+        st.markdown("### ⏱️ قياس الأداء")
+        summary_df = profiler.summary()
+        if summary_df.empty:
+            st.caption("لا توجد قياسات بعد")
+            return
+        
+        st.dataframe(
+            summary_df[PROFILE_DISPLAY_COLUMNS].style.format(
+                {'P50_ms': '{:.1f}', 'P95_ms': '{:.1f}', 'Max_ms': '{:.1f}'}
+            ),
+            use_container_width=True,
+            hide_index=True
+        )
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button(
+                "💾 CSV",
+                data=summary_df.to_csv(index=False).encode('utf-8-sig'),
+                file_name="profile.csv",
+                mime="text/csv",
+                key="profile_csv"
+            )
+        with col2:
+            st.download_button(
+                "💾 JSON",
+                data=profiler.to_json().encode('utf-8'),
+                file_name="profile.json",
+                mime="application/json",
+                key="profile_json"
+            )
+        
+        if st.button("🗑️ مسح القياسات", key="profile_reset"):
+            profiler.reset()
+            st.rerun()
+
+
+# ========== الدالة الرئيسية ==========
+
+def main():
+    """الدالة الرئيسية للتطبيق"""
     
-    with tab3:
-        render_inventory_management()
+    apply_page_style()
     
-    with tab4:
-        render_inventory_log()
+    # العنوان الرئيسي
+    st.markdown('<h1 class="header-title">🍔 الوحش برجر - نظام إدارة المخزون</h1>', unsafe_allow_html=True)
     
-    with tab5:
-        render_sales_log()
+    # الصفحات الرئيسية: يتم تنفيذ الصفحة المختارة فقط في كل تفاعل
+    pages = [
+        st.Page(render_sales_dashboard, title="المبيعات ولوحة المعلومات", icon="📊", default=True),
+        st.Page(render_recipes_management, title="إدارة الوصفات", icon="📖"),
+        st.Page(render_inventory_management, title="إدارة المخزون", icon="📦"),
+        st.Page(render_inventory_log, title="سجل الوارد", icon="📜"),
+        st.Page(render_sales_log, title="سجل المبيعات", icon="💰"),
+    ]
+    
+    # عند وجود فروع تختار كل جلسة فرعها، وتظهر صفحة التقرير المجمع
+    branches = list_branches()
+    branch = DEFAULT_BRANCH
+    if branches:
+        pages.append(st.Page(render_branches_report, title="تقرير الفروع", icon="🏪"))
+        branch = select_branch(branches)
+    
+    page = st.navigation(pages)
+    with use_branch(branch):
+        page.run()
+    
+    if profiler.PROFILE_ENABLED:
+        render_profiler_panel()
     
     # تذييل الصفحة
     st.markdown("---")
@@ -1026,5 +1394,9 @@ def main():
     )
 
 
+# قياس زمن كل صفحة وقسم (عند تفعيل INVENTORY_PROFILE فقط)
+profiler.instrument(globals(), 'page', prefixes=('render_',))
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,107 @@
+"""
+قياس معدل تأكيد المبيعات من عدة أجهزة كاشير في نفس الوقت
+Concurrent sale-commit throughput benchmark
+
+يشغّل N عملية متوازية تؤكد كل منها K عملية بيع على نسخة مؤقتة من البيانات،
+ثم يتحقق من أن المخزون النهائي يساوي المخزون الأصلي ناقص جميع الخصومات
+(أي لم تضع أي عملية خصم).
+
+    python benchmarks/bench_concurrent_commits.py --workers 8 --commits 50 --backend csv
+"""
+
+import argparse
+import multiprocessing
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import storage  # noqa: E402
+
+DISH = 'Classic Burger'
+
+
+def _make_storage(backend, data_dir):
+    if backend == 'sqlite':
+        return storage.SqliteStorage(data_dir / storage.DB_FILE.name)
+    return storage.CsvStorage(data_dir)
+
+
+def _worker(backend, data_dir, commits, ingredients_needed, start_event, write_behind):
+    store = _make_storage(backend, data_dir)
+    if write_behind:
+        store = storage.WriteBehindStorage(store, interval=write_behind)
+    sales_rows = pd.DataFrame(
+        [{'Date': '2026-01-01', 'Time': '12:00:00', 'Dish_Name': DISH, 'Quantity': 1, 'Notes': 'bench'}],
+        columns=storage.SALES_LOG_COLUMNS
+    )
+    start_event.wait()
+    for _ in range(commits):
+        store.commit_sale(ingredients_needed, sales_rows)
+    store.flush()
+
+
+def run(workers, commits, backend, write_behind=0):
+    data_dir = Path(tempfile.mkdtemp(prefix='inventory-bench-'))
+    try:
+        for path in (storage.INVENTORY_FILE, storage.RECIPES_FILE,
+                     storage.INVENTORY_LOG_FILE, storage.SALES_LOG_FILE):
+            shutil.copy(path, data_dir / path.name)
+        if backend == 'sqlite':
+            storage.migrate_csv_to_sqlite(data_dir, data_dir / storage.DB_FILE.name)
+
+        store = _make_storage(backend, data_dir)
+        recipes_df = store.load('recipes')
+        ingredients_needed = (
+            recipes_df[recipes_df['Dish_Name'] == DISH]
+            .groupby('Ingredient')['Quantity_Needed'].sum()
+        )
+        initial = store.load('inventory').set_index('Ingredient')['Current_Stock']
+        initial_sales = len(store.load('sales_log'))
+
+        start_event = multiprocessing.Event()
+        processes = [
+            multiprocessing.Process(
+                target=_worker,
+                args=(backend, data_dir, commits, ingredients_needed, start_event, write_behind)
+            )
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        started = time.perf_counter()
+        start_event.set()
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - started
+
+        final = store.load('inventory').set_index('Ingredient')['Current_Stock']
+        expected = initial.sub(ingredients_needed * workers * commits, fill_value=0)[initial.index]
+        lost = (final - expected).abs() > 1e-6
+        sales_added = len(store.load('sales_log')) - initial_sales
+
+        total = workers * commits
+        print(f"backend={backend} workers={workers} commits/worker={commits} write_behind={write_behind}")
+        print(f"  total commits: {total} in {elapsed:.2f}s -> {total / elapsed:.1f} commits/s")
+        print(f"  sales rows appended: {sales_added}/{total}")
+        print(f"  ingredients with lost updates: {int(lost.sum())}")
+        return not lost.any() and sales_added == total
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--commits', type=int, default=50)
+    parser.add_argument('--backend', choices=['csv', 'sqlite'], default='csv')
+    parser.add_argument('--write-behind', type=float, default=0,
+                        help="ثواني تجميع الكتابات في الخلفية لكل عملية (0 للكتابة المباشرة)")
+    args = parser.parse_args()
+    ok = run(args.workers, args.commits, args.backend, args.write_behind)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,71 @@
+"""
+قياس زمن استيراد محرك المخزون والتأكد من أنه لا يستورد Streamlit
+Import-time benchmark for the headless engine
+
+يستورد كل وحدة في عملية Python جديدة عدة مرات ويقيس الزمن الإضافي فوق
+استيراد pandas (الذي تحتاجه كل الوحدات)، ويفشل إذا استوردت وحدة غير
+الواجهة مكتبة Streamlit أو تجاوز زمن استيرادها الحد المسموح.
+
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --repeat 10 --max-ms 150
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+# الوحدات التي يجب أن تعمل دون Streamlit
+HEADLESS_MODULES = ['profiler', 'storage', 'engine', 'import_sales', 'import_receipts']
+
+_PROBE = """
+import json, sys, time
+import pandas
+started = time.perf_counter()
+import {module}
+print(json.dumps({{
+    'ms': (time.perf_counter() - started) * 1000,
+    'streamlit': 'streamlit' in sys.modules,
+}}))
+"""
+
+
+def measure(module, repeat):
+    """زمن استيراد الوحدة (بالمللي ثانية) في عمليات جديدة، وهل استوردت Streamlit"""
+    timings = []
+    imports_streamlit = False
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, '-c', _PROBE.format(module=module)],
+            cwd=ROOT_DIR, capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        timings.append(result['ms'])
+        imports_streamlit = imports_streamlit or result['streamlit']
+    return statistics.median(timings), imports_streamlit
+
+
+def run(repeat, max_ms):
+    failures = 0
+    print(f"{'module':<20}{'median ms':>12}{'streamlit':>12}")
+    for module in HEADLESS_MODULES + ['app']:
+        median_ms, imports_streamlit = measure(module, repeat)
+        status = ''
+        if module in HEADLESS_MODULES and (imports_streamlit or median_ms > max_ms):
+            status = ' !'
+            failures += 1
+        print(f"{module:<20}{median_ms:>12.1f}{str(imports_streamlit):>12}{status}")
+    print(f"\n{failures} headless module(s) importing Streamlit or slower than {max_ms} ms")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5, help="عدد مرات تكرار كل قياس")
+    parser.add_argument('--max-ms', type=float, default=200, help="أقصى زمن استيراد مسموح فوق pandas")
+    args = parser.parse_args()
+    sys.exit(1 if run(args.repeat, args.max_ms) else 0)
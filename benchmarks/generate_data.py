@@ -0,0 +1,109 @@
+"""
+توليد بيانات تجريبية كبيرة بنفس صيغة ملفات النظام
+Synthetic data generator for benchmarks
+
+    python benchmarks/generate_data.py --out /tmp/inventory-data --sales-rows 2000000
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from storage import (  # noqa: E402
+    INVENTORY_COLUMNS, RECIPES_COLUMNS, INVENTORY_LOG_COLUMNS, SALES_LOG_COLUMNS,
+    INVENTORY_FILE, RECIPES_FILE, INVENTORY_LOG_FILE, SALES_LOG_FILE,
+)
+
+UNITS = ['كيلو', 'لتر', 'قطعة', 'علبة', 'كيس']
+
+
+def generate(out_dir, ingredients=200, dishes=100, fanout=8, sales_rows=1_000_000,
+             receipt_rows=100_000, days=365, start_date='2025-01-01', seed=0):
+    """كتابة ملفات المخزون والوصفات والسجلات في المجلد المحدد"""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    fanout = min(fanout, ingredients)
+
+    ingredient_names = np.array([f"مكون {i:05d}" for i in range(ingredients)], dtype=object)
+    ingredient_units = rng.choice(UNITS, ingredients)
+    inventory_df = pd.DataFrame({
+        'Ingredient': ingredient_names,
+        'Current_Stock': rng.uniform(1, 10_000, ingredients).round(2),
+        'Unit': ingredient_units,
+    }, columns=INVENTORY_COLUMNS)
+
+    dish_names = np.array([f"طبق {i:05d}" for i in range(dishes)], dtype=object)
+    recipe_ingredients = np.concatenate([
+        rng.choice(ingredients, fanout, replace=False) for _ in range(dishes)
+    ])
+    recipes_df = pd.DataFrame({
+        'Dish_Name': np.repeat(dish_names, fanout),
+        'Ingredient': ingredient_names[recipe_ingredients],
+        'Quantity_Needed': rng.uniform(0.01, 1.0, dishes * fanout).round(3),
+    }, columns=RECIPES_COLUMNS)
+
+    all_days = pd.date_range(start_date, periods=days, freq='D').strftime('%Y-%m-%d').to_numpy()
+
+    sales_days = np.sort(rng.integers(0, days, sales_rows))
+    seconds = rng.integers(10 * 3600, 24 * 3600, sales_rows)
+    sales_df = pd.DataFrame({
+        'Date': all_days[sales_days],
+        'Time': pd.to_datetime(seconds, unit='s').strftime('%H:%M:%S'),
+        'Dish_Name': dish_names[rng.integers(0, dishes, sales_rows)],
+        'Quantity': rng.integers(1, 6, sales_rows),
+        'Notes': '',
+    }, columns=SALES_LOG_COLUMNS)
+    sales_df = sales_df.sort_values(['Date', 'Time'], kind='stable')
+
+    receipt_ingredients = rng.integers(0, ingredients, receipt_rows)
+    inventory_log_df = pd.DataFrame({
+        'Date': all_days[np.sort(rng.integers(0, days, receipt_rows))],
+        'Ingredient': ingredient_names[receipt_ingredients],
+        'Quantity_Added': rng.uniform(1, 100, receipt_rows).round(2),
+        'Unit': ingredient_units[receipt_ingredients],
+        'Notes': 'توريد تجريبي',
+    }, columns=INVENTORY_LOG_COLUMNS)
+
+    inventory_df.to_csv(out_dir / INVENTORY_FILE.name, index=False, encoding='utf-8-sig')
+    recipes_df.to_csv(out_dir / RECIPES_FILE.name, index=False, encoding='utf-8-sig')
+    sales_df.to_csv(out_dir / SALES_LOG_FILE.name, index=False, encoding='utf-8-sig')
+    inventory_log_df.to_csv(out_dir / INVENTORY_LOG_FILE.name, index=False, encoding='utf-8-sig')
+    return out_dir
+
+
+def add_arguments(parser):
+    """إضافة خيارات حجم البيانات إلى محلل الأوامر"""
+    parser.add_argument('--ingredients', type=int, default=200, help="عدد المكونات")
+    parser.add_argument('--dishes', type=int, default=100, help="عدد الأطباق")
+    parser.add_argument('--fanout', type=int, default=8, help="عدد المكونات في كل وصفة")
+    parser.add_argument('--sales-rows', type=int, default=1_000_000, help="عدد صفوف سجل المبيعات")
+    parser.add_argument('--receipt-rows', type=int, default=100_000, help="عدد صفوف سجل الوارد")
+    parser.add_argument('--days', type=int, default=365, help="عدد الأيام التي يغطيها السجل")
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def generate_from_args(out_dir, args):
+    return generate(
+        out_dir,
+        ingredients=args.ingredients,
+        dishes=args.dishes,
+        fanout=args.fanout,
+        sales_rows=args.sales_rows,
+        receipt_rows=args.receipt_rows,
+        days=args.days,
+        seed=args.seed
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="توليد بيانات تجريبية")
+    parser.add_argument('--out', required=True, help="مجلد الإخراج")
+    add_arguments(parser)
+    args = parser.parse_args()
+    print(generate_from_args(args.out, args))
@@ -0,0 +1,324 @@
+"""
+قياس أداء دوال النظام الأساسية على بيانات تجريبية كبيرة
+Benchmark suite for the inventory core
+
+يولّد بيانات تجريبية (أو يستخدم مجلداً جاهزاً)، ثم يقيس زمن التحميل والحفظ وحساب
+المكونات والتحقق من المخزون والملخصات، ويحفظ النتائج في ملف JSONL ويقارنها بآخر
+تشغيل بنفس الإعدادات لإظهار أي تراجع في الأداء.
+
+    python benchmarks/run_benchmarks.py --sales-rows 1000000
+    python benchmarks/run_benchmarks.py --data-dir /tmp/inventory-data --repeat 10
+"""
+
+import argparse
+import importlib
+import json
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT_DIR = BENCH_DIR.parent
+RESULTS_FILE = BENCH_DIR / "results.jsonl"
+DATA_FILES = ['inventory.csv', 'recipes.csv', 'inventory_log.csv', 'sales_log.csv']
+
+# التراجع الذي يستحق التنبيه (نسبة الزمن الحالي إلى السابق)
+REGRESSION_RATIO = 1.25
+
+sys.path.insert(0, str(ROOT_DIR))
+sys.path.insert(0, str(BENCH_DIR))
+
+
+def _timeit(func, repeat, setup=None):
+    """تشغيل الدالة عدة مرات وإرجاع الأزمنة بالمللي ثانية"""
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def build_cases(engine, storage, cart_lines):
+    """تعريف حالات القياس: (الاسم، الدالة، دالة التهيئة، عدد التكرار الأقصى)"""
+    import numpy as np
+    import pandas as pd
+
+    recipes_df = storage.load_recipes()
+    inventory_df = storage.load_inventory()
+    sales_df = storage.load_sales_log()
+    inventory_log_df = storage.load_inventory_log()
+    dish_names = engine.get_dish_names(recipes_df)
+    cart = [
+        {'dish': dish_names[i % len(dish_names)], 'quantity': 1 + i % 3}
+        for i in range(cart_lines)
+    ]
+    recipe_matrix = engine.load_recipe_matrix()
+    needed = engine.calculate_cart_ingredients(
+        recipe_matrix, [item['dish'] for item in cart], [item['quantity'] for item in cart]
+    )
+    # مخزون يكفي نصف السلة فقط لقياس حل الجزء المتاح
+    scarce_inventory_df = inventory_df.assign(
+        Current_Stock=0.5 * needed.reindex(inventory_df['Ingredient']).fillna(0).to_numpy()
+    )
+
+    last_date = date.fromisoformat(sales_df['Date'].max())
+    sale_rows = engine.build_sales_log_rows(cart[:1])
+    sale_needed = engine.calculate_cart_ingredients(recipe_matrix, [cart[0]['dish']], [cart[0]['quantity']])
+    write_behind = storage.WriteBehindStorage(storage.get_storage(), interval=0.5)
+
+    def clear_cache():
+        storage._cache_entries.clear()
+
+    # سجل وصفات بنسختين لكل طبق: الحالية من البداية ونسخة معدلة من منتصف الفترة
+    middle_date = sorted(sales_df['Date'].unique())[len(sales_df['Date'].unique()) // 2]
+    recipe_history_df = pd.concat([
+        recipes_df.assign(Valid_From=storage.RECIPE_EPOCH),
+        recipes_df.assign(Valid_From=f"{middle_date} 12:00:00", Quantity_Needed=recipes_df['Quantity_Needed'] * 1.1),
+    ], ignore_index=True)[storage.RECIPE_HISTORY_COLUMNS]
+    recipe_versions = engine.compile_recipe_versions(recipe_history_df, recipes_df)
+    sale_seconds = engine.parse_log_timestamps(sales_df['Date'], sales_df['Time'])
+
+    # جرد افتتاحي قبل أول يوم في البيانات حتى يغطي تقرير الفرق كل السجل
+    storage.commit_stock_count(engine.prepare_stock_count(
+        inventory_df.set_index('Ingredient')['Current_Stock'], day='2000-01-01'
+    ))
+
+    def variance_report():
+        return engine.calculate_stock_variance(
+            storage.load_stock_counts(), storage.load_inventory_log_rollup(),
+            storage.load_consumption_rollup(), storage.load_inventory(), '2000-01-01'
+        )
+
+    # أربعة فروع بنفس البيانات لقياس دمج الملخصات الجزئية بالتسلسل وبالتوازي
+    branch_dirs = {f"branch-{i}": storage.get_storage().base_dir for i in range(4)}
+
+    # ملف توريد من 1000 سطر لقياس استيراد الوارد (تحقق + تحديث واحد + إلحاق واحد)
+    import_receipts = importlib.import_module('import_receipts')
+    delivery_path = storage.get_storage().base_dir / "delivery.csv"
+    pd.DataFrame({
+        'Ingredient': inventory_df['Ingredient'].astype(str).to_numpy()[np.arange(1000) % len(inventory_df)],
+        'Quantity': 1.0 + np.arange(1000) % 5,
+    }).to_csv(delivery_path, index=False, encoding='utf-8-sig')
+
+    def sales_log_page():
+        log_df, log_index = engine.load_log_with_index('sales_log', ['Date', 'Time'])
+        return engine.newest_first_page(log_df, log_index['order'], 1, 100)
+
+    return [
+        ('load_inventory (cold)', storage.load_inventory, clear_cache, None),
+        ('load_recipes (cold)', storage.load_recipes, clear_cache, None),
+        ('load_inventory_log (cold)', storage.load_inventory_log, clear_cache, None),
+        ('load_sales_log (cold)', storage.load_sales_log, clear_cache, None),
+        ('load_sales_log (cached)', storage.load_sales_log, None, None),
+        ('save_inventory', lambda: storage.save_inventory(inventory_df), None, None),
+        ('save_recipes', lambda: storage.save_recipes(recipes_df), None, None),
+        ('save_inventory_log', lambda: storage.save_inventory_log(inventory_log_df), None, 3),
+        ('save_sales_log', lambda: storage.save_sales_log(sales_df), None, 3),
+        ('compile_recipe_matrix', lambda: engine.compile_recipe_matrix(recipes_df), None, None),
+        ('calculate_ingredients_needed (1 dish)',
+         lambda: engine.calculate_ingredients_needed(recipes_df, dish_names[0], 2), None, None),
+        (f'calculate_cart_ingredients ({cart_lines} lines)',
+         lambda: engine.calculate_cart_ingredients(
+             recipe_matrix, [item['dish'] for item in cart], [item['quantity'] for item in cart]
+         ), None, None),
+        ('check_stock_availability', lambda: engine.check_stock_availability(inventory_df, needed), None, None),
+        ('update_stock', lambda: engine.update_stock(inventory_df, needed), None, None),
+        ('classify_stock_levels', lambda: engine.classify_stock_levels(inventory_df, 5), None, None),
+        ('load_stock_levels (cached)', lambda: engine.load_stock_levels(5), None, None),
+        ('calculate_dish_capacity (all dishes)',
+         lambda: engine.calculate_dish_capacity(recipe_matrix, inventory_df), None, None),
+        ('load_dish_capacity (cached)', engine.load_dish_capacity, None, None),
+        (f'resolve_feasible_cart ({cart_lines} lines, half stock)',
+         lambda: engine.resolve_feasible_cart(
+             recipe_matrix, scarce_inventory_df,
+             [item['dish'] for item in cart], [item['quantity'] for item in cart]
+         ), None, None),
+        ('import_receipts (1000-line file, dry run)',
+         lambda: import_receipts.import_receipts(delivery_path, storage.get_storage(), dry_run=True), None, None),
+        ('import_receipts (1000-line file)',
+         lambda: import_receipts.import_receipts(delivery_path, storage.get_storage()), None, None),
+        ('add_to_sales_log', lambda: engine.add_to_sales_log(cart[:5]), None, None),
+        ('commit_sale (direct)', lambda: storage.commit_sale(sale_needed, sale_rows), None, None),
+        ('commit_sale (write-behind)', lambda: write_behind.commit_sale(sale_needed, sale_rows), None, None),
+        ('write-behind flush (barrier)', write_behind.flush, None, None),
+        ('build_daily_consumption + fit_weekday_profile',
+         lambda: engine.fit_weekday_profile(
+             engine.build_daily_consumption(storage.load_sales_rollup(), recipe_matrix)
+         ), None, None),
+        ('load_demand_profile (cached)', engine.load_demand_profile, None, None),
+        ('calculate_reorder_plan',
+         lambda: engine.calculate_reorder_plan(engine.load_demand_profile(), inventory_df), None, None),
+        ('build_consumption_rows (whole sales log)',
+         lambda: engine.build_consumption_rows(recipe_matrix, sales_df), None, None),
+        ('rebuild_consumption_log', engine.rebuild_consumption_log, None, 3),
+        ('calculate_stock_variance (all history)', variance_report, None, None),
+        ('compile_recipe_versions', lambda: engine.compile_recipe_versions(recipe_history_df, recipes_df), None, None),
+        ('parse_log_timestamps (sales)',
+         lambda: engine.parse_log_timestamps(sales_df['Date'], sales_df['Time']), None, None),
+        ('recipe_version_positions (as-of, sales)',
+         lambda: engine.recipe_version_positions(recipe_versions, sales_df['Dish_Name'], sale_seconds), None, None),
+        ('build_historical_consumption_rows (sales)',
+         lambda: engine.build_historical_consumption_rows(recipe_versions, sales_df), None, None),
+        ('summarize_sales_by_dish', lambda: engine.summarize_sales_by_dish(sales_df), None, None),
+        ('summarize_sales_by_day', lambda: engine.summarize_sales_by_day(sales_df), None, None),
+        ('summarize_receipts_by_ingredient',
+         lambda: engine.summarize_receipts_by_ingredient(inventory_log_df), None, None),
+        ('load_sales_rollup (cold)', storage.load_sales_rollup, clear_cache, None),
+        ('summarize_sales_by_dish (rollup)',
+         lambda: engine.summarize_sales_by_dish(storage.load_sales_rollup()), None, None),
+        ('summarize_sales_by_day (rollup)',
+         lambda: engine.summarize_sales_by_day(storage.load_sales_rollup()), None, None),
+        ('consolidated_report (4 branches, serial)',
+         lambda: engine.consolidated_report(branch_dirs, workers=1), None, None),
+        ('consolidated_report (4 branches, process pool)',
+         lambda: engine.consolidated_report(branch_dirs, workers=4), None, 3),
+        ('sort sales history (Date, Time)',
+         lambda: sales_df.sort_values(['Date', 'Time'], ascending=[False, False]), None, None),
+        ('chronological_order (sales)',
+         lambda: engine.chronological_order([sales_df['Date'], sales_df['Time']]), None, None),
+        ('build_log_index (sales)',
+         lambda: engine.build_log_index(sales_df, ['Date', 'Time']), None, None),
+        ('sales log page (cached index)', lambda: sales_log_page(), None, None),
+        ('sales date range (last 30 days, cached index)',
+         lambda: engine.date_range_positions(
+             engine.load_log_with_index('sales_log', ['Date', 'Time'])[1], last_date - timedelta(days=29), last_date
+         ), None, None),
+        ('load_log_range (last 30 days, 2 columns)',
+         lambda: storage.load_log_range(
+             'sales_log', last_date - timedelta(days=29), last_date, ['Date', 'Quantity']
+         ), None, None),
+        ('sales date range (boolean scan)',
+         lambda: sales_df[(sales_df['Date'] >= str(last_date - timedelta(days=29)))
+                          & (sales_df['Date'] <= str(last_date))], None, None),
+    ]
+
+
+def measure_memory(storage, work_dir):
+    """ذاكرة السجلات كما تُحمَّل (بالأكواد) مقارنة بقراءتها كنصوص مباشرة (ميجابايت)"""
+    import pandas as pd
+
+    memory = {}
+    for table in ('sales_log', 'inventory_log'):
+        raw = pd.read_csv(work_dir / f"{table}.csv", encoding='utf-8-sig')
+        loaded = storage.get_storage().load(table, copy=False)
+        memory[table] = {
+            'raw_mb': round(raw.memory_usage(deep=True).sum() / 1e6, 2),
+            'loaded_mb': round(loaded.memory_usage(deep=True).sum() / 1e6, 2),
+        }
+    return memory
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=ROOT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _previous_run(results_file, params):
+    """آخر نتيجة محفوظة بنفس إعدادات البيانات"""
+    if not results_file.exists():
+        return None
+    previous = None
+    with open(results_file, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                if record.get('params') == params:
+                    previous = record
+    return previous
+
+
+def run(data_dir, params, repeat, cart_lines, results_file):
+    work_dir = Path(tempfile.mkdtemp(prefix='inventory-bench-'))
+    try:
+        for name in DATA_FILES:
+            shutil.copy(Path(data_dir) / name, work_dir / name)
+
+        storage = importlib.import_module('storage')
+        engine = importlib.import_module('engine')
+        storage.set_storage(storage.CsvStorage(work_dir))
+
+        results = {}
+        for name, func, setup, max_repeat in build_cases(engine, storage, cart_lines):
+            timings = _timeit(func, min(repeat, max_repeat or repeat), setup)
+            results[name] = {
+                'min_ms': round(min(timings), 3),
+                'median_ms': round(statistics.median(timings), 3),
+            }
+        memory = measure_memory(storage, work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    previous = _previous_run(results_file, params)
+    record = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'revision': _git_revision(),
+        'params': params,
+        'results': results,
+        'memory': memory,
+    }
+    with open(results_file, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    print(f"{'case':<45}{'median ms':>12}{'min ms':>12}{'vs prev':>10}")
+    regressions = 0
+    for name, timing in results.items():
+        change = ''
+        if previous and name in previous['results']:
+            ratio = timing['median_ms'] / max(previous['results'][name]['median_ms'], 1e-9)
+            change = f"{ratio:.2f}x"
+            if ratio > REGRESSION_RATIO:
+                change += ' !'
+                regressions += 1
+        print(f"{name:<45}{timing['median_ms']:>12.3f}{timing['min_ms']:>12.3f}{change:>10}")
+    print()
+    for table, usage in memory.items():
+        print(f"{table + ' memory (MB)':<45}{'raw':>12}{usage['raw_mb']:>12.2f}"
+              f"{'loaded':>10}{usage['loaded_mb']:>8.2f}")
+    if previous:
+        print(f"\ncompared with {previous['timestamp']} ({previous.get('revision')}); "
+              f"{regressions} case(s) slower than {REGRESSION_RATIO}x")
+    return regressions
+
+
+if __name__ == "__main__":
+    from generate_data import add_arguments, generate_from_args
+
+    parser = argparse.ArgumentParser(description="قياس أداء النظام")
+    parser.add_argument('--data-dir', default=None, help="استخدام بيانات جاهزة بدلاً من توليدها")
+    parser.add_argument('--repeat', type=int, default=5, help="عدد مرات تكرار كل قياس")
+    parser.add_argument('--cart-lines', type=int, default=50, help="عدد أسطر سلة المبيعات")
+    parser.add_argument('--results', default=str(RESULTS_FILE), help="ملف حفظ النتائج")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.data_dir:
+        data_dir = Path(args.data_dir)
+        params = {'data_dir': str(data_dir.resolve()), 'cart_lines': args.cart_lines}
+    else:
+        data_dir = Path(tempfile.mkdtemp(prefix='inventory-data-'))
+        generate_from_args(data_dir, args)
+        params = {
+            'ingredients': args.ingredients, 'dishes': args.dishes, 'fanout': args.fanout,
+            'sales_rows': args.sales_rows, 'receipt_rows': args.receipt_rows,
+            'days': args.days, 'seed': args.seed, 'cart_lines': args.cart_lines,
+        }
+
+    try:
+        regressions = run(data_dir, params, args.repeat, args.cart_lines, Path(args.results))
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+    sys.exit(1 if regressions else 0)
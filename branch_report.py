@@ -0,0 +1,58 @@
+"""
+التقرير المجمع لكل الفروع - نظام إدارة مخزون المطعم
+Consolidated cross-branch report - Restaurant Inventory Management System
+
+يحسب ملخص المبيعات والوارد لكل فرع في عملية مستقلة بالتوازي، ثم يدمج
+الملخصات الجزئية في تقرير واحد ويطبعه أو يحفظه كملفات CSV.
+
+    python branch_report.py
+    python branch_report.py --start 2024-01-01 --end 2024-01-31 --out hq-report
+"""
+
+import argparse
+import sys
+import time
+from datetime import date
+from pathlib import Path
+
+from engine import consolidated_report
+from storage import MAIN_BRANCH_NAME, branch_dir, list_branches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="التقرير المجمع لكل الفروع")
+    parser.add_argument('--start', type=date.fromisoformat, default=None, help="من تاريخ YYYY-MM-DD")
+    parser.add_argument('--end', type=date.fromisoformat, default=None, help="إلى تاريخ YYYY-MM-DD")
+    parser.add_argument('--branch', action='append', default=None,
+                        help="الفروع المطلوبة (يمكن تكراره، الافتراضي: كل الفروع مع الرئيسي)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="عدد العمليات المتوازية (الافتراضي: بالتوازي لعدد كبير من الفروع فقط)")
+    parser.add_argument('--backend', choices=['csv', 'sqlite'], default=None, help="نوع التخزين")
+    parser.add_argument('--out', default=None, help="حفظ جداول التقرير كملفات CSV في هذا المجلد")
+    args = parser.parse_args(argv)
+
+    branches = args.branch or [MAIN_BRANCH_NAME] + list_branches()
+    data_dirs = {
+        branch: branch_dir(None if branch == MAIN_BRANCH_NAME else branch) for branch in branches
+    }
+
+    started = time.perf_counter()
+    report = consolidated_report(data_dirs, args.start, args.end, args.backend, args.workers)
+    elapsed = time.perf_counter() - started
+
+    if args.out:
+        out_dir = Path(args.out)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        for name, table in report.items():
+            table.to_csv(out_dir / f"{name}.csv", index=False, encoding='utf-8-sig')
+        print(f"تم حفظ التقرير في {out_dir}")
+    else:
+        print(report['branches'].to_string(index=False))
+        print()
+        print(report['sales_by_dish'].head(20).to_string(index=False))
+    print(f"{len(data_dirs)} فرع | {elapsed:.2f} ثانية", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,849 @@
+"""
+محرك المخزون - نظام إدارة مخزون المطعم
+Stock engine - Restaurant Inventory Management System
+
+حساب المكونات والتحقق من المخزون وبناء صفوف السجلات وملخصاتها وفهرستها.
+لا يعتمد على Streamlit ولا ينفذ أي شيء عند استيراده، فتستخدمه الواجهة
+وأدوات سطر الأوامر وأدوات القياس.
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from profiler import instrument
+from storage import (
+    INVENTORY_LOG_COLUMNS, SALES_LOG_COLUMNS, CONSUMPTION_LOG_COLUMNS, STOCK_COUNT_COLUMNS, RECIPE_EPOCH,
+    get_storage, open_storage, load_inventory, load_recipes, load_recipe_history, load_sales_rollup, load_stock_thresholds,
+    save_consumption_log,
+    append_log_rows, apply_stock_changes,
+)
+
+# إعدادات توقع الطلب: عدد الأسابيع السابقة التي يُبنى عليها نمط أيام الأسبوع،
+# ومدة التوريد والمدة التي يغطيها كل طلب، ومعامل مخزون الأمان (~95%)
+FORECAST_WEEKS = 8
+REORDER_LEAD_DAYS = 2
+REORDER_COVER_DAYS = 7
+SAFETY_FACTOR = 1.65
+COVER_HORIZON_DAYS = 90
+
+# درجات المخزون: نفد (صفر أو أقل)، حرج (أقل من نسبة من الحد)، منخفض (أقل من الحد)، كافٍ
+STOCK_OUT, STOCK_CRITICAL, STOCK_LOW, STOCK_OK = 0, 1, 2, 3
+CRITICAL_RATIO = 0.5
+
+# التقرير المجمع يوزع الفروع على عمليات متوازية من هذا العدد فقط، فالفروع القليلة
+# أسرع في نفس العملية خاصة وملخصاتها محفوظة في الذاكرة المؤقتة
+PARALLEL_REPORT_BRANCHES = 8
+
+# عدد آخر الفترات المحفوظة مؤقتاً لكل سجل في صفحات السجلات، وقائمتها مشتركة
+# بين جميع الجلسات فتُعدَّل تحت قفل
+RECENT_LOG_RANGES = 4
+_recent_ranges_lock = threading.Lock()
+
+
+# ========== دوال السجلات ==========
+
+def build_sales_log_rows(sales_cart, notes=""):
+    """تحويل سلة المبيعات إلى صفوف سجل المبيعات"""
+    today = datetime.now().strftime('%Y-%m-%d')
+    now_time = datetime.now().strftime('%H:%M:%S')
+    
+    new_rows = []
+    for item in sales_cart:
+        new_rows.append({
+            'Date': today,
+            'Time': now_time,
+            'Dish_Name': item['dish'],
+            'Quantity': item['quantity'],
+            'Notes': notes
+        })
+    
+    return pd.DataFrame(new_rows, columns=SALES_LOG_COLUMNS)
+
+
+def add_to_sales_log(sales_cart, notes=""):
+    """إضافة مبيعات للسجل"""
+    new_df = build_sales_log_rows(sales_cart, notes)
+    append_log_rows('sales_log', new_df)
+    append_log_rows('consumption_log', build_consumption_rows(load_recipe_matrix(), new_df))
+    return new_df
+
+
+def build_inventory_log_rows(items_list, notes=""):
+    """تحويل قائمة الوارد إلى صفوف سجل الوارد"""
+    today = datetime.now().strftime('%Y-%m-%d')
+    new_rows = []
+    
+    for item in items_list:
+        new_rows.append({
+            'Date': today,
+            'Ingredient': item['ingredient'],
+            'Quantity_Added': item['quantity'],
+            'Unit': item['unit'],
+            'Notes': notes
+        })
+    
+    return pd.DataFrame(new_rows, columns=INVENTORY_LOG_COLUMNS)
+
+
+def add_to_inventory_log(items_list, notes=""):
+    """إضافة سجلات للوارد"""
+    new_df = build_inventory_log_rows(items_list, notes)
+    append_log_rows('inventory_log', new_df)
+    return new_df
+
+
+# ========== حساب المكونات والمخزون ==========
+
+def get_dish_names(recipes_df):
+    """الحصول على قائمة أسماء الأطباق"""
+    return recipes_df['Dish_Name'].unique().tolist()
+
+
+def compile_recipe_matrix(recipes_df):
+    """تحويل الوصفات إلى مصفوفة (أطباق × مكونات) للحساب دفعة واحدة"""
+    dish_codes, dishes = pd.factorize(recipes_df['Dish_Name'])
+    ingredient_codes, ingredients = pd.factorize(recipes_df['Ingredient'])
+    
+    matrix = np.zeros((len(dishes), len(ingredients)))
+    np.add.at(matrix, (dish_codes, ingredient_codes), recipes_df['Quantity_Needed'].to_numpy(dtype=float))
+    matrix.flags.writeable = False
+    
+    return {
+        'dishes': pd.Index(dishes),
+        'ingredients': pd.Index(ingredients),
+        'matrix': matrix
+    }
+
+
+def load_recipe_matrix():
+    """تحميل مصفوفة الوصفات (يعاد بناؤها فقط عند تغير الوصفات)"""
+    return get_storage().cached(
+        'recipes', 'matrix', lambda: compile_recipe_matrix(load_recipes())
+    )
+
+
+def calculate_cart_ingredients(recipe_matrix, dishes, quantities):
+    """حساب إجمالي المكونات المطلوبة لعدة أطباق بضرب مصفوفة واحد"""
+    dish_index = recipe_matrix['dishes'].get_indexer(pd.Index(dishes))
+    quantities = np.asarray(quantities, dtype=float)
+    known = dish_index >= 0
+    
+    dish_totals = np.bincount(
+        dish_index[known],
+        weights=quantities[known],
+        minlength=len(recipe_matrix['dishes'])
+    )
+    demand = dish_totals @ recipe_matrix['matrix']
+    
+    used = (recipe_matrix['matrix'][dish_totals > 0] != 0).any(axis=0)
+    return pd.Series(demand[used], index=recipe_matrix['ingredients'][used])
+
+
+def calculate_ingredients_needed(recipes_df, dish_name, quantity_sold):
+    """حساب المكونات المطلوبة لطبق معين"""
+    dish_recipe = recipes_df[recipes_df['Dish_Name'] == dish_name]
+    ingredients_needed = {}
+    
+    for _, row in dish_recipe.iterrows():
+        ingredient = row['Ingredient']
+        qty_per_dish = row['Quantity_Needed']
+        total_needed = qty_per_dish * quantity_sold
+        ingredients_needed[ingredient] = total_needed
+    
+    return ingredients_needed
+
+
+def check_stock_availability(inventory_df, ingredients_needed):
+    """التحقق من توفر المخزون"""
+    needed = pd.Series(ingredients_needed, dtype=float)
+    if needed.empty:
+        return []
+    
+    # مطابقة المكونات المطلوبة مع المخزون دفعة واحدة عبر فهرس المكونات
+    stock = inventory_df.drop_duplicates('Ingredient').set_index('Ingredient')
+    available = stock['Current_Stock'].reindex(needed.index)
+    units = stock['Unit'].reindex(needed.index)
+    missing = ~needed.index.isin(stock.index)
+    short = ~missing & (available.to_numpy() < needed.to_numpy())
+    
+    warnings = []
+    for ingredient, needed_qty, current_stock, unit, is_missing, is_short in zip(
+        needed.index, needed, available, units, missing, short
+    ):
+        if is_missing:
+            warnings.append(f"⚠️ المكون '{ingredient}' غير موجود في المخزون!")
+        elif is_short:
+            warnings.append(
+                f"⚠️ المخزون غير كافٍ: '{ingredient}' - "
+                f"المتوفر: {current_stock:.2f} {unit} | "
+                f"المطلوب: {needed_qty:.2f} {unit}"
+            )
+    
+    return warnings
+
+
+def update_stock(inventory_df, ingredients_needed):
+    """تحديث المخزون بعد البيع"""
+    return apply_stock_changes(inventory_df, -pd.Series(ingredients_needed, dtype=float))
+
+
+def resolve_feasible_cart(recipe_matrix, inventory_df, dishes, quantities):
+    """أكبر كمية يمكن تنفيذها من كل سطر في السلة بالمخزون الحالي
+    
+    الأسطر تُخدم بترتيبها في السلة: كل سطر يأخذ أكبر عدد صحيح من الحصص يسمح به
+    المتبقي من المكونات المشتركة ثم يُخصم من المتبقي قبل السطر التالي. يُحسب
+    المتبقي فقط على أعمدة المكونات التي تستخدمها أطباق السلة.
+    """
+    dish_index = recipe_matrix['dishes'].get_indexer(pd.Index(dishes))
+    quantities = np.asarray(quantities, dtype=float)
+    feasible = np.where(dish_index >= 0, quantities, 0.0)
+    if not len(feasible):
+        return feasible
+    
+    needs = recipe_matrix['matrix'][np.maximum(dish_index, 0)]
+    needs[dish_index < 0] = 0.0
+    used = (needs > 0).any(axis=0)
+    needs = needs[:, used]
+    
+    stock = inventory_df.drop_duplicates('Ingredient').set_index('Ingredient')['Current_Stock']
+    remaining = stock.astype(float).reindex(recipe_matrix['ingredients'][used]).fillna(0.0).clip(lower=0.0).to_numpy(copy=True)
+    
+    # السلة كلها متاحة: لا حاجة للمرور على الأسطر
+    if (feasible @ needs <= remaining + 1e-9).all():
+        return feasible
+    
+    for line, need in enumerate(needs):
+        positive = need > 0
+        if feasible[line] <= 0 or not positive.any():
+            continue
+        fit = np.floor((remaining[positive] / need[positive]).min() + 1e-9)
+        feasible[line] = min(feasible[line], fit)
+        remaining -= feasible[line] * need
+    
+    return feasible
+
+
+def classify_stock_levels(inventory_df, threshold, thresholds_df=None):
+    """درجة مخزون كل المكونات دفعة واحدة حسب حد كل مكون (أو الحد العام إن لم يكن له حد)
+    
+    النسبة = المخزون ÷ الحد، لترتيب التنبيهات من الأخطر داخل كل درجة.
+    """
+    stock = inventory_df['Current_Stock'].to_numpy(dtype=float)
+    limits = np.full(len(inventory_df), float(threshold))
+    if thresholds_df is not None and not thresholds_df.empty:
+        custom = thresholds_df.drop_duplicates('Ingredient', keep='last').set_index('Ingredient')['Min_Stock']
+        custom = custom.rename(index=str).reindex(inventory_df['Ingredient'].astype(str)).to_numpy(dtype=float)
+        limits = np.where(np.isnan(custom), limits, custom)
+    
+    severity = np.select(
+        [stock <= 0, stock < limits * CRITICAL_RATIO, stock < limits],
+        [STOCK_OUT, STOCK_CRITICAL, STOCK_LOW],
+        STOCK_OK
+    )
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(limits > 0, stock / limits, np.inf)
+    
+    return pd.DataFrame({
+        'Ingredient': inventory_df['Ingredient'].to_numpy(),
+        'Current_Stock': stock,
+        'Unit': inventory_df['Unit'].to_numpy(),
+        'Min_Stock': limits,
+        'Severity': severity,
+        'Ratio': ratio
+    })
+
+
+def load_stock_levels(threshold):
+    """درجات المخزون لحد عام معين (يعاد حسابها فقط عند تغير المخزون أو الحدود)"""
+    return get_storage().cached(
+        ('inventory', 'stock_thresholds'), f'stock_levels_{threshold}',
+        lambda: classify_stock_levels(load_inventory(), threshold, load_stock_thresholds())
+    )
+
+
+def calculate_dish_capacity(recipe_matrix, inventory_df):
+    """عدد الحصص الممكن تحضيرها من كل طبق بالمخزون الحالي والمكون الذي ينفد أولاً
+    
+    يُحسب لكل الأطباق دفعة واحدة: المخزون ÷ الكمية لكل خلية في مصفوفة الوصفات ثم
+    أصغر قيمة في كل صف. المكون غير الموجود في المخزون يُعامل كرصيد صفر.
+    """
+    stock = inventory_df.drop_duplicates('Ingredient').set_index('Ingredient')['Current_Stock']
+    available = stock.astype(float).reindex(recipe_matrix['ingredients']).fillna(0.0).clip(lower=0.0).to_numpy()
+    matrix = recipe_matrix['matrix']
+    
+    with np.errstate(divide='ignore'):
+        portions = np.where(matrix > 0, available / np.where(matrix > 0, matrix, 1.0), np.inf)
+    bottleneck = portions.argmin(axis=1)
+    capacity = portions[np.arange(len(matrix)), bottleneck]
+    limited = np.isfinite(capacity)
+    
+    # هامش صغير حتى لا تتحول 0.3 ÷ 0.1 = 2.9999 إلى حصتين
+    return pd.DataFrame({
+        'Dish_Name': recipe_matrix['dishes'],
+        'Portions': np.where(limited, np.floor(np.where(limited, capacity, 0.0) + 1e-9), np.nan),
+        'Bottleneck': np.where(limited, recipe_matrix['ingredients'].to_numpy()[bottleneck], None),
+        'Bottleneck_Stock': np.where(limited, available[bottleneck], np.nan),
+    })
+
+
+def load_dish_capacity():
+    """الطاقة الإنتاجية لكل الأطباق (يعاد حسابها فقط عند تغير المخزون أو الوصفات)"""
+    return get_storage().cached(
+        ('inventory', 'recipes'), 'capacity',
+        lambda: calculate_dish_capacity(load_recipe_matrix(), load_inventory())
+    )
+
+
+# ========== ملخصات السجلات ==========
+
+def summarize_receipts_by_ingredient(log_df):
+    """ملخص كميات الوارد حسب المكون"""
+    summary = log_df.groupby('Ingredient', observed=True).agg({
+        'Quantity_Added': 'sum'
+    }).reset_index()
+    summary.columns = ['المكون', 'إجمالي الكمية']
+    return summary.sort_values('المكون', key=lambda names: names.astype(str))
+
+
+def summarize_sales_by_dish(sales_df):
+    """ملخص المبيعات حسب الطبق (الأكثر مبيعاً أولاً)"""
+    summary = sales_df.groupby('Dish_Name', observed=True).agg({
+        'Quantity': 'sum'
+    }).reset_index()
+    summary.columns = ['الطبق', 'إجمالي الكمية']
+    return summary.sort_values('إجمالي الكمية', ascending=False)
+
+
+def summarize_sales_by_day(sales_df):
+    """ملخص المبيعات حسب اليوم (الأحدث أولاً)"""
+    daily_summary = sales_df.groupby('Date').agg({
+        'Quantity': 'sum'
+    }).reset_index()
+    daily_summary.columns = ['التاريخ', 'إجمالي الأطباق']
+    return daily_summary.sort_values('التاريخ', ascending=False)
+
+
+# ========== فهرسة السجلات ==========
+
+def chronological_order(sort_keys):
+    """مواضع صفوف السجل مرتبة زمنياً (تصاعدياً) حسب أعمدة الترتيب (الأهم أولاً)
+    
+    السجل يُكتب بالإضافة في آخره فيكون مرتباً عادةً، فيكفي التحقق من ذلك بمرور
+    واحد، ولا يُفرز فرزاً كاملاً إلا إذا عُدِّل الملف يدوياً.
+    """
+    keys = []
+    in_order = np.ones(max(len(sort_keys[0]) - 1, 0), dtype=bool)
+    for values in reversed(sort_keys):
+        # أكواد مرتبة بنفس ترتيب القيم، والمقارنة عليها أسرع بكثير
+        codes = pd.factorize(values, sort=True)[0]
+        keys.append(codes)
+        in_order = (codes[1:] > codes[:-1]) | ((codes[1:] == codes[:-1]) & in_order)
+    
+    if in_order.all():
+        return np.arange(len(sort_keys[0]))
+    return np.lexsort(keys)
+
+
+def parse_log_dates(dates):
+    """تحويل عمود التاريخ النصي إلى أرقام أيام (تحليل كل تاريخ مختلف مرة واحدة فقط)
+    
+    التواريخ الفارغة أو غير الصالحة تأخذ أصغر قيمة فتأتي أول الترتيب.
+    """
+    codes, unique_dates = pd.factorize(dates)
+    parsed = pd.to_datetime(pd.Series(unique_dates, dtype=object), format='%Y-%m-%d', errors='coerce')
+    days = np.append(parsed.to_numpy().astype('datetime64[D]'), np.datetime64('NaT', 'D'))
+    return days.astype(np.int64)[codes]
+
+
+def build_log_index(log_df, sort_columns):
+    """فهرس زمني للسجل: مواضع الصفوف مرتبة زمنياً وأيامها بنفس الترتيب للبحث الثنائي"""
+    days = parse_log_dates(log_df['Date'])
+    order = chronological_order([days] + [log_df[column] for column in sort_columns[1:]])
+    return {
+        'order': order,
+        'days': days[order]
+    }
+
+
+def load_log_with_index(table, sort_columns):
+    """تحميل السجل (للقراءة فقط) مع فهرسه الزمني المخزن مؤقتاً حتى يتغير السجل"""
+    store = get_storage()
+    log_df = store.load(table, copy=False)
+    log_index = store.cached(
+        table, ('index', tuple(sort_columns)), lambda: build_log_index(store.load(table, copy=False), sort_columns)
+    )
+    if len(log_index['order']) != len(log_df):
+        log_index = build_log_index(log_df, sort_columns)
+    return log_df, log_index
+
+
+def load_log_range_with_index(table, sort_columns, start=None, end=None, columns=None):
+    """تحميل صفوف السجل في الفترة فقط (من الأشهر المؤرشفة التي تتقاطع معها) مع فهرسها الزمني
+
+    آخر الفترات المطلوبة تُحفظ مؤقتاً حتى يتغير السجل، وبدون فترة يُحمَّل السجل كاملاً.
+    """
+    if start is None and end is None:
+        return load_log_with_index(table, sort_columns)
+    store = get_storage()
+    recent = store.cached(table, ('range_index', tuple(sort_columns)), dict)
+    key = (str(start), str(end), tuple(columns or ()))
+    with _recent_ranges_lock:
+        entry = recent.get(key)
+    if entry is None:
+        rows = store.load_range(table, start, end, columns)
+        entry = (rows, build_log_index(rows, sort_columns))
+        with _recent_ranges_lock:
+            while len(recent) >= RECENT_LOG_RANGES:
+                del recent[next(iter(recent))]
+            recent[key] = entry
+    return entry
+
+
+def _day_number(day):
+    return np.datetime64(day, 'D').astype(np.int64)
+
+
+def date_range_positions(log_index, start=None, end=None):
+    """مواضع صفوف السجل بين تاريخين (شاملين) بالبحث الثنائي في الفهرس المرتب"""
+    days = log_index['days']
+    first = 0 if start is None else np.searchsorted(days, _day_number(start), side='left')
+    last = len(days) if end is None else np.searchsorted(days, _day_number(end), side='right')
+    return log_index['order'][first:last]
+
+
+def filter_rollup_by_date(rollup_df, start=None, end=None):
+    """تطبيق نفس الفترة الزمنية على ملخص السجل اليومي"""
+    if start is None and end is None:
+        return rollup_df
+    days = parse_log_dates(rollup_df['Date'])
+    mask = np.ones(len(rollup_df), dtype=bool)
+    if start is not None:
+        mask &= days >= _day_number(start)
+    if end is not None:
+        mask &= days <= _day_number(end)
+    return rollup_df[mask]
+
+
+def newest_first_page(log_df, positions, page, page_size):
+    """صفوف الصفحة المطلوبة (الأحدث أولاً) من مواضع مرتبة تصاعدياً"""
+    end = len(positions) - (page - 1) * page_size
+    start = max(end - page_size, 0)
+    return log_df.iloc[positions[start:max(end, 0)][::-1]]
+
+
+def matching_rows(log_df, positions, column, value):
+    """مقارنة عمود بقيمة على الصفوف المحددة فقط (بالأكواد إذا كان العمود مرمَّزاً)"""
+    values = log_df[column]
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        code = values.cat.categories.get_indexer([value])[0]
+        if code < 0:
+            return np.zeros(len(positions), dtype=bool)
+        return values.cat.codes.to_numpy()[positions] == code
+    return values.to_numpy()[positions] == value
+
+
+# ========== سجل الاستهلاك والجرد ==========
+
+def _positions(index, values):
+    """موضع كل قيمة في الفهرس (-1 لغير الموجود)؛ العمود المرمَّز يُبحث عن كل اسم فيه مرة واحدة"""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        positions = index.get_indexer(values.cat.categories)
+        return np.append(positions, -1)[values.cat.codes.to_numpy()]
+    return index.get_indexer(pd.Index(values))
+
+
+def _usage_by_day(sales_rows, row_index, matrix, ingredients):
+    """استهلاك المكونات لكل يوم: الكميات مجمعة لكل (يوم، صف في المصفوفة) ثم ضرب مصفوفة واحد"""
+    day_codes, days = pd.factorize(sales_rows['Date'], sort=True)
+    quantities = pd.to_numeric(sales_rows['Quantity'], errors='coerce').to_numpy(dtype=float)
+    known = (day_codes >= 0) & (row_index >= 0) & ~np.isnan(quantities)
+    
+    n_rows = len(matrix)
+    daily = np.bincount(
+        day_codes[known] * n_rows + row_index[known],
+        weights=quantities[known],
+        minlength=len(days) * n_rows
+    ).reshape(len(days), n_rows)
+    usage = daily @ matrix
+    
+    day_position, ingredient_position = np.nonzero(usage)
+    return pd.DataFrame({
+        'Date': np.asarray(days, dtype=object)[day_position],
+        'Ingredient': ingredients[ingredient_position],
+        'Quantity_Used': usage[day_position, ingredient_position]
+    }, columns=CONSUMPTION_LOG_COLUMNS)
+
+
+def build_consumption_rows(recipe_matrix, sales_rows):
+    """تحويل صفوف المبيعات إلى صفوف سجل الاستهلاك (يوم × مكون) حسب الوصفات الحالية"""
+    dish_index = _positions(recipe_matrix['dishes'], sales_rows['Dish_Name'])
+    return _usage_by_day(sales_rows, dish_index, recipe_matrix['matrix'], recipe_matrix['ingredients'])
+
+
+def build_historical_consumption_rows(recipe_versions, sales_rows):
+    """صفوف سجل الاستهلاك لمبيعات سابقة حسب نسخة الوصفة السارية وقت كل بيع"""
+    positions = recipe_version_positions(
+        recipe_versions, sales_rows['Dish_Name'],
+        parse_log_timestamps(sales_rows['Date'], sales_rows['Time'])
+    )
+    return _usage_by_day(sales_rows, positions, recipe_versions['matrix'], recipe_versions['ingredients'])
+
+
+def rebuild_consumption_log():
+    """إعادة بناء سجل الاستهلاك من سجل المبيعات كاملاً (للمبيعات السابقة لوجود السجل)"""
+    rows = build_historical_consumption_rows(
+        load_recipe_versions(), get_storage().load('sales_log', copy=False)
+    )
+    save_consumption_log(rows)
+    return len(rows)
+
+
+def prepare_stock_count(counted_stock, day=None):
+    """صفوف سجل الجرد لكميات معدودة لكل مكون (الفرق عن المخزون يُحسب عند الحفظ)"""
+    counted = pd.Series(counted_stock, dtype=float)
+    return pd.DataFrame({
+        'Date': str(day or date.today()),
+        'Ingredient': counted.index,
+        'Counted_Stock': counted.to_numpy()
+    }, columns=STOCK_COUNT_COLUMNS)
+
+
+def calculate_stock_variance(counts_df, receipts_rollup_df, consumption_rollup_df, inventory_df, count_date):
+    """الفرق بين المخزون الفعلي والمتوقع منذ جرد معين لكل مكون
+    
+    المتوقع = رصيد الجرد + الوارد − الاستهلاك النظري في الأيام التالية ليوم الجرد
+    (الجرد يُعتبر رصيد نهاية اليوم). الفرق السالب يعني فاقداً أو هدراً.
+    يُحسب من الملخصات اليومية فلا يتأثر زمنه بعدد صفوف السجلات.
+    """
+    count_date = str(count_date)
+    count = counts_df[counts_df['Date'].astype(str) == count_date]
+    opening = count.drop_duplicates('Ingredient', keep='last').set_index('Ingredient')['Counted_Stock']
+    receipts = receipts_rollup_df[receipts_rollup_df['Date'] > count_date].groupby(
+        'Ingredient', observed=True)['Quantity_Added'].sum()
+    usage = consumption_rollup_df[consumption_rollup_df['Date'] > count_date].groupby(
+        'Ingredient', observed=True)['Quantity_Used'].sum()
+    
+    inventory_df = inventory_df.drop_duplicates('Ingredient')
+    ingredients = pd.Index(inventory_df['Ingredient'].astype(str))
+    # الملخص الفارغ يُقرأ بأعمدة نصية فتُحوَّل القيم إلى أرقام صراحة
+    opening = opening.rename(index=str).reindex(ingredients).astype(float)
+    receipts = receipts.rename(index=str).reindex(ingredients).fillna(0.0).astype(float)
+    usage = usage.rename(index=str).reindex(ingredients).fillna(0.0).astype(float)
+    
+    expected = opening + receipts - usage
+    actual = inventory_df['Current_Stock'].to_numpy(dtype=float)
+    variance = actual - expected.to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variance_pct = np.where(usage.to_numpy() > 0, variance / usage.to_numpy() * 100, np.nan)
+    
+    return pd.DataFrame({
+        'Ingredient': ingredients,
+        'Unit': inventory_df['Unit'].to_numpy(),
+        'Opening_Stock': opening.to_numpy(),
+        'Received': receipts.to_numpy(),
+        'Theoretical_Usage': usage.to_numpy(),
+        'Expected_Stock': expected.to_numpy(),
+        'Actual_Stock': actual,
+        'Variance': variance,
+        'Variance_Pct': variance_pct
+    })
+
+
+# ========== نسخ الوصفات ==========
+
+# مسافة مفتاح كل طبق في المفاتيح المركبة (طبق، ثانية): 2^33 ثانية تكفي حتى سنة 2242
+_VERSION_KEY_STEP = 2 ** 33
+_OPEN_ENDED = np.iinfo(np.int64).max
+
+
+def _parse_seconds(values):
+    """تحويل نصوص الوقت الكامل (YYYY-MM-DD HH:MM:SS) إلى ثوانٍ (كل قيمة مختلفة مرة واحدة)"""
+    codes, unique_values = pd.factorize(values)
+    parsed = pd.to_datetime(pd.Series(unique_values, dtype=object), errors='coerce')
+    seconds = parsed.to_numpy().astype('datetime64[s]').astype(np.int64)
+    return np.append(seconds, np.iinfo(np.int64).min)[codes]
+
+
+def _clock_seconds(times):
+    """ثواني اليوم لنصوص الوقت؛ الصيغة HH:MM:SS تُحسب من أكواد الحروف مباشرة وغيرها يُحلل عادياً"""
+    chars = np.asarray(times, dtype='U9').view(np.uint32).reshape(-1, 9).astype(np.int64) - ord('0')
+    digits = chars[:, [0, 1, 3, 4, 6, 7]]
+    standard = (
+        ((digits >= 0) & (digits <= 9)).all(axis=1)
+        & (chars[:, 2] == ord(':') - ord('0')) & (chars[:, 5] == ord(':') - ord('0'))
+        & (chars[:, 8] == -ord('0'))
+    )
+    seconds = digits @ np.array([36000, 3600, 600, 60, 10, 1])
+    if not standard.all():
+        parsed = pd.to_timedelta(pd.Series(np.asarray(times, dtype=object)[~standard]), errors='coerce')
+        seconds[~standard] = parsed.dt.total_seconds().fillna(0).to_numpy(dtype=np.int64)
+    return seconds
+
+
+def parse_log_timestamps(dates, times):
+    """ثواني كل صف في السجل من عمودي التاريخ والوقت (الوقت الفارغ = بداية اليوم)"""
+    days = parse_log_dates(dates)
+    time_codes, unique_times = pd.factorize(times)
+    seconds = np.append(_clock_seconds(unique_times), 0)[time_codes]
+    valid = days != np.iinfo(np.int64).min
+    return np.where(valid, days * 86400 + seconds, np.iinfo(np.int64).min)
+
+
+def compile_recipe_versions(history_df, recipes_df):
+    """تحويل سجل نسخ الوصفات إلى مصفوفة (نسخ × مكونات) مع بداية ونهاية كل نسخة
+    
+    النسخ مرتبة بمفتاح مركب (طبق، بداية النسخة) فيكفي بحث ثنائي واحد لكل صفوف
+    المبيعات. إذا كان السجل فارغاً تكون الوصفات الحالية نسخة واحدة من RECIPE_EPOCH.
+    """
+    if history_df.empty:
+        history_df = recipes_df.assign(Valid_From=RECIPE_EPOCH)
+    
+    dish_codes, dishes = pd.factorize(history_df['Dish_Name'].astype(str))
+    starts = np.clip(_parse_seconds(history_df['Valid_From']), 0, _VERSION_KEY_STEP - 1)
+    version_codes, version_keys = pd.factorize(dish_codes * _VERSION_KEY_STEP + starts, sort=True)
+    version_keys = np.asarray(version_keys)
+    
+    # صف الطبق المحذوف بلا مكون: نسخة فارغة
+    has_ingredient = history_df['Ingredient'].notna().to_numpy() & (history_df['Ingredient'].astype(str) != '').to_numpy()
+    ingredient_codes, ingredients = pd.factorize(history_df['Ingredient'][has_ingredient].astype(str))
+    matrix = np.zeros((len(version_keys), len(ingredients)))
+    np.add.at(
+        matrix, (version_codes[has_ingredient], ingredient_codes),
+        history_df['Quantity_Needed'].to_numpy(dtype=float)[has_ingredient]
+    )
+    matrix.flags.writeable = False
+    
+    version_dish = version_keys // _VERSION_KEY_STEP
+    valid_from = version_keys % _VERSION_KEY_STEP
+    same_dish_next = np.append(version_dish[1:] == version_dish[:-1], False)
+    valid_to = np.where(same_dish_next, np.append(valid_from[1:], 0), _OPEN_ENDED)
+    
+    return {
+        'dishes': pd.Index(dishes),
+        'ingredients': pd.Index(ingredients),
+        'matrix': matrix,
+        'keys': version_keys,
+        'version_dish': version_dish,
+        'valid_from': valid_from,
+        'valid_to': valid_to
+    }
+
+
+def load_recipe_versions():
+    """تحميل مصفوفة نسخ الوصفات (يعاد بناؤها فقط عند تعديل الوصفات)"""
+    return get_storage().cached(
+        ('recipe_history', 'recipes'), 'versions',
+        lambda: compile_recipe_versions(load_recipe_history(), load_recipes())
+    )
+
+
+def recipe_version_positions(recipe_versions, dish_names, timestamps):
+    """رقم نسخة الوصفة السارية وقت كل بيع (-1 للطبق غير الموجود في السجل)
+    
+    ربط زمني (as-of) بالبحث الثنائي في المفاتيح المركبة المرتبة دون فرز المبيعات.
+    البيع الأقدم من أول نسخة للطبق يأخذ أول نسخة.
+    """
+    dish_index = _positions(recipe_versions['dishes'], dish_names)
+    seconds = np.clip(np.asarray(timestamps), 0, _VERSION_KEY_STEP - 1)
+    keys = recipe_versions['keys']
+    
+    position = np.searchsorted(keys, dish_index * _VERSION_KEY_STEP + seconds, side='right') - 1
+    before_first = (position < 0) | (recipe_versions['version_dish'][np.maximum(position, 0)] != dish_index)
+    position[before_first] = np.searchsorted(keys, dish_index[before_first] * _VERSION_KEY_STEP, side='left')
+    return np.where(dish_index >= 0, position, -1)
+
+
+def recipe_versions_table(recipe_versions, dish_name):
+    """نسخ وصفة طبق معين: بداية ونهاية كل نسخة ومكوناتها"""
+    dish_code = recipe_versions['dishes'].get_indexer([dish_name])[0]
+    rows = []
+    for position in np.flatnonzero(recipe_versions['version_dish'] == dish_code):
+        quantities = recipe_versions['matrix'][position]
+        used = np.flatnonzero(quantities)
+        valid_from = recipe_versions['valid_from'][position]
+        valid_to = recipe_versions['valid_to'][position]
+        rows.append({
+            'Valid_From': pd.Timestamp(valid_from, unit='s') if valid_from > 0 else None,
+            'Valid_To': None if valid_to == _OPEN_ENDED else pd.Timestamp(valid_to, unit='s'),
+            'Ingredients': '، '.join(
+                f"{recipe_versions['ingredients'][i]} ({quantities[i]:g})" for i in used
+            )
+        })
+    return pd.DataFrame(rows, columns=['Valid_From', 'Valid_To', 'Ingredients'])
+
+
+# ========== توقع الطلب وإعادة الطلب ==========
+
+def _weekday(day_numbers):
+    # اليوم 0 (1970-01-01) كان خميساً؛ الإثنين = 0 كما في datetime.weekday
+    return (np.asarray(day_numbers) + 3) % 7
+
+
+def build_daily_consumption(sales_rollup_df, recipe_matrix, weeks=FORECAST_WEEKS):
+    """الاستهلاك اليومي لكل مكون (أيام × مكونات) في آخر عدد من الأسابيع
+    
+    يُبنى من ملخص المبيعات (يوم × طبق) مضروباً في مصفوفة الوصفات، والأيام التي
+    لا مبيعات فيها تُحسب صفراً. الفترة تنتهي عند آخر يوم في سجل المبيعات.
+    """
+    days = parse_log_dates(sales_rollup_df['Date'])
+    valid = days != np.iinfo(np.int64).min
+    last_day = days[valid].max() if valid.any() else _day_number(date.today())
+    first_day = last_day - weeks * 7 + 1
+    
+    dish_index = recipe_matrix['dishes'].get_indexer(pd.Index(sales_rollup_df['Dish_Name']))
+    in_window = valid & (days >= first_day) & (dish_index >= 0)
+    
+    n_dishes = len(recipe_matrix['dishes'])
+    dish_daily = np.bincount(
+        (days[in_window] - first_day) * n_dishes + dish_index[in_window],
+        weights=sales_rollup_df['Quantity'].to_numpy(dtype=float)[in_window],
+        minlength=weeks * 7 * n_dishes
+    ).reshape(weeks * 7, n_dishes)
+    
+    return {
+        'first_day': first_day,
+        'ingredients': recipe_matrix['ingredients'],
+        'consumption': dish_daily @ recipe_matrix['matrix']
+    }
+
+
+def fit_weekday_profile(daily_consumption):
+    """نموذج موسمي بسيط: متوسط استهلاك كل مكون في كل يوم من أيام الأسبوع وانحرافه"""
+    consumption = daily_consumption['consumption']
+    weekdays = _weekday(daily_consumption['first_day'] + np.arange(len(consumption)))
+    
+    # مجموع كل يوم أسبوع لكل المكونات دفعة واحدة: (7 × أيام) @ (أيام × مكونات)
+    weekday_rows = np.eye(7)[:, weekdays]
+    counts = np.maximum(weekday_rows.sum(axis=1, keepdims=True), 1)
+    weekday_mean = weekday_rows @ consumption / counts
+    residuals = consumption - weekday_mean[weekdays]
+    
+    return {
+        'ingredients': daily_consumption['ingredients'],
+        'weekday_mean': weekday_mean,
+        'daily_std': residuals.std(axis=0)
+    }
+
+
+def load_demand_profile(weeks=FORECAST_WEEKS):
+    """نموذج الطلب لكل المكونات (يعاد حسابه فقط عند إضافة مبيعات أو تغيير الوصفات)
+    
+    ملخص المبيعات نفسه يُحدَّث بإضافة الصفوف الجديدة فقط، فإعادة الحساب هنا
+    تمر على أيام الفترة × الأطباق وليس على كل صفوف السجل.
+    """
+    return get_storage().cached(
+        ('sales_log', 'recipes'), f'demand_profile_{weeks}',
+        lambda: fit_weekday_profile(
+            build_daily_consumption(load_sales_rollup(), load_recipe_matrix(), weeks)
+        )
+    )
+
+
+def calculate_reorder_plan(demand_profile, inventory_df, start=None,
+                           lead_days=REORDER_LEAD_DAYS, cover_days=REORDER_COVER_DAYS,
+                           safety_factor=SAFETY_FACTOR, horizon=COVER_HORIZON_DAYS):
+    """أيام التغطية ونقطة وكمية إعادة الطلب لكل مكون في المخزون
+    
+    التوقع يبدأ من اليوم المحدد (اليوم الحالي افتراضياً) بنمط أيام الأسبوع.
+    أيام التغطية = عدد الأيام الكاملة التي يكفيها المخزون (لانهائي إذا تجاوزت
+    المدة المحسوبة). يُقترح الطلب عندما يصل المخزون إلى استهلاك مدة التوريد مع
+    مخزون الأمان، بكمية تكفي مدة التوريد ومدة التغطية.
+    """
+    horizon = max(horizon, lead_days + cover_days, 7)
+    start_day = _day_number(start or date.today())
+    weekdays = _weekday(start_day + np.arange(horizon))
+    
+    inventory_df = inventory_df.drop_duplicates('Ingredient')
+    position = demand_profile['ingredients'].get_indexer(pd.Index(inventory_df['Ingredient']))
+    known = position >= 0
+    
+    # التوقع اليومي (أيام × مكونات المخزون)؛ المكون غير المستخدم في الوصفات لا يُستهلك
+    forecast = np.zeros((horizon, len(inventory_df)))
+    forecast[:, known] = demand_profile['weekday_mean'][weekdays][:, position[known]]
+    daily_std = np.zeros(len(inventory_df))
+    daily_std[known] = demand_profile['daily_std'][position[known]]
+    
+    stock = inventory_df['Current_Stock'].to_numpy(dtype=float)
+    cumulative = forecast.cumsum(axis=0)
+    covered = (cumulative <= stock + 1e-9).sum(axis=0).astype(float)
+    covered[covered >= horizon] = np.inf
+    
+    safety_stock = safety_factor * daily_std * np.sqrt(lead_days)
+    reorder_point = cumulative[lead_days - 1] + safety_stock if lead_days else safety_stock
+    order_up_to = cumulative[lead_days + cover_days - 1] + safety_stock
+    reorder_quantity = np.where(stock <= reorder_point, np.maximum(order_up_to - stock, 0.0), 0.0)
+    
+    return pd.DataFrame({
+        'Ingredient': inventory_df['Ingredient'].to_numpy(),
+        'Current_Stock': stock,
+        'Unit': inventory_df['Unit'].to_numpy(),
+        'Avg_Daily_Use': forecast[:7].mean(axis=0),
+        'Days_Of_Cover': covered,
+        'Reorder_Point': reorder_point,
+        'Reorder_Quantity': reorder_quantity
+    })
+
+
+# ========== تقارير الفروع ==========
+
+def summarize_branch(data_dir, start=None, end=None, backend=None):
+    """الملخصات الجزئية لفرع واحد من ملخصاته اليومية (تُنفذ في عملية مستقلة لكل فرع)"""
+    store = open_storage(backend, data_dir)
+    sales = filter_rollup_by_date(store.load_rollup('sales_log'), start, end)
+    receipts = filter_rollup_by_date(store.load_rollup('inventory_log'), start, end)
+    return {
+        'sales_by_dish': sales.groupby('Dish_Name', observed=True)[['Quantity', 'Rows']].sum().reset_index(),
+        'sales_by_day': sales.groupby('Date')[['Quantity', 'Rows']].sum().reset_index(),
+        'receipts': receipts.groupby('Ingredient', observed=True)[['Quantity_Added']].sum().reset_index(),
+    }
+
+
+def merge_branch_summaries(partials):
+    """دمج الملخصات الجزئية لكل فرع في تقرير واحد مع إجماليات كل فرع"""
+    branches = pd.DataFrame({
+        'الفرع': list(partials),
+        'عدد الطلبات': [int(partial['sales_by_day']['Rows'].sum()) for partial in partials.values()],
+        'إجمالي الأطباق': [partial['sales_by_day']['Quantity'].sum() for partial in partials.values()],
+        'إجمالي الوارد': [partial['receipts']['Quantity_Added'].sum() for partial in partials.values()],
+    })
+
+    def combined(name, keys):
+        frames = [partial[name].astype({keys: str}) for partial in partials.values()]
+        return pd.concat(frames, ignore_index=True).groupby(keys, sort=False).sum().reset_index()
+
+    return {
+        'branches': branches,
+        'sales_by_dish': summarize_sales_by_dish(combined('sales_by_dish', 'Dish_Name')),
+        'sales_by_day': summarize_sales_by_day(combined('sales_by_day', 'Date')),
+        'receipts': summarize_receipts_by_ingredient(combined('receipts', 'Ingredient')),
+    }
+
+
+def consolidated_report(data_dirs, start=None, end=None, backend=None, workers=None):
+    """تقرير مجمع لعدة فروع: ملخص كل فرع (بالتوازي في عمليات مستقلة عند الحاجة) ثم دمج الملخصات
+
+    data_dirs قاموس {اسم الفرع: مجلد بياناته}. بدون تحديد workers يتم الحساب في
+    نفس العملية لأقل من PARALLEL_REPORT_BRANCHES فرع، ومع عامل واحد دائماً.
+    """
+    if workers is None:
+        workers = (os.cpu_count() or 1) if len(data_dirs) >= PARALLEL_REPORT_BRANCHES else 1
+    workers = min(len(data_dirs), workers)
+    jobs = [(str(path), start, end, backend) for path in data_dirs.values()]
+    if workers <= 1:
+        partials = [summarize_branch(*job) for job in jobs]
+    else:
+        # عمليات جديدة (spawn) وليست نسخاً (fork) من خادم متعدد الخيوط قد ترث أقفالاً محجوزة
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            partials = list(pool.map(summarize_branch, *zip(*jobs)))
+    return merge_branch_summaries(dict(zip(data_dirs, partials)))
+
+
+# قياس زمن دوال المحرك (عند تفعيل INVENTORY_PROFILE فقط)
+instrument(globals(), 'engine')
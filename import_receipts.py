@@ -0,0 +1,246 @@
+"""
+استيراد الوارد دفعة واحدة من ملف المورد - نظام إدارة مخزون المطعم
+Bulk goods-receipt import from supplier files - Restaurant Inventory Management System
+
+يقرأ ملف التوريد (CSV أو Excel) على دفعات، ويتحقق من أسماء المكونات والكميات
+والوحدات مقابل المخزون لكل دفعة مرة واحدة، ثم يضيف كل الكميات للمخزون ويلحق
+صفوف سجل الوارد كعملية واحدة.
+
+    python import_receipts.py delivery.csv
+    python import_receipts.py delivery.xlsx --ingredient-column Item --quantity-column Qty --dry-run
+"""
+
+import argparse
+import importlib.util
+import sys
+import time
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from storage import BASE_DIR, INVENTORY_LOG_COLUMNS, branch_dir, open_storage
+
+DEFAULT_CHUNK_SIZE = 50_000
+DEFAULT_NOTES = "توريد من ملف المورد"
+
+# أسماء الأعمدة الافتراضية في ملف المورد
+DEFAULT_COLUMNS = {
+    'Date': 'Date',
+    'Ingredient': 'Ingredient',
+    'Quantity': 'Quantity',
+    'Unit': 'Unit',
+    'Notes': 'Notes',
+}
+
+# عدد الصفوف المرفوضة التي تُحفظ في الملخص للعرض
+REJECTED_PREVIEW_ROWS = 100
+
+# ملفات Excel تحتاج مكتبة openpyxl (اختيارية)
+HAS_EXCEL = importlib.util.find_spec('openpyxl') is not None
+
+
+def _require_excel():
+    if not HAS_EXCEL:
+        raise ImportError("قراءة ملفات Excel تحتاج مكتبة openpyxl: pip install openpyxl")
+
+
+def _is_excel(source):
+    name = getattr(source, 'name', str(source))
+    return Path(name).suffix.lower() in ('.xlsx', '.xlsm')
+
+
+def _rewind(source):
+    if hasattr(source, 'seek'):
+        source.seek(0)
+
+
+def _excel_rows(source):
+    """صفوف أول ورقة في ملف Excel واحداً تلو الآخر (دون تحميل الملف كاملاً)"""
+    _require_excel()
+    import openpyxl
+
+    _rewind(source)
+    workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def receipt_file_columns(source):
+    """أسماء الأعمدة في ملف المورد"""
+    if _is_excel(source):
+        header = next(_excel_rows(source), ())
+        return ['' if name is None else str(name).strip() for name in header]
+    _rewind(source)
+    return pd.read_csv(source, nrows=0, encoding='utf-8-sig').columns.tolist()
+
+
+def read_receipt_chunks(source, columns, chunk_size=DEFAULT_CHUNK_SIZE):
+    """قراءة ملف المورد (مسار أو ملف مرفوع) على دفعات مع توحيد أسماء الأعمدة"""
+    header = receipt_file_columns(source)
+    for required in ('Ingredient', 'Quantity'):
+        if columns[required] not in header:
+            raise ValueError(f"العمود '{columns[required]}' غير موجود في الملف")
+
+    rename = {source_name: target for target, source_name in columns.items() if source_name in header}
+    if _is_excel(source):
+        rows = _excel_rows(source)
+        next(rows, None)
+        while True:
+            block = list(islice(rows, chunk_size))
+            if not block:
+                return
+            chunk = pd.DataFrame(block, columns=header)
+            yield chunk[list(rename)].rename(columns=rename)
+    else:
+        _rewind(source)
+        reader = pd.read_csv(
+            source, usecols=list(rename), chunksize=chunk_size, encoding='utf-8-sig', dtype=str
+        )
+        for chunk in reader:
+            yield chunk.rename(columns=rename)
+
+
+def _clean_names(values):
+    return values.fillna('').astype(str).str.strip()
+
+
+def prepare_receipt_rows(chunk, inventory_df, notes=DEFAULT_NOTES, now=None):
+    """التحقق من صفوف الدفعة مقابل المخزون وتحويلها إلى صفوف سجل الوارد (مع الصفوف المرفوضة)
+
+    الوحدة الفارغة تأخذ وحدة المكون في المخزون، والوحدة المختلفة ترفض الصف.
+    """
+    now = now or datetime.now()
+    ingredients = _clean_names(chunk['Ingredient'])
+    quantities = pd.to_numeric(chunk['Quantity'], errors='coerce')
+
+    stock = inventory_df.drop_duplicates('Ingredient')
+    positions = pd.Index(stock['Ingredient'].astype(str)).get_indexer(ingredients)
+    known = positions >= 0
+    # -1 تعني مكوناً غير موجود: يُبحث عن الوحدة للمكونات الموجودة فقط
+    units = np.full(len(chunk), '', dtype=object)
+    units[known] = stock['Unit'].astype(str).to_numpy()[positions[known]]
+    valid_quantity = (quantities > 0).to_numpy()
+
+    valid_unit = np.ones(len(chunk), dtype=bool)
+    if 'Unit' in chunk:
+        given_units = _clean_names(chunk['Unit']).to_numpy()
+        valid_unit = (given_units == '') | (given_units == units)
+
+    days = pd.Series(now.strftime('%Y-%m-%d'), index=chunk.index)
+    valid_date = np.ones(len(chunk), dtype=bool)
+    if 'Date' in chunk:
+        given_days = pd.to_datetime(chunk['Date'], errors='coerce', format='ISO8601')
+        has_day = _clean_names(chunk['Date']).to_numpy() != ''
+        valid_date = ~has_day | given_days.notna().to_numpy()
+        days = given_days.dt.strftime('%Y-%m-%d').where(has_day & valid_date, days)
+
+    rows = pd.DataFrame({
+        'Date': days,
+        'Ingredient': ingredients,
+        'Quantity_Added': quantities,
+        'Unit': units,
+        'Notes': chunk['Notes'].fillna(notes) if 'Notes' in chunk else notes,
+    }, columns=INVENTORY_LOG_COLUMNS)
+
+    valid = known & valid_quantity & valid_unit & valid_date
+    rejected = chunk[~valid].copy()
+    rejected['Reason'] = np.select(
+        [~known, ~valid_quantity, ~valid_unit],
+        ['مكون غير موجود في المخزون', 'كمية غير صالحة', 'الوحدة لا تطابق وحدة المخزون'],
+        'تاريخ غير صالح'
+    )[~valid]
+    return rows[valid], rejected
+
+
+def import_receipts(source, store, columns=DEFAULT_COLUMNS, chunk_size=DEFAULT_CHUNK_SIZE,
+                    notes=DEFAULT_NOTES, dry_run=False, rejects_path=None):
+    """استيراد ملف المورد كاملاً كعملية واحدة وإرجاع ملخص العملية"""
+    started = time.perf_counter()
+    inventory_df = store.load('inventory')
+    now = datetime.now()
+    summary = {'imported': 0, 'valid': 0, 'rejected': 0, 'rejected_rows': None}
+
+    # التحقق دفعة دفعة، والصفوف الصالحة تُجمع لتُكتب مرة واحدة في النهاية
+    frames = []
+    rejected_frames = []
+    first_reject = True
+    for chunk in read_receipt_chunks(source, columns, chunk_size):
+        rows, rejected = prepare_receipt_rows(chunk, inventory_df, notes, now)
+        frames.append(rows)
+        summary['rejected'] += len(rejected)
+        if rejected.empty:
+            continue
+        if sum(map(len, rejected_frames)) < REJECTED_PREVIEW_ROWS:
+            rejected_frames.append(rejected)
+        if rejects_path:
+            rejected.to_csv(rejects_path, mode='w' if first_reject else 'a',
+                            header=first_reject, index=False, encoding='utf-8-sig')
+            first_reject = False
+
+    receipt_rows = (
+        pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=INVENTORY_LOG_COLUMNS)
+    )
+    if rejected_frames:
+        summary['rejected_rows'] = pd.concat(rejected_frames, ignore_index=True).head(REJECTED_PREVIEW_ROWS)
+    summary['valid'] = len(receipt_rows)
+
+    if not dry_run and not receipt_rows.empty:
+        received = receipt_rows.groupby('Ingredient', sort=False)['Quantity_Added'].sum()
+        store.commit_receipt(received, receipt_rows)
+        summary['imported'] = len(receipt_rows)
+
+    summary['elapsed'] = time.perf_counter() - started
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="استيراد الوارد من ملف المورد")
+    parser.add_argument('path', help="ملف التوريد (CSV أو XLSX)")
+    parser.add_argument('--ingredient-column', default='Ingredient', help="عمود اسم المكون")
+    parser.add_argument('--quantity-column', default='Quantity', help="عمود الكمية")
+    parser.add_argument('--unit-column', default='Unit', help="عمود الوحدة (اختياري)")
+    parser.add_argument('--date-column', default='Date', help="عمود التاريخ (اختياري)")
+    parser.add_argument('--notes-column', default='Notes', help="عمود الملاحظات (اختياري)")
+    parser.add_argument('--notes', default=DEFAULT_NOTES, help="ملاحظة للصفوف التي لا تحتوي على ملاحظات")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="عدد الصفوف في كل دفعة")
+    parser.add_argument('--data-dir', default=str(BASE_DIR), help="مجلد البيانات")
+    parser.add_argument('--branch', default=None, help="استيراد إلى بيانات هذا الفرع بدلاً من --data-dir")
+    parser.add_argument('--backend', choices=['csv', 'sqlite'], default=None, help="نوع التخزين")
+    parser.add_argument('--rejects', default=None, help="حفظ الصفوف المرفوضة في هذا الملف")
+    parser.add_argument('--dry-run', action='store_true', help="التحقق فقط دون تعديل البيانات")
+    args = parser.parse_args(argv)
+
+    columns = {
+        'Date': args.date_column,
+        'Ingredient': args.ingredient_column,
+        'Quantity': args.quantity_column,
+        'Unit': args.unit_column,
+        'Notes': args.notes_column,
+    }
+    store = open_storage(args.backend, branch_dir(args.branch) if args.branch else Path(args.data_dir))
+
+    summary = import_receipts(
+        args.path, store, columns,
+        chunk_size=args.chunk_size,
+        notes=args.notes,
+        dry_run=args.dry_run,
+        rejects_path=args.rejects
+    )
+
+    if summary['rejected_rows'] is not None:
+        print(summary['rejected_rows'].head(20).to_string(index=False), file=sys.stderr)
+    if args.dry_run:
+        print(f"صفوف صالحة: {summary['valid']} | مرفوضة: {summary['rejected']}")
+    else:
+        print(f"تم استيراد {summary['imported']} صف | مرفوضة: {summary['rejected']} "
+              f"| {summary['elapsed']:.2f} ثانية")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
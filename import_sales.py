@@ -0,0 +1,213 @@
+"""
+استيراد المبيعات دفعة واحدة من ملف نقطة البيع - نظام إدارة مخزون المطعم
+Batch sales import from POS exports - Restaurant Inventory Management System
+
+يقرأ الملف على دفعات (دون تحميله كاملاً في الذاكرة)، ويتحقق من أسماء الأطباق
+مقابل الوصفات، ثم يخصم المكونات من المخزون ويضيف الصفوف إلى سجل المبيعات.
+
+    python import_sales.py pos_export.csv
+    python import_sales.py pos_export.csv --dish-column Item --quantity-column Qty --dry-run
+"""
+
+import argparse
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from engine import (
+    build_consumption_rows, calculate_cart_ingredients, check_stock_availability, compile_recipe_matrix,
+)
+from storage import BASE_DIR, SALES_LOG_COLUMNS, branch_dir, open_storage
+
+DEFAULT_CHUNK_SIZE = 100_000
+DEFAULT_NOTES = "استيراد من نقطة البيع"
+
+
+def read_pos_chunks(path, columns, chunk_size=DEFAULT_CHUNK_SIZE, skip_rows=0):
+    """قراءة ملف نقطة البيع على دفعات مع توحيد أسماء الأعمدة (مع تخطي أول skip_rows صف)"""
+    header = pd.read_csv(path, nrows=0, encoding='utf-8-sig').columns
+    for required in ('Dish_Name', 'Quantity'):
+        if columns[required] not in header:
+            raise ValueError(f"العمود '{columns[required]}' غير موجود في الملف")
+
+    usecols = [source for source in columns.values() if source in header]
+    rename = {source: target for target, source in columns.items()}
+    reader = pd.read_csv(
+        path,
+        usecols=usecols,
+        chunksize=chunk_size,
+        skiprows=range(1, skip_rows + 1) if skip_rows else None,
+        encoding='utf-8-sig',
+        dtype={columns['Dish_Name']: str}
+    )
+    for chunk in reader:
+        yield chunk.rename(columns=rename)
+
+
+def _parse_stamps(chunk, column, fmt, default):
+    """تحويل عمود تاريخ أو وقت إلى الصيغة الموحدة (الخانة الفارغة تأخذ القيمة الافتراضية)"""
+    if column not in chunk:
+        return pd.Series(default, index=chunk.index), np.ones(len(chunk), dtype=bool)
+    raw = chunk[column].fillna('').astype(str).str.strip()
+    parsed = pd.to_datetime(raw, format=fmt, errors='coerce')
+    has_value = (raw != '').to_numpy()
+    valid = ~has_value | parsed.notna().to_numpy()
+    return parsed.dt.strftime(fmt).where(has_value & valid, default), valid
+
+
+def prepare_sales_rows(chunk, recipe_matrix, notes=DEFAULT_NOTES, now=None):
+    """التحقق من صفوف الدفعة وتحويلها إلى صفوف سجل المبيعات (مع الصفوف المرفوضة)
+
+    التاريخ YYYY-MM-DD والوقت HH:MM:SS (الخانة الفارغة تأخذ وقت الاستيراد)،
+    والكمية عدد صحيح موجب.
+    """
+    now = now or datetime.now()
+    dishes = chunk['Dish_Name'].fillna('').str.strip()
+    quantities = pd.to_numeric(chunk['Quantity'], errors='coerce')
+    days, valid_date = _parse_stamps(chunk, 'Date', '%Y-%m-%d', now.strftime('%Y-%m-%d'))
+    times, valid_time = _parse_stamps(chunk, 'Time', '%H:%M:%S', now.strftime('%H:%M:%S'))
+
+    known = recipe_matrix['dishes'].get_indexer(dishes) >= 0
+    valid_quantity = ((quantities > 0) & (quantities == np.floor(quantities))).to_numpy()
+    valid = known & valid_quantity & valid_date & valid_time
+
+    rows = pd.DataFrame({
+        'Date': days,
+        'Time': times,
+        'Dish_Name': dishes,
+        'Quantity': quantities,
+        'Notes': chunk['Notes'].fillna(notes) if 'Notes' in chunk else notes,
+    }, columns=SALES_LOG_COLUMNS)[valid]
+    rows['Quantity'] = rows['Quantity'].astype(int)
+
+    rejected = chunk[~valid].copy()
+    rejected['Reason'] = np.select(
+        [~known, ~valid_quantity, ~valid_date],
+        ['طبق غير موجود في الوصفات', 'كمية غير صالحة', 'تاريخ غير صالح'],
+        'وقت غير صالح'
+    )[~valid]
+    return rows, rejected
+
+
+def import_sales(path, store, columns, chunk_size=DEFAULT_CHUNK_SIZE, notes=DEFAULT_NOTES,
+                 allow_negative=False, dry_run=False, rejects_path=None, skip_rows=0):
+    """استيراد ملف نقطة البيع كاملاً وإرجاع ملخص العملية
+
+    كل دفعة تُسجل كعملية مستقلة، و'processed' في الملخص عدد صفوف الملف التي
+    تمت معالجتها وتسجيلها، فإذا توقف الاستيراد يُكمل بـ skip_rows بنفس القيمة
+    دون خصم الدفعات المسجلة مرة أخرى.
+    """
+    started = time.perf_counter()
+    recipe_matrix = compile_recipe_matrix(store.load('recipes'))
+    now = datetime.now()
+    summary = {'imported': 0, 'rejected': 0, 'warnings': [], 'processed': skip_rows}
+
+    # المرور الأول: حساب إجمالي الاستهلاك والتحقق من المخزون قبل أي كتابة
+    if not allow_negative or dry_run:
+        total_demand = pd.Series(dtype=float)
+        valid_rows = 0
+        for chunk in read_pos_chunks(path, columns, chunk_size, skip_rows):
+            rows, rejected = prepare_sales_rows(chunk, recipe_matrix, notes, now)
+            demand = calculate_cart_ingredients(recipe_matrix, rows['Dish_Name'], rows['Quantity'])
+            total_demand = total_demand.add(demand, fill_value=0)
+            valid_rows += len(rows)
+            summary['rejected'] += len(rejected)
+
+        if not allow_negative:
+            summary['warnings'] = check_stock_availability(store.load('inventory'), total_demand)
+        if dry_run or summary['warnings']:
+            summary['valid'] = valid_rows
+            summary['elapsed'] = time.perf_counter() - started
+            return summary
+        summary['rejected'] = 0
+
+    # المرور الثاني: خصم المخزون وتسجيل كل دفعة كعملية واحدة
+    first_reject = True
+    for chunk in read_pos_chunks(path, columns, chunk_size, skip_rows):
+        rows, rejected = prepare_sales_rows(chunk, recipe_matrix, notes, now)
+        demand = calculate_cart_ingredients(recipe_matrix, rows['Dish_Name'], rows['Quantity'])
+
+        validate = None
+        if not allow_negative:
+            validate = lambda current_inventory: check_stock_availability(current_inventory, demand)
+        # صفوف الاستهلاك لكل يوم على حدة لأن الملف قد يحتوي على عدة أيام
+        warnings = store.commit_sale(
+            demand, rows, validate=validate,
+            consumption_rows=build_consumption_rows(recipe_matrix, rows)
+        )
+        if warnings:
+            # تغير المخزون من جهاز آخر أثناء الاستيراد
+            summary['warnings'] = warnings
+            break
+
+        summary['imported'] += len(rows)
+        summary['rejected'] += len(rejected)
+        summary['processed'] += len(chunk)
+        if rejects_path and not rejected.empty:
+            rejected.to_csv(rejects_path, mode='w' if first_reject else 'a',
+                            header=first_reject, index=False, encoding='utf-8-sig')
+            first_reject = False
+
+    summary['elapsed'] = time.perf_counter() - started
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="استيراد المبيعات من ملف نقطة البيع")
+    parser.add_argument('path', help="ملف CSV المصدَّر من نقطة البيع")
+    parser.add_argument('--dish-column', default='Dish_Name', help="عمود اسم الطبق")
+    parser.add_argument('--quantity-column', default='Quantity', help="عمود الكمية")
+    parser.add_argument('--date-column', default='Date', help="عمود التاريخ (اختياري)")
+    parser.add_argument('--time-column', default='Time', help="عمود الوقت (اختياري)")
+    parser.add_argument('--notes-column', default='Notes', help="عمود الملاحظات (اختياري)")
+    parser.add_argument('--notes', default=DEFAULT_NOTES, help="ملاحظة للصفوف التي لا تحتوي على ملاحظات")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="عدد الصفوف في كل دفعة")
+    parser.add_argument('--data-dir', default=str(BASE_DIR), help="مجلد البيانات")
+    parser.add_argument('--branch', default=None, help="استيراد إلى بيانات هذا الفرع بدلاً من --data-dir")
+    parser.add_argument('--backend', choices=['csv', 'sqlite'], default=None, help="نوع التخزين")
+    parser.add_argument('--rejects', default=None, help="حفظ الصفوف المرفوضة في هذا الملف")
+    parser.add_argument('--allow-negative', action='store_true',
+                        help="الخصم حتى لو أصبح المخزون سالباً (للتسوية في نهاية اليوم)")
+    parser.add_argument('--dry-run', action='store_true', help="التحقق فقط دون تعديل البيانات")
+    parser.add_argument('--skip-rows', type=int, default=0,
+                        help="تخطي أول عدد من صفوف الملف (لإكمال استيراد توقف)")
+    args = parser.parse_args(argv)
+
+    columns = {
+        'Date': args.date_column,
+        'Time': args.time_column,
+        'Dish_Name': args.dish_column,
+        'Quantity': args.quantity_column,
+        'Notes': args.notes_column,
+    }
+    store = open_storage(args.backend, branch_dir(args.branch) if args.branch else Path(args.data_dir))
+
+    summary = import_sales(
+        args.path, store, columns,
+        chunk_size=args.chunk_size,
+        notes=args.notes,
+        allow_negative=args.allow_negative,
+        dry_run=args.dry_run,
+        rejects_path=args.rejects,
+        skip_rows=args.skip_rows
+    )
+
+    for warning in summary['warnings']:
+        print(warning, file=sys.stderr)
+    if summary['warnings'] and summary['processed'] > args.skip_rows:
+        print(f"تم تسجيل أول {summary['processed']} صف من الملف. لإكمال الاستيراد بعد تعديل المخزون: "
+              f"--skip-rows {summary['processed']}", file=sys.stderr)
+    if args.dry_run:
+        print(f"صفوف صالحة: {summary['valid']} | مرفوضة: {summary['rejected']}")
+    else:
+        print(f"تم استيراد {summary['imported']} صف | مرفوضة: {summary['rejected']} "
+              f"| {summary['elapsed']:.2f} ثانية")
+    return 1 if summary['warnings'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,198 @@
+"""
+قياس زمن التنفيذ - نظام إدارة مخزون المطعم
+Opt-in timing instrumentation - Restaurant Inventory Management System
+
+عند التفعيل يقيس زمن كل صفحة وكل تحميل وحفظ ودوال محرك المخزون، مع عدد
+الصفوف والبايتات المقروءة والمكتوبة، ويجمع النسب المئوية في الذاكرة لعرضها
+في الشريط الجانبي أو حفظها في ملف JSON أو CSV. بدون التفعيل لا تُغلَّف أي
+دالة ولا يوجد أي تأثير على الأداء.
+
+    INVENTORY_PROFILE=1 streamlit run app.py
+    INVENTORY_PROFILE=1 INVENTORY_PROFILE_FILE=profile.json streamlit run app.py
+"""
+
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+PROFILE_ENABLED = os.environ.get('INVENTORY_PROFILE', '0') != '0'
+
+# حفظ القياسات في هذا الملف عند إغلاق التطبيق (JSON أو CSV حسب الامتداد)
+PROFILE_FILE = os.environ.get('INVENTORY_PROFILE_FILE')
+
+# عدد آخر القياسات المحفوظة لكل دالة لحساب النسب المئوية
+PROFILE_SAMPLES = 1000
+
+PROFILE_COLUMNS = [
+    'Category', 'Name', 'Calls', 'Total_ms', 'Mean_ms', 'P50_ms', 'P95_ms', 'P99_ms', 'Max_ms',
+    'Rows', 'Bytes_Read', 'Bytes_Written',
+]
+
+# مشتركة بين جميع الجلسات مثل الذاكرة المؤقتة في طبقة التخزين
+_stats_lock = threading.Lock()
+_stats = {}
+_active = threading.local()
+
+
+class _Stat:
+    """القياسات المجمعة لدالة واحدة"""
+
+    __slots__ = ('calls', 'total', 'rows', 'bytes_read', 'bytes_written', 'samples')
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.rows = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.samples = deque(maxlen=PROFILE_SAMPLES)
+
+
+def _rows(value):
+    """عدد صفوف الجدول أو السلسلة (0 لأي قيمة أخرى)"""
+    shape = getattr(value, 'shape', None)
+    return int(shape[0]) if shape else 0
+
+
+def record(category, name, seconds, rows=0, bytes_read=0, bytes_written=0):
+    """إضافة قياس واحد"""
+    with _stats_lock:
+        stat = _stats.get((category, name))
+        if stat is None:
+            stat = _stats[(category, name)] = _Stat()
+        stat.calls += 1
+        stat.total += seconds
+        stat.rows += rows
+        stat.bytes_read += bytes_read
+        stat.bytes_written += bytes_written
+        stat.samples.append(seconds)
+
+
+def count_bytes(path, written=False, size=None):
+    """إضافة حجم ملف مقروء أو مكتوب إلى كل القياسات المفتوحة في هذا الخيط"""
+    if not PROFILE_ENABLED:
+        return
+    frames = getattr(_active, 'frames', None)
+    if not frames:
+        return
+    if size is None:
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+    slot = 2 if written else 1
+    for frame in frames:
+        frame[slot] += size
+
+
+def timed(category, function):
+    """تغليف دالة لقياس زمنها وعدد الصفوف (من النتيجة أو من أول جدول في المدخلات)"""
+    name = function.__name__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        frames = getattr(_active, 'frames', None)
+        if frames is None:
+            frames = _active.frames = []
+        frame = [0, 0, 0]
+        frames.append(frame)
+        started = time.perf_counter()
+        try:
+            result = function(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            frames.pop()
+        rows = _rows(result) or next((_rows(arg) for arg in args if _rows(arg)), 0)
+        record(category, name, elapsed, rows, frame[1], frame[2])
+        return result
+
+    wrapper.__wrapped_timed__ = True
+    return wrapper
+
+
+def instrument(namespace, category, names=None, prefixes=None):
+    """تغليف دوال الوحدة (أو الملف) المعرفة فيها نفسها، بالأسماء أو البادئات المطلوبة
+
+    يُستدعى في نهاية الوحدة قبل أن تستوردها الوحدات الأخرى، ولا يفعل شيئاً إذا
+    لم يكن القياس مفعلاً.
+    """
+    if not PROFILE_ENABLED:
+        return
+    module = namespace.get('__name__')
+    for name, value in list(namespace.items()):
+        if not callable(value) or isinstance(value, type) or name.startswith('_'):
+            continue
+        if getattr(value, '__module__', None) != module or getattr(value, '__wrapped_timed__', False):
+            continue
+        if names is not None and name not in names:
+            continue
+        if prefixes is not None and not name.startswith(prefixes):
+            continue
+        namespace[name] = timed(category, value)
+
+
+def summary():
+    """جدول القياسات: عدد الاستدعاءات والزمن الكلي والنسب المئوية لكل دالة (الأبطأ أولاً)"""
+    with _stats_lock:
+        items = [
+            (category, name, stat.calls, stat.total, stat.rows, stat.bytes_read, stat.bytes_written,
+             np.fromiter(stat.samples, dtype=float, count=len(stat.samples)))
+            for (category, name), stat in _stats.items()
+        ]
+    if not items:
+        return pd.DataFrame(columns=PROFILE_COLUMNS)
+
+    rows = []
+    for category, name, calls, total, row_count, bytes_read, bytes_written, samples in items:
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99]) * 1000
+        rows.append([
+            category, name, calls, total * 1000, total * 1000 / calls, p50, p95, p99, samples.max() * 1000,
+            row_count, bytes_read, bytes_written,
+        ])
+    summary_df = pd.DataFrame(rows, columns=PROFILE_COLUMNS)
+    return summary_df.sort_values('Total_ms', ascending=False, ignore_index=True)
+
+
+def samples():
+    """آخر القياسات لكل دالة بالمللي ثانية (للتحليل خارج التطبيق)"""
+    with _stats_lock:
+        return {
+            f"{category}.{name}": [round(seconds * 1000, 4) for seconds in stat.samples]
+            for (category, name), stat in _stats.items()
+        }
+
+
+def reset():
+    """حذف كل القياسات"""
+    with _stats_lock:
+        _stats.clear()
+
+
+def to_json():
+    """القياسات المجمعة وآخر القياسات لكل دالة بصيغة JSON"""
+    return json.dumps({
+        'summary': summary().round(4).to_dict(orient='records'),
+        'samples': samples(),
+    }, ensure_ascii=False, indent=2)
+
+
+def dump(path):
+    """حفظ القياسات في ملف JSON (مع آخر القياسات) أو CSV (الجدول المجمع) حسب الامتداد"""
+    path = Path(path)
+    if path.suffix.lower() == '.csv':
+        summary().to_csv(path, index=False, encoding='utf-8-sig')
+    else:
+        path.write_text(to_json(), encoding='utf-8')
+    return path
+
+
+if PROFILE_ENABLED and PROFILE_FILE:
+    atexit.register(dump, PROFILE_FILE)
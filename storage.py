@@ -0,0 +1,1584 @@
+"""
+طبقة تخزين البيانات - نظام إدارة مخزون المطعم
+Storage layer - Restaurant Inventory Management System
+
+واجهة موحدة لتحميل وحفظ المخزون والوصفات والسجلات مع تنفيذين:
+ملفات CSV (الافتراضي) وقاعدة بيانات SQLite.
+"""
+
+import atexit
+import importlib.util
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from profiler import count_bytes, instrument
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+# تحديد مسار ملفات البيانات
+BASE_DIR = Path(__file__).parent
+INVENTORY_FILE = BASE_DIR / "inventory.csv"
+RECIPES_FILE = BASE_DIR / "recipes.csv"
+INVENTORY_LOG_FILE = BASE_DIR / "inventory_log.csv"
+SALES_LOG_FILE = BASE_DIR / "sales_log.csv"
+CONSUMPTION_LOG_FILE = BASE_DIR / "consumption_log.csv"
+STOCK_COUNTS_FILE = BASE_DIR / "stock_counts.csv"
+RECIPE_HISTORY_FILE = BASE_DIR / "recipe_history.csv"
+STOCK_THRESHOLDS_FILE = BASE_DIR / "stock_thresholds.csv"
+DB_FILE = BASE_DIR / "inventory.db"
+LOCK_FILE = BASE_DIR / ".inventory.lock"
+ARCHIVE_DIR = BASE_DIR / "archive"
+
+# مجلدات الفروع: كل مجلد فرعي فيه مجموعة ملفات بيانات كاملة لفرع واحد، والمجلد
+# الرئيسي نفسه هو الفرع الافتراضي (INVENTORY_BRANCH لاختيار فرع آخر عند التشغيل)
+BRANCHES_DIR = Path(os.environ.get('INVENTORY_BRANCHES_DIR', BASE_DIR / "branches"))
+DEFAULT_BRANCH = os.environ.get('INVENTORY_BRANCH') or None
+
+# اسم المجلد الرئيسي في أدوات سطر الأوامر، ولذلك لا يمكن إنشاء فرع بهذا الاسم
+MAIN_BRANCH_NAME = 'main'
+
+# نوع التخزين المستخدم: csv أو sqlite
+STORAGE_BACKEND = os.environ.get('INVENTORY_STORAGE', 'csv')
+
+# أعمدة الجداول
+INVENTORY_COLUMNS = ['Ingredient', 'Current_Stock', 'Unit']
+RECIPES_COLUMNS = ['Dish_Name', 'Ingredient', 'Quantity_Needed']
+INVENTORY_LOG_COLUMNS = ['Date', 'Ingredient', 'Quantity_Added', 'Unit', 'Notes']
+SALES_LOG_COLUMNS = ['Date', 'Time', 'Dish_Name', 'Quantity', 'Notes']
+CONSUMPTION_LOG_COLUMNS = ['Date', 'Ingredient', 'Quantity_Used']
+STOCK_COUNT_COLUMNS = ['Date', 'Ingredient', 'Counted_Stock']
+RECIPE_HISTORY_COLUMNS = ['Valid_From', 'Dish_Name', 'Ingredient', 'Quantity_Needed']
+STOCK_THRESHOLD_COLUMNS = ['Ingredient', 'Min_Stock']
+
+# تاريخ بداية أول نسخة من الوصفات الموجودة قبل تسجيل التعديلات
+RECIPE_EPOCH = '1970-01-01 00:00:00'
+
+TABLE_COLUMNS = {
+    'inventory': INVENTORY_COLUMNS,
+    'recipes': RECIPES_COLUMNS,
+    'inventory_log': INVENTORY_LOG_COLUMNS,
+    'sales_log': SALES_LOG_COLUMNS,
+    'consumption_log': CONSUMPTION_LOG_COLUMNS,
+    'stock_counts': STOCK_COUNT_COLUMNS,
+    'recipe_history': RECIPE_HISTORY_COLUMNS,
+    'stock_thresholds': STOCK_THRESHOLD_COLUMNS,
+}
+
+# الملخصات المجمعة (يوم × طبق للمبيعات، يوم × مكون للوارد والاستهلاك)
+ROLLUPS = {
+    'sales_log': {'name': 'sales_rollup', 'keys': ['Date', 'Dish_Name'], 'value': 'Quantity'},
+    'inventory_log': {'name': 'inventory_log_rollup', 'keys': ['Date', 'Ingredient'], 'value': 'Quantity_Added'},
+    'consumption_log': {'name': 'consumption_rollup', 'keys': ['Date', 'Ingredient'], 'value': 'Quantity_Used'},
+}
+ROLLUP_STATE_FILE = BASE_DIR / "rollups.json"
+
+# أعمدة الأسماء المكررة ونوع الأكواد المشتركة لكل منها
+NAME_COLUMNS = {
+    'inventory': {'Ingredient': 'ingredient', 'Unit': 'unit'},
+    'recipes': {'Dish_Name': 'dish', 'Ingredient': 'ingredient'},
+    'inventory_log': {'Ingredient': 'ingredient', 'Unit': 'unit', 'Notes': 'notes'},
+    'sales_log': {'Dish_Name': 'dish', 'Notes': 'notes'},
+    'consumption_log': {'Ingredient': 'ingredient'},
+    'stock_counts': {'Ingredient': 'ingredient'},
+    'recipe_history': {'Dish_Name': 'dish', 'Ingredient': 'ingredient'},
+    'stock_thresholds': {'Ingredient': 'ingredient'},
+}
+
+# الجداول التي تُحمَّل أعمدة الأسماء فيها كأكواد (categorical)؛ المخزون والوصفات
+# صغيرة وتُعدَّل مباشرة في الواجهة فتبقى نصوصاً وتُسجَّل أسماؤها فقط
+ENCODED_TABLES = ('inventory_log', 'sales_log', 'consumption_log')
+
+# البيانات الافتراضية عند عدم وجود ملفات
+DEFAULT_DATA = {
+    'inventory': {
+        'Ingredient': ['طماطم', 'بصل', 'ثوم'],
+        'Current_Stock': [50, 30, 10],
+        'Unit': ['كيلو', 'كيلو', 'كيلو']
+    },
+    'recipes': {
+        'Dish_Name': ['شاورما دجاج', 'شاورما دجاج'],
+        'Ingredient': ['دجاج', 'طماطم'],
+        'Quantity_Needed': [0.3, 0.1]
+    },
+}
+
+# مزامنة الإضافات للسجلات مع القرص فوراً (INVENTORY_LOG_FSYNC=0 لتعطيلها)
+LOG_FSYNC = os.environ.get('INVENTORY_LOG_FSYNC', '1') != '0'
+
+# الكتابة في الخلفية: عدد الثواني بين كل كتابة مجمعة (INVENTORY_WRITE_BEHIND=0.5 مثلاً)،
+# والقيمة 0 (الافتراضي) تعني الكتابة المباشرة عند كل عملية
+WRITE_BEHIND_INTERVAL = float(os.environ.get('INVENTORY_WRITE_BEHIND', '0'))
+
+# أرشيف السجلات بصيغة Parquet يحتاج مكتبة pyarrow (اختيارية)
+HAS_PARQUET = importlib.util.find_spec('pyarrow') is not None
+
+
+def _require_parquet():
+    if not HAS_PARQUET:
+        raise ImportError("أرشيف السجلات يحتاج مكتبة pyarrow: pip install pyarrow")
+
+
+def _default_frame(table):
+    """إنشاء الجدول الافتراضي"""
+    if table in DEFAULT_DATA:
+        return pd.DataFrame(DEFAULT_DATA[table], columns=TABLE_COLUMNS[table])
+    return pd.DataFrame(columns=TABLE_COLUMNS[table])
+
+
+def _rollup_columns(table):
+    spec = ROLLUPS[table]
+    return spec['keys'] + [spec['value'], 'Rows']
+
+
+def _aggregate_rollup(table, rows_df, rollup_df=None):
+    """تجميع صفوف السجل حسب (اليوم، الطبق/المكون) ودمجها مع الملخص السابق"""
+    spec = ROLLUPS[table]
+    delta = rows_df.groupby(spec['keys'], as_index=False, observed=True).agg(
+        **{spec['value']: (spec['value'], 'sum'), 'Rows': (spec['value'], 'size')}
+    )
+    if rollup_df is not None and not rollup_df.empty:
+        delta = pd.concat([rollup_df, delta], ignore_index=True).groupby(
+            spec['keys'], as_index=False, observed=True
+        )[[spec['value'], 'Rows']].sum()
+    return delta[_rollup_columns(table)]
+
+
+def _filter_dates(log_df, start=None, end=None):
+    """صفوف السجل بين تاريخين (شاملين)؛ التواريخ بصيغة YYYY-MM-DD تُقارن كنصوص"""
+    mask = pd.Series(True, index=log_df.index)
+    if start is not None:
+        mask &= log_df['Date'] >= str(start)
+    if end is not None:
+        mask &= log_df['Date'] <= str(end)
+    return log_df[mask]
+
+
+def _consumption_rows(ingredients_needed, sales_rows):
+    """صفوف سجل الاستهلاك لعملية بيع: المكونات المخصومة بتاريخ البيع
+
+    صفوف البيع من السلة كلها بنفس التاريخ؛ الاستيراد بتواريخ متعددة يمرر صفوفه محسوبة لكل يوم.
+    """
+    used = pd.Series(ingredients_needed, dtype=float)
+    used = used[used != 0]
+    day = sales_rows['Date'].iloc[-1] if len(sales_rows) else pd.Timestamp.today().strftime('%Y-%m-%d')
+    return pd.DataFrame({
+        'Date': day,
+        'Ingredient': used.index,
+        'Quantity_Used': used.to_numpy()
+    }, columns=CONSUMPTION_LOG_COLUMNS)
+
+
+def _count_changes(inventory_df, count_rows):
+    """تغييرات المخزون (المعدود − الحالي) لصفوف الجرد، على المخزون كما هو عند الحفظ"""
+    counted = count_rows.drop_duplicates('Ingredient', keep='last').set_index('Ingredient')['Counted_Stock']
+    current = inventory_df.drop_duplicates('Ingredient').set_index('Ingredient')['Current_Stock'].astype(float)
+    changes = counted.astype(float) - current.reindex(counted.index).fillna(0.0)
+    return changes[changes != 0]
+
+
+def _recipe_version_rows(previous_df, recipes_df, history_df, valid_from=None):
+    """صفوف سجل الوصفات لحفظ جديد: نسخة كاملة لكل طبق تغيرت مكوناته أو كمياتها
+
+    الطبق المحذوف يُسجَّل بصف بلا مكون. إذا كان السجل فارغاً تُسجَّل الوصفات
+    السابقة أولاً كنسخة أولى من RECIPE_EPOCH.
+    """
+    valid_from = valid_from or time.strftime('%Y-%m-%d %H:%M:%S')
+    if not history_df.empty:
+        # نسختان في نفس الثانية: الأحدث تبدأ بعد الأقدم بثانية حتى لا تختلطا
+        last = pd.Timestamp(history_df['Valid_From'].max())
+        if pd.Timestamp(valid_from) <= last:
+            valid_from = (last + pd.Timedelta(seconds=1)).strftime('%Y-%m-%d %H:%M:%S')
+
+    def quantities(df):
+        return df.astype({'Dish_Name': str, 'Ingredient': str}).groupby(
+            ['Dish_Name', 'Ingredient'])['Quantity_Needed'].sum().astype(float)
+
+    both = pd.concat([quantities(previous_df), quantities(recipes_df)], axis=1, keys=['old', 'new'])
+    changed = both.index.get_level_values('Dish_Name')[~(both['old'] == both['new']).to_numpy()].unique()
+
+    new_rows = recipes_df[recipes_df['Dish_Name'].astype(str).isin(changed)]
+    removed = changed.difference(recipes_df['Dish_Name'].astype(str))
+    frames = [
+        new_rows.assign(Valid_From=valid_from),
+        pd.DataFrame({'Valid_From': valid_from, 'Dish_Name': removed, 'Ingredient': '', 'Quantity_Needed': 0.0}),
+    ]
+    if history_df.empty and not changed.empty:
+        frames.insert(0, previous_df.assign(Valid_From=RECIPE_EPOCH))
+    return pd.concat(frames, ignore_index=True)[RECIPE_HISTORY_COLUMNS]
+
+
+def apply_stock_changes(inventory_df, stock_changes):
+    """إضافة التغييرات (موجبة للوارد وسالبة للاستهلاك) إلى رصيد المخزون"""
+    changes = pd.Series(stock_changes, dtype=float).groupby(level=0).sum()
+    updated_df = inventory_df.copy()
+    updated_df['Current_Stock'] = (
+        updated_df['Current_Stock'].astype(float)
+        + updated_df['Ingredient'].map(changes).fillna(0.0)
+    )
+    return updated_df
+
+
+# ========== جدول الأكواد المشترك ==========
+
+class CodeTable:
+    """أكواد ثابتة للأسماء (أطباق، مكونات، وحدات، ملاحظات) مشتركة بين كل الجداول
+
+    الأسماء الجديدة تُضاف في آخر القائمة فقط، فلا يتغير كود أي اسم بعد تسجيله
+    ويمكن مقارنة وتجميع أعمدة الجداول المختلفة بالأكواد مباشرة.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._names = {}
+
+    def categories(self, kind):
+        """كل الأسماء المسجلة لنوع معين (موضع الاسم هو كوده)"""
+        return self._names.get(kind, pd.Index([], dtype=object))
+
+    def code(self, kind, name):
+        """كود اسم معين (-1 إذا لم يُسجَّل)"""
+        return int(self.categories(kind).get_indexer([name])[0])
+
+    def register(self, kind, names):
+        """تسجيل الأسماء الجديدة وإرجاع قائمة الأسماء بعد التحديث"""
+        names = pd.Index(names).dropna()
+        with self._lock:
+            current = self.categories(kind)
+            missing = names[current.get_indexer(names) < 0].unique()
+            if len(missing):
+                current = current.append(missing)
+                self._names[kind] = current
+        return current
+
+    def encode(self, kind, values):
+        """تحويل عمود نصي إلى Categorical بأكواد الجدول المشترك
+
+        كل اسم مختلف يُبحث عنه مرة واحدة فقط بدلاً من مرة لكل صف.
+        """
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            row_codes, uniques = values.cat.codes.to_numpy(), values.cat.categories
+        else:
+            row_codes, uniques = pd.factorize(values)
+        categories = self.register(kind, uniques)
+        codes = categories.get_indexer(uniques)
+        return pd.Categorical.from_codes(
+            np.append(codes, -1)[row_codes], categories=categories
+        )
+
+
+code_table = CodeTable()
+
+
+def _encode_names(table, df):
+    """تحويل أعمدة الأسماء إلى أكواد مشتركة (أو تسجيلها فقط للجداول الصغيرة)"""
+    for column, kind in NAME_COLUMNS[table].items():
+        if column not in df or not (
+                pd.api.types.is_object_dtype(df[column]) or pd.api.types.is_string_dtype(df[column])
+                or isinstance(df[column].dtype, pd.CategoricalDtype)):
+            continue
+        if table in ENCODED_TABLES:
+            df[column] = code_table.encode(kind, df[column])
+        else:
+            code_table.register(kind, df[column].unique())
+    return df
+
+
+# ========== قفل الكتابة بين الأجهزة ==========
+
+class FileLock:
+    """قفل حصري مشترك بين العمليات والخيوط باستخدام ملف"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._thread_lock = threading.Lock()
+        self._fd = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if os.name == 'nt':
+                    while True:
+                        try:
+                            msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                            break
+                        except OSError:
+                            pass
+                else:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+            except BaseException:
+                os.close(fd)
+                raise
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        self._fd = fd
+        return self
+
+    def __exit__(self, *exc_info):
+        fd, self._fd = self._fd, None
+        try:
+            if os.name == 'nt':
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+            self._thread_lock.release()
+
+
+# ========== الذاكرة المؤقتة المشتركة ==========
+
+# مشتركة بين جميع الجلسات لأن الوحدة تُحمّل مرة واحدة لكل خادم
+_cache_lock = threading.Lock()
+_cache_entries = {}
+
+
+def _cache_get(key, version):
+    """قراءة قيمة من الذاكرة المؤقتة إذا كانت نسختها مطابقة"""
+    with _cache_lock:
+        entry = _cache_entries.get(key)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    return None
+
+
+def _cache_put(key, version, value):
+    """تخزين قيمة في الذاكرة المؤقتة"""
+    with _cache_lock:
+        _cache_entries[key] = (version, value)
+
+
+def _cache_drop(prefix):
+    """حذف القيم المخزنة لجدول معين"""
+    with _cache_lock:
+        for key in [k for k in _cache_entries if k[:2] == prefix]:
+            del _cache_entries[key]
+
+
+# ========== الواجهة العامة للتخزين ==========
+
+class BaseStorage:
+    """الواجهة المشتركة لجميع أنواع التخزين"""
+
+    key = None
+
+    def version(self, table):
+        """رقم نسخة الجدول (يتغير مع كل كتابة)"""
+        raise NotImplementedError
+
+    def _read(self, table):
+        raise NotImplementedError
+
+    def _write(self, table, df):
+        raise NotImplementedError
+
+    def _append(self, table, rows_df):
+        raise NotImplementedError
+
+    def _commit_stock(self, stock_changes, log_rows, validate):
+        raise NotImplementedError
+
+    def _insert_inventory(self, new_rows, log_rows):
+        raise NotImplementedError
+
+    def _refresh_rollup(self, table):
+        raise NotImplementedError
+
+    def _write_lock(self):
+        """قفل يمنع تداخل عمليات الكتابة من عدة أجهزة"""
+        return nullcontext()
+
+    def flush(self):
+        """الانتظار حتى تُكتب كل التغييرات السابقة على القرص (الكتابة مباشرة افتراضياً)"""
+
+    def load(self, table, copy=True):
+        """تحميل جدول مع إعادة استخدام النسخة المحللة طالما لم يتغير
+
+        copy=False يعيد النسخة المخزنة نفسها (للقراءة فقط) لتوفير نسخ السجلات الكبيرة.
+        """
+        version = self.version(table)
+        df = _cache_get((self.key, table), version)
+        if df is None:
+            df = _encode_names(table, self._read(table))
+            _cache_put((self.key, table), version, df)
+        return df.copy() if copy else df
+
+    def save(self, table, df):
+        """حفظ جدول كامل"""
+        with self._write_lock():
+            self._write(table, df[TABLE_COLUMNS[table]])
+        _cache_drop((self.key, table))
+
+    def append(self, table, rows_df):
+        """إلحاق صفوف بسجل دون إعادة كتابته"""
+        if not rows_df.empty:
+            with self._write_lock():
+                self._append(table, rows_df[TABLE_COLUMNS[table]])
+            _cache_drop((self.key, table))
+
+    def commit_sale(self, ingredients_needed, sales_rows, validate=None, consumption_rows=None):
+        """خصم المكونات من المخزون وتسجيل المبيعات والاستهلاك كعملية واحدة
+
+        يتم استدعاء validate (إن وُجدت) على المخزون الحالي داخل القفل، وإذا أعادت
+        تحذيرات تُلغى العملية وتُعاد التحذيرات.
+        """
+        consumed = -pd.Series(ingredients_needed, dtype=float)
+        if consumption_rows is None:
+            consumption_rows = _consumption_rows(ingredients_needed, sales_rows)
+        log_rows = {'sales_log': sales_rows[SALES_LOG_COLUMNS]}
+        if not consumption_rows.empty:
+            log_rows['consumption_log'] = consumption_rows[CONSUMPTION_LOG_COLUMNS]
+        warnings = self._commit_stock(consumed, log_rows, validate)
+        for table in ['inventory', *log_rows]:
+            _cache_drop((self.key, table))
+        return warnings
+
+    def commit_receipt(self, ingredients_received, receipt_rows):
+        """إضافة الوارد للمخزون وتسجيله كعملية واحدة"""
+        received = pd.Series(ingredients_received, dtype=float)
+        self._commit_stock(received, {'inventory_log': receipt_rows[INVENTORY_LOG_COLUMNS]}, None)
+        _cache_drop((self.key, 'inventory'))
+        _cache_drop((self.key, 'inventory_log'))
+
+    def commit_stock_count(self, count_rows):
+        """تعديل المخزون إلى الكميات المعدودة وتسجيل الجرد كعملية واحدة
+
+        الفرق يُحسب داخل القفل على المخزون الحالي وليس على نسخة صفحة الجرد، فلا
+        تضيع المبيعات المسجلة بينهما. تُعاد التغييرات التي طُبقت.
+        """
+        applied = []
+
+        def count_changes(inventory_df):
+            applied.append(_count_changes(inventory_df, count_rows))
+            return applied[-1]
+
+        self._commit_stock(count_changes, {'stock_counts': count_rows[STOCK_COUNT_COLUMNS]}, None)
+        _cache_drop((self.key, 'inventory'))
+        _cache_drop((self.key, 'stock_counts'))
+        return applied[-1]
+
+    def add_ingredients(self, new_rows, log_rows):
+        """إضافة مكونات جديدة للمخزون وتسجيل كمياتها الأولى كعملية واحدة
+
+        لا تُعاد كتابة أرصدة المكونات الأخرى، وإذا كان أي مكون موجوداً بالفعل
+        لا يُضاف شيء وتُعاد أسماء المكونات الموجودة.
+        """
+        existing = self._insert_inventory(new_rows[INVENTORY_COLUMNS], log_rows[INVENTORY_LOG_COLUMNS])
+        if not existing:
+            _cache_drop((self.key, 'inventory'))
+            _cache_drop((self.key, 'inventory_log'))
+        return existing
+
+    def save_recipes(self, recipes_df, valid_from=None):
+        """حفظ الوصفات وإضافة نسخة جديدة بتاريخ بدايتها لكل طبق تغيرت وصفته"""
+        with self._write_lock():
+            version_rows = _recipe_version_rows(
+                self.load('recipes'), recipes_df, self.load('recipe_history'), valid_from
+            )
+            self._write('recipes', recipes_df[RECIPES_COLUMNS])
+            if not version_rows.empty:
+                self._append('recipe_history', version_rows)
+        _cache_drop((self.key, 'recipes'))
+        _cache_drop((self.key, 'recipe_history'))
+
+    def commit_batch(self, stock_changes, log_rows):
+        """تطبيق تغييرات مخزون مجمعة (موجبة وسالبة) وإلحاق صفوف عدة سجلات كعملية واحدة"""
+        log_rows = {table: rows[TABLE_COLUMNS[table]] for table, rows in log_rows.items() if not rows.empty}
+        self._commit_stock(pd.Series(stock_changes, dtype=float), log_rows, None)
+        for table in ['inventory', *log_rows]:
+            _cache_drop((self.key, table))
+
+    def load_range(self, table, start=None, end=None, columns=None):
+        """تحميل صفوف السجل بين تاريخين (شاملين) بالأعمدة المطلوبة فقط"""
+        rows = _filter_dates(self.load(table, copy=False), start, end)
+        return rows[columns or TABLE_COLUMNS[table]].reset_index(drop=True)
+
+    def load_rollup(self, table):
+        """تحميل ملخص السجل (يوم × طبق/مكون) بعد إضافة الصفوف الجديدة فقط إليه"""
+        version = self.version(table)
+        rollup = _cache_get((self.key, table, 'rollup'), version)
+        if rollup is None:
+            with self._write_lock():
+                rollup = self._refresh_rollup(table)
+            _cache_put((self.key, table, 'rollup'), version, rollup)
+        return rollup.copy()
+
+    def cached(self, table, name, build):
+        """حساب قيمة مشتقة من جدول (أو عدة جداول) وإعادة استخدامها حتى يتغير أحدها"""
+        if isinstance(table, tuple):
+            version = tuple(self.version(table_name) for table_name in table)
+        else:
+            version = self.version(table)
+        value = _cache_get((self.key, table, name), version)
+        if value is None:
+            value = build()
+            _cache_put((self.key, table, name), version, value)
+        return value
+
+
+# ========== التخزين في ملفات CSV ==========
+
+class CsvStorage(BaseStorage):
+    """تخزين كل جدول في ملف CSV مستقل"""
+
+    def __init__(self, base_dir=BASE_DIR):
+        self.base_dir = Path(base_dir)
+        self.key = f"csv:{self.base_dir}"
+        self.paths = {
+            'inventory': self.base_dir / INVENTORY_FILE.name,
+            'recipes': self.base_dir / RECIPES_FILE.name,
+            'inventory_log': self.base_dir / INVENTORY_LOG_FILE.name,
+            'sales_log': self.base_dir / SALES_LOG_FILE.name,
+            'consumption_log': self.base_dir / CONSUMPTION_LOG_FILE.name,
+            'stock_counts': self.base_dir / STOCK_COUNTS_FILE.name,
+            'recipe_history': self.base_dir / RECIPE_HISTORY_FILE.name,
+            'stock_thresholds': self.base_dir / STOCK_THRESHOLDS_FILE.name,
+        }
+        self._lock = FileLock(self.base_dir / LOCK_FILE.name)
+        self.rollup_paths = {
+            table: self.base_dir / f"{spec['name']}.csv" for table, spec in ROLLUPS.items()
+        }
+        self.rollup_state_path = self.base_dir / ROLLUP_STATE_FILE.name
+        self.archive_dirs = {
+            table: self.base_dir / ARCHIVE_DIR.name / table for table in ROLLUPS
+        }
+
+    def _write_lock(self):
+        return self._lock
+
+    def _signature(self, path):
+        stat = path.stat()
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def _read_rollup_state(self):
+        try:
+            with open(self.rollup_state_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _refresh_rollup(self, table):
+        # الحالة تحفظ عدد البايتات التي تم تجميعها من السجل وبصمة ملف الملخص،
+        # فإذا لم تتطابق البصمة (توقف أثناء الكتابة أو تعديل يدوي) يُعاد البناء
+        log_path = self.paths[table]
+        rollup_path = self.rollup_paths[table]
+        state = self._read_rollup_state()
+        entry = state.get(table)
+        log_size = log_path.stat().st_size
+
+        if (entry and rollup_path.exists()
+                and entry['rollup_signature'] == self._signature(rollup_path)
+                and entry['offset'] <= log_size):
+            rollup = pd.read_csv(rollup_path, encoding='utf-8-sig')
+            count_bytes(rollup_path)
+            offset = entry['offset']
+        else:
+            # إعادة البناء تبدأ من الأشهر المؤرشفة (أعمدة الملخص فقط) ثم الملف الحالي
+            rollup = pd.DataFrame(columns=_rollup_columns(table))
+            spec = ROLLUPS[table]
+            for path in self.archive_partitions(table):
+                rollup = _aggregate_rollup(
+                    table, self._read_partition(table, path, spec['keys'] + [spec['value']]), rollup
+                )
+            offset = 0
+
+        if offset == log_size:
+            return rollup
+
+        with open(log_path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+        count_bytes(log_path, size=len(data))
+        # تجاهل السطر الأخير إذا كان لا يزال قيد الكتابة
+        data = data[:data.rfind(b'\n') + 1]
+        if not data:
+            return rollup
+
+        if offset == 0:
+            new_rows = pd.read_csv(io.BytesIO(data), encoding='utf-8-sig')
+        else:
+            new_rows = pd.read_csv(
+                io.BytesIO(data), encoding='utf-8', header=None, names=TABLE_COLUMNS[table]
+            )
+        if not new_rows.empty:
+            rollup = _aggregate_rollup(table, new_rows, rollup)
+
+        self._write_file(rollup_path, rollup)
+        self._save_rollup_state(state, table, offset + len(data))
+        return rollup
+
+    def _save_rollup_state(self, state, table, offset):
+        state[table] = {
+            'offset': offset,
+            'rollup_signature': self._signature(self.rollup_paths[table]),
+        }
+        tmp_state = self.rollup_state_path.with_suffix('.json.tmp')
+        with open(tmp_state, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_state, self.rollup_state_path)
+
+    def archive_partitions(self, table):
+        """ملفات الأشهر المؤرشفة للسجل مرتبة زمنياً"""
+        if table not in self.archive_dirs or not self.archive_dirs[table].is_dir():
+            return []
+        return sorted(self.archive_dirs[table].glob('*.parquet'))
+
+    def _read_partition(self, table, path, columns=None):
+        # الأشهر المؤرشفة لا تتغير، فتُحفظ محللة في الذاكرة ولا يُعاد تحليل
+        # إلا الملف الحالي عند كل إضافة
+        signature = tuple(self._signature(path))
+        partition = _cache_get((self.key, table, 'partition', path.name), signature)
+        if partition is not None:
+            return partition if columns is None else partition[columns]
+        _require_parquet()
+        count_bytes(path)
+        if columns is not None:
+            return pd.read_parquet(path, columns=columns)
+        partition = pd.read_parquet(path)
+        _cache_put((self.key, table, 'partition', path.name), signature, partition)
+        return partition
+
+    def version(self, table):
+        path = self.paths[table]
+        if not path.exists():
+            self._write(table, _default_frame(table))
+        stat = path.stat()
+        partitions = tuple(
+            (partition.name, *self._signature(partition)) for partition in self.archive_partitions(table)
+        )
+        return (stat.st_mtime_ns, stat.st_size, partitions)
+
+    def _read(self, table):
+        # قارئ CSV ينشئ أعمدة الأسماء كأكواد مباشرة فيكون ربطها بالجدول المشترك أسرع
+        dtype = {column: 'category' for column in NAME_COLUMNS[table]} if table in ENCODED_TABLES else None
+        current = pd.read_csv(self.paths[table], encoding='utf-8-sig', dtype=dtype)
+        count_bytes(self.paths[table])
+        partitions = self.archive_partitions(table)
+        if not partitions:
+            return current
+        frames = [self._read_partition(table, path) for path in partitions]
+        return pd.concat(frames + [current], ignore_index=True)
+
+    def load_range(self, table, start=None, end=None, columns=None):
+        partitions = self.archive_partitions(table)
+        if not partitions:
+            return super().load_range(table, start, end, columns)
+
+        # قراءة الأشهر التي تتقاطع مع الفترة فقط، وبالأعمدة المطلوبة فقط
+        columns = columns or TABLE_COLUMNS[table]
+        read_columns = columns if 'Date' in columns else ['Date'] + list(columns)
+        first_month = None if start is None else str(start)[:7]
+        last_month = None if end is None else str(end)[:7]
+        frames = [
+            self._read_partition(table, path, read_columns)
+            for path in partitions
+            if (first_month is None or path.stem >= first_month)
+            and (last_month is None or path.stem <= last_month)
+        ]
+        frames.append(pd.read_csv(self.paths[table], encoding='utf-8-sig', usecols=read_columns))
+        count_bytes(self.paths[table])
+        rows = _filter_dates(pd.concat(frames, ignore_index=True), start, end)
+        return _encode_names(table, rows[columns].reset_index(drop=True))
+
+    def _write(self, table, df):
+        self._write_file(self.paths[table], df)
+        if table in ROLLUPS:
+            # السجل أعيدت كتابته بالكامل (بما فيه الأشهر المؤرشفة): يُحذف الأرشيف
+            # ويُعاد بناء الملخص عند أول قراءة
+            for path in self.archive_partitions(table):
+                path.unlink()
+            self.rollup_paths[table].unlink(missing_ok=True)
+
+    def archive(self, table, before):
+        """نقل صفوف السجل الأقدم من الشهر المحدد (YYYY-MM) إلى ملفات Parquet شهرية
+
+        يبقى الشهر الحالي في ملف CSV صغير تُلحق به الإضافات الجديدة.
+        """
+        _require_parquet()
+        self.version(table)
+        with self._lock:
+            # الملخص يجب أن يشمل كل صفوف الملف قبل نقلها حتى لا يعاد بناؤه
+            self._refresh_rollup(table)
+            current = pd.read_csv(self.paths[table], encoding='utf-8-sig')
+            months = current['Date'].astype(str).str.slice(0, 7)
+            valid_month = months.str.fullmatch(r'\d{4}-\d{2}')
+            to_archive = valid_month & (months < before)
+            if not to_archive.any():
+                return 0
+
+            archive_dir = self.archive_dirs[table]
+            archive_dir.mkdir(parents=True, exist_ok=True)
+            for month, rows in current[to_archive].groupby(months[to_archive], sort=True):
+                path = archive_dir / f"{month}.parquet"
+                if path.exists():
+                    rows = pd.concat([pd.read_parquet(path), rows], ignore_index=True)
+                tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+                rows.to_parquet(tmp_path, index=False)
+                os.replace(tmp_path, path)
+
+            self._write_file(self.paths[table], current[~to_archive])
+            state = self._read_rollup_state()
+            if table in state:
+                self._save_rollup_state(state, table, self.paths[table].stat().st_size)
+        _cache_drop((self.key, table))
+        return int(to_archive.sum())
+
+    def _write_file(self, path, df):
+        # الكتابة في ملف مؤقت ثم استبداله حتى لا يقرأ جهاز آخر ملفاً ناقصاً
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        df.to_csv(tmp_path, index=False, encoding='utf-8-sig')
+        count_bytes(tmp_path, written=True)
+        for attempt in range(50):
+            try:
+                os.replace(tmp_path, path)
+                return
+            except PermissionError:
+                # على ويندوز يفشل الاستبدال إذا كان الملف مفتوحاً للقراءة
+                time.sleep(0.01)
+        os.replace(tmp_path, path)
+
+    def _append(self, table, rows_df):
+        path = self.paths[table]
+        write_header = not path.exists() or path.stat().st_size == 0
+        needs_newline = False
+        if not write_header:
+            with open(path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) not in (b'\n', b'\r')
+
+        with open(path, 'a', encoding='utf-8-sig', newline='') as f:
+            start = f.tell()
+            if needs_newline:
+                f.write(os.linesep)
+            rows_df.to_csv(f, index=False, header=write_header)
+            f.flush()
+            if LOG_FSYNC:
+                os.fsync(f.fileno())
+            count_bytes(path, written=True, size=f.tell() - start)
+
+    def _commit_stock(self, stock_changes, log_rows, validate):
+        # ملفات CSV لا تدعم المعاملات: القفل يضمن أن القراءة والتعديل والكتابة
+        # تتم دون تداخل مع جهاز آخر، ثم يُحفظ المخزون أولاً وتُلحق السجلات
+        with self._lock:
+            inventory_df = self.load('inventory')
+            if validate is not None:
+                warnings = validate(inventory_df)
+                if warnings:
+                    return warnings
+            if callable(stock_changes):
+                stock_changes = stock_changes(inventory_df)
+            if not stock_changes.empty:
+                self._write('inventory', apply_stock_changes(inventory_df, stock_changes))
+            for table, rows_df in log_rows.items():
+                self._append(table, rows_df)
+        return []
+
+    def _insert_inventory(self, new_rows, log_rows):
+        # الإضافة تُبنى على المخزون الحالي داخل القفل وليس على نسخة الصفحة
+        with self._lock:
+            inventory_df = self.load('inventory')
+            existing = new_rows['Ingredient'][new_rows['Ingredient'].isin(inventory_df['Ingredient'])]
+            if not existing.empty:
+                return existing.tolist()
+            self._write('inventory', pd.concat([inventory_df, new_rows], ignore_index=True))
+            self._append('inventory_log', log_rows)
+        return []
+
+
+# ========== التخزين في قاعدة بيانات SQLite ==========
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS inventory (
+    Ingredient TEXT PRIMARY KEY,
+    Current_Stock REAL NOT NULL,
+    Unit TEXT
+);
+CREATE TABLE IF NOT EXISTS recipes (
+    Dish_Name TEXT NOT NULL,
+    Ingredient TEXT NOT NULL,
+    Quantity_Needed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_recipes_dish ON recipes (Dish_Name);
+CREATE INDEX IF NOT EXISTS idx_recipes_ingredient ON recipes (Ingredient);
+CREATE TABLE IF NOT EXISTS inventory_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    Date TEXT NOT NULL,
+    Ingredient TEXT NOT NULL,
+    Quantity_Added REAL NOT NULL,
+    Unit TEXT,
+    Notes TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_inventory_log_date ON inventory_log (Date);
+CREATE INDEX IF NOT EXISTS idx_inventory_log_ingredient ON inventory_log (Ingredient);
+CREATE TABLE IF NOT EXISTS sales_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    Date TEXT NOT NULL,
+    Time TEXT,
+    Dish_Name TEXT NOT NULL,
+    Quantity INTEGER NOT NULL,
+    Notes TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_sales_log_date ON sales_log (Date);
+CREATE INDEX IF NOT EXISTS idx_sales_log_dish ON sales_log (Dish_Name);
+CREATE TABLE IF NOT EXISTS consumption_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    Date TEXT NOT NULL,
+    Ingredient TEXT NOT NULL,
+    Quantity_Used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_consumption_log_date ON consumption_log (Date);
+CREATE TABLE IF NOT EXISTS stock_counts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    Date TEXT NOT NULL,
+    Ingredient TEXT NOT NULL,
+    Counted_Stock REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS recipe_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    Valid_From TEXT NOT NULL,
+    Dish_Name TEXT NOT NULL,
+    Ingredient TEXT NOT NULL,
+    Quantity_Needed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_recipe_history_dish ON recipe_history (Dish_Name, Valid_From);
+CREATE TABLE IF NOT EXISTS stock_thresholds (
+    Ingredient TEXT PRIMARY KEY,
+    Min_Stock REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sales_rollup (
+    Date TEXT NOT NULL,
+    Dish_Name TEXT NOT NULL,
+    Quantity REAL NOT NULL,
+    Rows INTEGER NOT NULL,
+    PRIMARY KEY (Date, Dish_Name)
+);
+CREATE TABLE IF NOT EXISTS inventory_log_rollup (
+    Date TEXT NOT NULL,
+    Ingredient TEXT NOT NULL,
+    Quantity_Added REAL NOT NULL,
+    Rows INTEGER NOT NULL,
+    PRIMARY KEY (Date, Ingredient)
+);
+CREATE TABLE IF NOT EXISTS consumption_rollup (
+    Date TEXT NOT NULL,
+    Ingredient TEXT NOT NULL,
+    Quantity_Used REAL NOT NULL,
+    Rows INTEGER NOT NULL,
+    PRIMARY KEY (Date, Ingredient)
+);
+CREATE TABLE IF NOT EXISTS rollup_state (
+    table_name TEXT PRIMARY KEY,
+    last_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS table_versions (
+    table_name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+"""
+
+
+def _sql_rows(df):
+    """تحويل جدول إلى صفوف مناسبة لـ executemany (مع تحويل القيم الفارغة إلى NULL)"""
+    return list(df.astype(object).where(df.notna(), None).itertuples(index=False, name=None))
+
+
+class SqliteStorage(BaseStorage):
+    """تخزين جميع الجداول في قاعدة بيانات SQLite واحدة"""
+
+    def __init__(self, db_path=DB_FILE):
+        self.db_path = Path(db_path)
+        self.key = f"sqlite:{self.db_path}"
+        self._local = threading.local()
+
+        self._connection().executescript(_SQLITE_SCHEMA)
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO table_versions (table_name, version) VALUES (?, 0)",
+                [(table,) for table in TABLE_COLUMNS]
+            )
+
+    def _connection(self):
+        """اتصال مستقل لكل خيط تنفيذ"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={'FULL' if LOG_FSYNC else 'NORMAL'}")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """تنفيذ عدة أوامر كمعاملة واحدة"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _bump(self, conn, *tables):
+        conn.executemany(
+            "UPDATE table_versions SET version = version + 1 WHERE table_name = ?",
+            [(table,) for table in tables]
+        )
+
+    def version(self, table):
+        row = self._connection().execute(
+            "SELECT version FROM table_versions WHERE table_name = ?", (table,)
+        ).fetchone()
+        return row[0]
+
+    def _read(self, table):
+        columns = ', '.join(TABLE_COLUMNS[table])
+        order = 'id' if table.endswith('_log') else 'rowid'
+        return pd.read_sql_query(
+            f"SELECT {columns} FROM {table} ORDER BY {order}", self._connection()
+        )
+
+    def load_range(self, table, start=None, end=None, columns=None):
+        # الفلترة داخل قاعدة البيانات باستخدام فهرس التاريخ
+        columns = columns or TABLE_COLUMNS[table]
+        conditions, params = [], []
+        if start is not None:
+            conditions.append("Date >= ?")
+            params.append(str(start))
+        if end is not None:
+            conditions.append("Date <= ?")
+            params.append(str(end))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return _encode_names(table, pd.read_sql_query(
+            f"SELECT {', '.join(columns)} FROM {table} {where} ORDER BY id",
+            self._connection(), params=params
+        ))
+
+    def _insert_sql(self, table):
+        columns = TABLE_COLUMNS[table]
+        placeholders = ', '.join('?' * len(columns))
+        return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+
+    def _write(self, table, df):
+        with self._transaction() as conn:
+            if table == 'inventory':
+                # تحديث الصفوف المتغيرة فقط بدلاً من إعادة كتابة الجدول
+                conn.executemany(
+                    "INSERT INTO inventory (Ingredient, Current_Stock, Unit) VALUES (?, ?, ?) "
+                    "ON CONFLICT (Ingredient) DO UPDATE SET "
+                    "Current_Stock = excluded.Current_Stock, Unit = excluded.Unit "
+                    "WHERE Current_Stock IS NOT excluded.Current_Stock OR Unit IS NOT excluded.Unit",
+                    _sql_rows(df)
+                )
+                conn.execute("CREATE TEMP TABLE IF NOT EXISTS keep_ingredients (Ingredient TEXT PRIMARY KEY)")
+                conn.execute("DELETE FROM keep_ingredients")
+                conn.executemany(
+                    "INSERT OR IGNORE INTO keep_ingredients VALUES (?)",
+                    [(ingredient,) for ingredient in df['Ingredient']]
+                )
+                conn.execute("DELETE FROM inventory WHERE Ingredient NOT IN (SELECT Ingredient FROM keep_ingredients)")
+            else:
+                conn.execute(f"DELETE FROM {table}")
+                conn.executemany(self._insert_sql(table), _sql_rows(df))
+                if table in ROLLUPS:
+                    conn.execute(f"DELETE FROM {ROLLUPS[table]['name']}")
+                    conn.execute("DELETE FROM rollup_state WHERE table_name = ?", (table,))
+            self._bump(conn, table)
+
+    def _append(self, table, rows_df):
+        with self._transaction() as conn:
+            conn.executemany(self._insert_sql(table), _sql_rows(rows_df))
+            self._bump(conn, table)
+
+    def _refresh_rollup(self, table):
+        # إضافة صفوف السجل التي لم تُجمّع بعد (id أكبر من آخر id تم تجميعه)
+        spec = ROLLUPS[table]
+        keys = ', '.join(spec['keys'])
+        value = spec['value']
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT last_id FROM rollup_state WHERE table_name = ?", (table,)
+            ).fetchone()
+            last_id = row[0] if row else 0
+            max_id = conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+            if max_id > last_id:
+                conn.execute(
+                    f"INSERT INTO {spec['name']} ({keys}, {value}, Rows) "
+                    f"SELECT {keys}, SUM({value}), COUNT(*) FROM {table} "
+                    f"WHERE id > ? AND id <= ? GROUP BY {keys} "
+                    f"ON CONFLICT ({keys}) DO UPDATE SET "
+                    f"{value} = {value} + excluded.{value}, Rows = Rows + excluded.Rows",
+                    (last_id, max_id)
+                )
+                conn.execute(
+                    "INSERT INTO rollup_state (table_name, last_id) VALUES (?, ?) "
+                    "ON CONFLICT (table_name) DO UPDATE SET last_id = excluded.last_id",
+                    (table, max_id)
+                )
+            return pd.read_sql_query(
+                f"SELECT {', '.join(_rollup_columns(table))} FROM {spec['name']} ORDER BY {keys}",
+                conn
+            )
+
+    def _commit_stock(self, stock_changes, log_rows, validate):
+        # BEGIN IMMEDIATE يحجز قفل الكتابة، والتحديث نسبي (Current_Stock + ?)
+        # فلا تضيع خصومات الأجهزة الأخرى
+        with self._transaction() as conn:
+            if validate is not None or callable(stock_changes):
+                inventory_df = pd.read_sql_query(
+                    "SELECT Ingredient, Current_Stock, Unit FROM inventory ORDER BY rowid", conn
+                )
+                if validate is not None:
+                    warnings = validate(inventory_df)
+                    if warnings:
+                        return warnings
+                if callable(stock_changes):
+                    stock_changes = stock_changes(inventory_df)
+            changes = stock_changes.groupby(level=0).sum()
+            conn.executemany(
+                "UPDATE inventory SET Current_Stock = Current_Stock + ? WHERE Ingredient = ?",
+                [(float(change), ingredient) for ingredient, change in changes.items()]
+            )
+            for table, rows_df in log_rows.items():
+                conn.executemany(self._insert_sql(table), _sql_rows(rows_df))
+            self._bump(conn, 'inventory', *log_rows)
+        return []
+
+    def _insert_inventory(self, new_rows, log_rows):
+        with self._transaction() as conn:
+            names = new_rows['Ingredient'].tolist()
+            existing = [
+                row[0] for row in conn.execute(
+                    f"SELECT Ingredient FROM inventory WHERE Ingredient IN ({', '.join('?' * len(names))})", names
+                )
+            ]
+            if existing:
+                return existing
+            conn.executemany(self._insert_sql('inventory'), _sql_rows(new_rows))
+            conn.executemany(self._insert_sql('inventory_log'), _sql_rows(log_rows))
+            self._bump(conn, 'inventory', 'inventory_log')
+        return []
+
+
+def migrate_csv_to_sqlite(base_dir=BASE_DIR, db_path=DB_FILE, overwrite=False):
+    """نقل البيانات من ملفات CSV إلى قاعدة بيانات SQLite (مرة واحدة)"""
+    source = CsvStorage(base_dir)
+    target = SqliteStorage(db_path)
+
+    if not overwrite:
+        for table in TABLE_COLUMNS:
+            if not target._read(table).empty:
+                raise ValueError(f"قاعدة البيانات تحتوي على بيانات بالفعل في الجدول '{table}'")
+
+    counts = {}
+    for table in TABLE_COLUMNS:
+        df = source.load(table)
+        target.save(table, df)
+        counts[table] = len(df)
+    return counts
+
+
+# ========== الكتابة في الخلفية ==========
+
+class WriteBehindStorage(BaseStorage):
+    """تخزين يعيد التحكم للواجهة فوراً ويكتب التغييرات من خيط في الخلفية
+
+    تغييرات المخزون من المبيعات والوارد تُجمع لكل مكون، وصفوف السجلات تُلحق
+    بترتيبها، والحفظ الكامل لجدول يستبدل ما قبله (الأحدث يفوز). كل دفعة تُكتب
+    كعملية واحدة نسبية على المخزون الحالي فلا تضيع تغييرات الأجهزة الأخرى.
+    قراءة المخزون من نفس العملية تشمل التغييرات المعلقة، أما صفوف السجلات
+    والأجهزة الأخرى فتراها بعد الكتابة. flush() حاجز يضمن كتابة كل ما سبقه.
+    """
+
+    def __init__(self, store, interval=WRITE_BEHIND_INTERVAL):
+        self.store = store
+        self.key = f"{store.key}+write-behind"
+        self.interval = interval
+        # القفل يُحرر أثناء الكتابة على القرص، والدفعة الجارية كتابتها تبقى مرئية
+        # للقراءة فوق نسخة المخزون قبلها حتى لا تُحسب مرتين أو تختفي
+        self._cond = threading.Condition(threading.RLock())
+        self._pending = self._empty_batch()
+        self._inflight = None
+        self._inflight_base = {}
+        self._generations = {table: 0 for table in TABLE_COLUMNS}
+        self._queued_seq = 0
+        self._durable_seq = 0
+        self._flush_requested = False
+        self._closed = False
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name='inventory-write-behind', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    @staticmethod
+    def _empty_batch():
+        return {'saves': {}, 'stock_changes': pd.Series(dtype=float), 'logs': {}}
+
+    def version(self, table):
+        # التغييرات المعلقة جزء من النسخة حتى تتحدث القيم المشتقة المخزنة
+        with self._cond:
+            return (self.store.version(table), self._generations[table])
+
+    def load(self, table, copy=True):
+        if table in ROLLUPS:
+            return self.store.load(table, copy)
+        return super().load(table, copy)
+
+    def _read(self, table):
+        with self._cond:
+            if table in self._inflight_base:
+                df = self._inflight_base[table].copy()
+            else:
+                df = self.store.load(table)
+            for batch in (self._inflight, self._pending):
+                if batch is None:
+                    continue
+                if table in batch['saves']:
+                    df = batch['saves'][table].copy()
+                if table == 'inventory' and not batch['stock_changes'].empty:
+                    df = apply_stock_changes(df, batch['stock_changes'])
+            return df
+
+    def load_range(self, table, start=None, end=None, columns=None):
+        return self.store.load_range(table, start, end, columns)
+
+    def _refresh_rollup(self, table):
+        return self.store.load_rollup(table)
+
+    def _enqueued(self, *tables):
+        self._queued_seq += 1
+        for table in tables:
+            if table not in ROLLUPS:
+                self._generations[table] += 1
+        if self._closed:
+            self._write_pending()
+
+    def save(self, table, df):
+        if table in ROLLUPS:
+            # إعادة كتابة سجل كامل نادرة: تُكتب الإضافات المعلقة أولاً ثم يُحفظ مباشرة
+            self.flush()
+            self.store.save(table, df)
+            return
+        with self._cond:
+            self._pending['saves'][table] = df[TABLE_COLUMNS[table]].copy()
+            if table == 'inventory':
+                # الحفظ الكامل يحل محل التغييرات السابقة (محسوبة فيه من القراءة)
+                self._pending['stock_changes'] = pd.Series(dtype=float)
+            self._enqueued(table)
+        _cache_drop((self.key, table))
+
+    def save_recipes(self, recipes_df, valid_from=None):
+        # حفظ الوصفات نادر ويقرأ النسخة الحالية: يُكتب مباشرة بعد المعلقات
+        self.flush()
+        self.store.save_recipes(recipes_df, valid_from)
+        _cache_drop((self.key, 'recipes'))
+        _cache_drop((self.key, 'recipe_history'))
+
+    def add_ingredients(self, new_rows, log_rows):
+        # إضافة مكون نادرة: تُكتب المعلقات أولاً ثم تُضاف مباشرة دون حفظ المخزون كاملاً
+        self.flush()
+        existing = self.store.add_ingredients(new_rows, log_rows)
+        _cache_drop((self.key, 'inventory'))
+        _cache_drop((self.key, 'inventory_log'))
+        return existing
+
+    def append(self, table, rows_df):
+        if not rows_df.empty:
+            with self._cond:
+                self._pending['logs'].setdefault(table, []).append(rows_df[TABLE_COLUMNS[table]])
+                self._enqueued(table)
+
+    def _commit_stock(self, stock_changes, log_rows, validate):
+        with self._cond:
+            if validate is not None:
+                warnings = validate(self.load('inventory'))
+                if warnings:
+                    return warnings
+            if callable(stock_changes):
+                stock_changes = stock_changes(self.load('inventory'))
+            changes = stock_changes.groupby(level=0).sum()
+            self._pending['stock_changes'] = self._pending['stock_changes'].add(changes, fill_value=0)
+            for table, rows_df in log_rows.items():
+                self._pending['logs'].setdefault(table, []).append(rows_df)
+            self._enqueued('inventory', *log_rows)
+        return []
+
+    def _write_pending(self, release=False):
+        """كتابة الدفعة المعلقة (يُستدعى والقفل محجوز)
+
+        الدفعة تنتقل إلى الكتابة الجارية وتبقى مرئية للقراءة، ومع release يُحرر
+        القفل أثناء الكتابة على القرص فلا تنتظرها عمليات البيع والقراءة.
+        """
+        self._cond.wait_for(lambda: self._inflight is None)
+        batch = self._pending
+        target = self._queued_seq
+        self._pending = self._empty_batch()
+        self._flush_requested = False
+        tables = list(batch['saves'])
+        if not batch['stock_changes'].empty:
+            tables.append('inventory')
+            if 'inventory' not in batch['saves']:
+                # التغييرات نسبية: تُطبق على نسخة المخزون قبل الكتابة وليس على الملف أثناءها
+                self._inflight_base = {'inventory': self.store.load('inventory')}
+        self._inflight = batch
+
+        if release:
+            self._cond.release()
+        try:
+            written, error = self._write_batch(batch)
+        finally:
+            if release:
+                self._cond.acquire()
+
+        self._inflight = None
+        self._inflight_base = {}
+        if error is None:
+            self._durable_seq = target
+            self._error = None
+        else:
+            # تعود الدفعة (عدا ما كُتب منها) قبل المعلقات وتُعاد المحاولة في الكتابة التالية
+            for table in written:
+                del batch['saves'][table]
+            self._restore(batch)
+            self._error = error
+        # القيم المشتقة المخزنة أثناء الكتابة تُحسب من جديد من الملفات
+        for table in tables:
+            self._generations[table] += 1
+        self._cond.notify_all()
+
+    def _write_batch(self, batch):
+        """كتابة دفعة على القرص دون القفل، وإرجاع الجداول المحفوظة والخطأ إن وجد"""
+        written = []
+        try:
+            for table, df in batch['saves'].items():
+                self.store.save(table, df)
+                written.append(table)
+            if not batch['stock_changes'].empty or batch['logs']:
+                self.store.commit_batch(batch['stock_changes'], {
+                    table: pd.concat(frames, ignore_index=True) for table, frames in batch['logs'].items()
+                })
+        except Exception as error:
+            return written, error
+        return written, None
+
+    def _restore(self, batch):
+        """إعادة دفعة لم تُكتب إلى مقدمة المعلقات (الحفظ الأحدث يفوز وصفوف السجلات بترتيبها)"""
+        pending = self._pending
+        if 'inventory' in pending['saves']:
+            stock_changes = pending['stock_changes']
+        else:
+            stock_changes = batch['stock_changes'].add(pending['stock_changes'], fill_value=0)
+        logs = {table: list(frames) for table, frames in batch['logs'].items()}
+        for table, frames in pending['logs'].items():
+            logs.setdefault(table, []).extend(frames)
+        self._pending = {
+            'saves': {**batch['saves'], **pending['saves']},
+            'stock_changes': stock_changes,
+            'logs': logs,
+        }
+
+    def _run(self):
+        with self._cond:
+            while not self._closed:
+                self._cond.wait_for(lambda: self._flush_requested or self._closed, timeout=self.interval)
+                self._write_pending(release=True)
+
+    def flush(self):
+        with self._cond:
+            target = self._queued_seq
+            if self._durable_seq >= target:
+                return
+            if self._closed:
+                self._write_pending()
+            else:
+                self._error = None
+                self._flush_requested = True
+                self._cond.notify_all()
+                self._cond.wait_for(lambda: self._durable_seq >= target or self._error is not None)
+            if self._durable_seq < target:
+                raise self._error
+
+    def close(self):
+        """كتابة التغييرات المعلقة وإيقاف الخيط الخلفي (تُستدعى تلقائياً عند إغلاق البرنامج)"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        with self._cond:
+            self._write_pending()
+
+
+# ========== الفروع ==========
+
+def list_branches(branches_dir=BRANCHES_DIR):
+    """أسماء الفروع (المجلدات الموجودة في مجلد الفروع) مرتبة"""
+    branches_dir = Path(branches_dir)
+    if not branches_dir.is_dir():
+        return []
+    return sorted(
+        path.name for path in branches_dir.iterdir()
+        if path.is_dir() and not path.name.startswith('.') and path.name != MAIN_BRANCH_NAME
+    )
+
+
+def branch_dir(branch=None):
+    """مجلد بيانات الفرع (المجلد الرئيسي إذا لم يُحدد فرع)"""
+    if not branch:
+        return BASE_DIR
+    if Path(branch).name != branch or branch.startswith('.'):
+        raise ValueError(f"اسم فرع غير صالح: {branch}")
+    if branch == MAIN_BRANCH_NAME:
+        raise ValueError(f"الاسم {branch} محجوز للفرع الرئيسي")
+    return BRANCHES_DIR / branch
+
+
+def create_branch(branch, source=None, backend=None):
+    """إنشاء مجلد فرع جديد بنفس الوصفات ونسخها والمكونات (بمخزون صفر) من فرع آخر"""
+    path = branch_dir(branch)
+    path.mkdir(parents=True)
+    source_store = open_storage(backend, branch_dir(source))
+    store = open_storage(backend, path)
+    store.save('recipes', source_store.load('recipes'))
+    store.save('recipe_history', source_store.load('recipe_history'))
+    store.save('inventory', source_store.load('inventory').assign(Current_Stock=0))
+    store.save('stock_thresholds', source_store.load('stock_thresholds'))
+    return path
+
+
+# ========== الدوال العامة ==========
+
+_storage = None
+_storage_lock = threading.Lock()
+
+# تخزين كل فرع يُفتح مرة واحدة ويُشارك بين الجلسات، وكل خيط (جلسة) يمكنه
+# اختيار فرعه دون التأثير على الجلسات الأخرى
+_branch_storages = {}
+_thread_storage = threading.local()
+
+
+def open_storage(backend=None, base_dir=BASE_DIR):
+    """فتح تخزين من النوع المطلوب لمجلد بيانات معين"""
+    backend = backend or STORAGE_BACKEND
+    if backend == 'sqlite':
+        return SqliteStorage(Path(base_dir) / DB_FILE.name)
+    return CsvStorage(base_dir)
+
+
+def _open_branch(branch):
+    store = _branch_storages.get(branch)
+    if store is None:
+        store = open_storage(base_dir=branch_dir(branch))
+        if WRITE_BEHIND_INTERVAL > 0:
+            store = WriteBehindStorage(store)
+        _branch_storages[branch] = store
+    return store
+
+
+def open_branch(branch=None):
+    """التخزين الخاص بفرع (بنوع التخزين المحدد في الإعدادات)"""
+    with _storage_lock:
+        return _open_branch(branch)
+
+
+def get_storage():
+    """الحصول على تخزين الفرع المختار في هذا الخيط، أو الفرع الافتراضي"""
+    store = getattr(_thread_storage, 'store', None)
+    if store is not None:
+        return store
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            _storage = _open_branch(DEFAULT_BRANCH)
+        return _storage
+
+
+@contextmanager
+def use_branch(branch):
+    """استخدام تخزين فرع معين داخل الكتلة في هذا الخيط فقط"""
+    previous = getattr(_thread_storage, 'store', None)
+    _thread_storage.store = open_branch(branch)
+    try:
+        yield _thread_storage.store
+    finally:
+        _thread_storage.store = previous
+
+
+def set_storage(storage):
+    """تحديد التخزين الذي تستخدمه الدوال العامة (لأدوات القياس والتشغيل على بيانات أخرى)"""
+    global _storage
+    with _storage_lock:
+        _storage = storage
+
+
+def load_inventory():
+    """تحميل بيانات المخزون"""
+    return get_storage().load('inventory')
+
+
+def load_recipes():
+    """تحميل بيانات الوصفات"""
+    return get_storage().load('recipes')
+
+
+def load_inventory_log(copy=True):
+    """تحميل سجل الوارد"""
+    return get_storage().load('inventory_log', copy)
+
+
+def load_sales_log(copy=True):
+    """تحميل سجل المبيعات"""
+    return get_storage().load('sales_log', copy)
+
+
+def load_log_range(table, start=None, end=None, columns=None):
+    """تحميل صفوف سجل بين تاريخين بالأعمدة المطلوبة فقط"""
+    return get_storage().load_range(table, start, end, columns)
+
+
+def archive_logs(base_dir=BASE_DIR, before=None):
+    """أرشفة الأشهر السابقة من سجلات المبيعات والوارد والاستهلاك (ملفات CSV فقط)"""
+    before = before or pd.Timestamp.today().strftime('%Y-%m')
+    store = CsvStorage(base_dir)
+    return {table: store.archive(table, before) for table in ROLLUPS}
+
+
+def load_sales_rollup():
+    """تحميل ملخص المبيعات (يوم × طبق)"""
+    return get_storage().load_rollup('sales_log')
+
+
+def load_inventory_log_rollup():
+    """تحميل ملخص الوارد (يوم × مكون)"""
+    return get_storage().load_rollup('inventory_log')
+
+
+def load_consumption_rollup():
+    """تحميل ملخص الاستهلاك النظري (يوم × مكون)"""
+    return get_storage().load_rollup('consumption_log')
+
+
+def load_stock_counts():
+    """تحميل سجل الجرد"""
+    return get_storage().load('stock_counts')
+
+
+def load_recipe_history():
+    """تحميل سجل نسخ الوصفات"""
+    return get_storage().load('recipe_history')
+
+
+def load_stock_thresholds():
+    """تحميل حدود التنبيه الخاصة بكل مكون"""
+    return get_storage().load('stock_thresholds')
+
+
+def save_inventory(df):
+    """حفظ بيانات المخزون"""
+    get_storage().save('inventory', df)
+
+
+def save_recipes(df):
+    """حفظ بيانات الوصفات (مع تسجيل نسخة جديدة لكل طبق تغيرت وصفته)"""
+    get_storage().save_recipes(df)
+
+
+def save_inventory_log(df):
+    """حفظ سجل الوارد"""
+    get_storage().save('inventory_log', df)
+
+
+def save_sales_log(df):
+    """حفظ سجل المبيعات"""
+    get_storage().save('sales_log', df)
+
+
+def save_stock_thresholds(df):
+    """حفظ حدود التنبيه الخاصة بكل مكون"""
+    get_storage().save('stock_thresholds', df)
+
+
+def save_consumption_log(df):
+    """حفظ سجل الاستهلاك (عند إعادة بنائه من المبيعات)"""
+    get_storage().save('consumption_log', df)
+
+
+def append_log_rows(table, rows_df):
+    """إلحاق صفوف بسجل دون إعادة كتابته"""
+    get_storage().append(table, rows_df)
+
+
+def commit_sale(ingredients_needed, sales_rows, validate=None, consumption_rows=None):
+    """خصم المكونات وتسجيل المبيعات كعملية واحدة (تعيد تحذيرات التحقق إن وجدت)"""
+    return get_storage().commit_sale(ingredients_needed, sales_rows, validate, consumption_rows)
+
+
+def commit_receipt(ingredients_received, receipt_rows):
+    """إضافة الوارد للمخزون وتسجيله كعملية واحدة"""
+    get_storage().commit_receipt(ingredients_received, receipt_rows)
+
+
+def add_ingredients(new_rows, log_rows):
+    """إضافة مكونات جديدة للمخزون وتسجيلها (تعيد أسماء المكونات الموجودة بالفعل إن وجدت)"""
+    return get_storage().add_ingredients(new_rows, log_rows)
+
+
+def commit_stock_count(count_rows):
+    """تعديل المخزون إلى الكميات المعدودة وتسجيل الجرد كعملية واحدة (تُعاد التغييرات المطبقة)"""
+    return get_storage().commit_stock_count(count_rows)
+
+
+def flush_branches():
+    """حاجز الكتابة لكل الفروع المفتوحة (قبل قراءتها من عمليات أخرى)"""
+    with _storage_lock:
+        stores = list(_branch_storages.values())
+    for store in stores:
+        store.flush()
+
+
+# قياس زمن التحميل والحفظ (عند تفعيل INVENTORY_PROFILE فقط)
+instrument(globals(), 'storage', prefixes=('load_', 'save_', 'commit_', 'append_'))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="أدوات طبقة التخزين")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    migrate_parser = subparsers.add_parser('migrate', help="نقل ملفات CSV إلى SQLite")
+    migrate_parser.add_argument('--db', default=str(DB_FILE), help="مسار قاعدة البيانات")
+    migrate_parser.add_argument('--overwrite', action='store_true', help="استبدال البيانات الموجودة")
+    archive_parser = subparsers.add_parser('archive', help="أرشفة الأشهر السابقة من السجلات بصيغة Parquet")
+    archive_parser.add_argument('--data-dir', default=str(BASE_DIR), help="مجلد البيانات")
+    archive_parser.add_argument('--before', default=None, help="أرشفة الأشهر قبل هذا الشهر YYYY-MM (الافتراضي: الشهر الحالي)")
+    branch_parser = subparsers.add_parser('branch', help="إنشاء مجلد بيانات لفرع جديد")
+    branch_parser.add_argument('name', help="اسم الفرع")
+    branch_parser.add_argument('--source', default=None, help="الفرع الذي تُنسخ منه الوصفات والمكونات (الافتراضي: الرئيسي)")
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        counts = migrate_csv_to_sqlite(BASE_DIR, args.db, overwrite=args.overwrite)
+        for table, count in counts.items():
+            print(f"{table}: {count}")
+    elif args.command == 'archive':
+        counts = archive_logs(Path(args.data_dir), args.before)
+        for table, count in counts.items():
+            print(f"{table}: {count}")
+    elif args.command == 'branch':
+        print(create_branch(args.name, args.source))
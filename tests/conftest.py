@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# الوحدات في جذر المستودع وليست حزمة مثبتة
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
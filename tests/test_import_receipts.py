@@ -0,0 +1,37 @@
+from datetime import datetime
+
+import pandas as pd
+
+from import_receipts import prepare_receipt_rows
+from storage import INVENTORY_COLUMNS
+
+NOW = datetime(2026, 10, 18, 12, 0)
+
+INVENTORY = pd.DataFrame({
+    'Ingredient': ['لحم برجر', 'خبز برجر'],
+    'Current_Stock': [10.0, 20.0],
+    'Unit': ['قطعة', 'رغيف'],
+})
+
+
+def test_empty_inventory_rejects_every_row():
+    chunk = pd.DataFrame({'Ingredient': ['لحم برجر', 'جبن'], 'Quantity': ['5', '2']})
+
+    rows, rejected = prepare_receipt_rows(chunk, pd.DataFrame(columns=INVENTORY_COLUMNS), now=NOW)
+
+    assert rows.empty
+    assert rejected['Reason'].tolist() == ['مكون غير موجود في المخزون'] * 2
+
+
+def test_unknown_ingredient_is_rejected_without_a_unit():
+    chunk = pd.DataFrame({
+        'Ingredient': ['جبن', 'لحم برجر'],
+        'Quantity': ['2', '5'],
+        'Unit': ['رغيف', ''],
+    })
+
+    rows, rejected = prepare_receipt_rows(chunk, INVENTORY, now=NOW)
+
+    assert rows[['Ingredient', 'Quantity_Added', 'Unit']].values.tolist() == [['لحم برجر', 5, 'قطعة']]
+    assert rejected['Ingredient'].tolist() == ['جبن']
+    assert rejected['Reason'].tolist() == ['مكون غير موجود في المخزون']